@@ -0,0 +1,134 @@
+"""Холодный старт подкоманд src/main.py.
+
+Для каждой подкоманды запускается отдельный интерпретатор `main.py --import-only <команда>`
+(разбор аргументов и импорт модулей стадии без работы) и замеряется время до выхода - лучшее
+из --repeat запусков. Для сравнения замеряется полный граф импорта прежнего main.py
+(планировщик, aiohttp, scraper и все модули стадий сразу). По `-X importtime` выводятся
+тяжёлые пакеты, загруженные подкомандой.
+
+Код возврата 1, если подкоманда загрузила тяжёлый пакет, который ей не нужен (например,
+dump - psycopg2 или export - bs4), или, с --budget-ms, холодный старт подкоманды
+(кроме долгоживущего serve) превысил бюджет сверх запуска пустого интерпретатора.
+
+Примеры:
+    python bench/bench_cli.py
+    python bench/bench_cli.py --repeat 10 --commands dump export
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(BENCH_DIR, '..', 'src')
+sys.path.insert(0, SRC_DIR)
+
+from bench_e2e import RESULTS_DIR, git_commit  # noqa: E402
+
+# Подкоманда -> аргументы main.py
+COMMANDS = {
+    'serve': ['serve'],
+    'run': ['run'],
+    'fresh': ['fresh'],
+    'discover': ['discover', '--output', os.devnull],
+    'fetch-details': ['fetch-details', '--input', '-'],
+    'backfill-phones': ['backfill-phones'],
+    'export': ['export'],
+    'dump': ['dump'],
+    'init-db': ['init-db'],
+    'bench': ['bench', 'e2e'],
+}
+# Тяжёлые пакеты и подкоманды, которым они нужны
+HEAVY = {
+    'apscheduler': {'serve'},
+    'bs4': {'serve', 'run', 'fresh', 'discover', 'fetch-details'},
+    'lxml': {'serve', 'run', 'fresh', 'discover', 'fetch-details'},
+    'aiohttp': {'serve', 'run', 'fresh', 'discover', 'fetch-details', 'backfill-phones'},
+    # Загружается при первом обращении к БД, а не при импорте стадии
+    'psycopg2': set(),
+}
+# Что импортировал прежний main.py при любом запуске
+LEGACY_IMPORTS = ('import apscheduler.schedulers.asyncio, aiohttp, psycopg2, concurrent.futures.process, '
+                  'db, scraper, freshness, phones, dump, export, metrics')
+
+def cold_start(argv, repeat):
+    """(лучшее время запуска в мс, {пакет верхнего уровня: собственное время импорта в мс})"""
+    best = None
+    packages = {}
+    for i in range(repeat):
+        # Первый запуск - с -X importtime (он медленнее), остальные - для замера времени
+        importtime = i == 0
+        command = [sys.executable, *(['-X', 'importtime'] if importtime else []), *argv]
+        started = time.perf_counter()
+        result = subprocess.run(command, cwd=SRC_DIR, stdin=subprocess.DEVNULL, capture_output=True, text=True)
+        elapsed = (time.perf_counter() - started) * 1000
+        if result.returncode != 0:
+            raise RuntimeError(f"{' '.join(argv)}: {result.stderr.strip()[-500:]}")
+        if importtime:
+            for line in result.stderr.splitlines():
+                if not line.startswith('import time:') or '|' not in line:
+                    continue
+                self_us, _, name = (part.strip() for part in line[len('import time:'):].split('|'))
+                if self_us.isdigit():
+                    top = name.split('.')[0]
+                    packages[top] = packages.get(top, 0) + int(self_us) / 1000
+        else:
+            best = elapsed if best is None else min(best, elapsed)
+    return round(best, 1), packages
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--commands', nargs='+', choices=list(COMMANDS), default=list(COMMANDS))
+    parser.add_argument('--repeat', type=int, default=5, help='запусков на подкоманду (лучший из них)')
+    parser.add_argument('--budget-ms', type=float,
+                        help='бюджет холодного старта сверх пустого интерпретатора, мс')
+    parser.add_argument('--top', type=int, default=5, help='самых тяжёлых пакетов в отчёте')
+    parser.add_argument('--output', help='путь к JSON с результатами')
+    args = parser.parse_args()
+    repeat = max(2, args.repeat + 1)
+
+    results = {}
+    # Запуск пустого интерпретатора - нижняя граница для любой подкоманды
+    base_ms, _ = cold_start(['-c', 'pass'], repeat)
+    results['(интерпретатор)'] = {'ms': base_ms, 'heavy': []}
+    legacy_ms, legacy_packages = cold_start(['-c', LEGACY_IMPORTS], repeat)
+    results['(прежний main.py)'] = {'ms': legacy_ms, 'heavy': sorted(p for p in HEAVY if p in legacy_packages)}
+    problems = []
+    for name in args.commands:
+        ms, packages = cold_start(['main.py', '--import-only', *COMMANDS[name]], repeat)
+        heavy = sorted(p for p in HEAVY if p in packages)
+        top = sorted(packages.items(), key=lambda item: -item[1])[:args.top]
+        results[name] = {'ms': ms, 'heavy': heavy, 'top': {package: round(t, 1) for package, t in top}}
+        extra = [p for p in heavy if name not in HEAVY[p]]
+        if extra:
+            problems.append(f"{name}: лишние пакеты {', '.join(extra)}")
+        if args.budget_ms is not None and name != 'serve' and ms - base_ms > args.budget_ms:
+            problems.append(f'{name}: {ms - base_ms:.0f} мс сверх интерпретатора при бюджете {args.budget_ms:g} мс')
+
+    print(f"\n{'подкоманда':20}{'мс':>9}{'сверх':>9}  тяжёлые пакеты")
+    for name, r in results.items():
+        print(f"{name:20}{r['ms']:>9}{r['ms'] - base_ms:>9.1f}  {', '.join(r['heavy']) or '-'}")
+
+    report = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'commit': git_commit(),
+        'python': sys.version.split()[0],
+        'results': results,
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f"cli_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f'Результаты сохранены: {output}')
+
+    if problems:
+        print(f"Холодный старт: {'; '.join(problems)}")
+        return 1
+    print('Холодный старт в пределах бюджета')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,87 @@
+"""Сравнение скорости записи в БД: построчный save_to_db против пакетного CarWriter.
+
+Запуск (нужен локальный Postgres с настройками из .env):
+    python bench/bench_db.py --rows 2000
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from db import create_table, pooled_conn, close_pool, CarRecord, CarWriter  # noqa: E402
+from scraper import save_to_db  # noqa: E402
+
+URL_PREFIX = 'bench://'
+# Отрицательные ID объявлений не пересекаются с настоящими
+LISTING_BASE = {'row': -1_000_000, 'batch': -2_000_000}
+
+def make_cars(count, tag):
+    now = datetime.now()
+    return [
+        CarRecord(
+            listing_id=LISTING_BASE[tag] - i,
+            url=f'{URL_PREFIX}{tag}/{i}',
+            title=f'Bench car {i}',
+            price_usd=10000 + i,
+            odometer=1000 * i,
+            username='bench',
+            phone_number=380000000000 + i,
+            images_count=0,
+            datetime_found=now,
+        )
+        for i in range(count)
+    ]
+
+def cleanup():
+    with pooled_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute('DELETE FROM cars WHERE url LIKE %s', (URL_PREFIX + '%',))
+            cur.execute('DELETE FROM car_observations WHERE listing_id < 0')
+        conn.commit()
+
+def bench_per_row(cars):
+    async def run():
+        for car in cars:
+            await save_to_db(car)
+    start = time.perf_counter()
+    asyncio.run(run())
+    return time.perf_counter() - start
+
+def bench_writer(cars, flush_size):
+    async def run():
+        writer = CarWriter(flush_size=flush_size, flush_interval=3600)
+        for car in cars:
+            await writer.add(car)
+        await writer.flush()
+    start = time.perf_counter()
+    asyncio.run(run())
+    return time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=2000)
+    parser.add_argument('--flush-size', type=int, default=500)
+    args = parser.parse_args()
+
+    create_table()
+    cleanup()
+    try:
+        per_row = bench_per_row(make_cars(args.rows, 'row'))
+        batched = bench_writer(make_cars(args.rows, 'batch'), args.flush_size)
+        # Повторная запись тех же объявлений - обновление текущего состояния и строка истории
+        repeated = bench_writer(make_cars(args.rows, 'batch'), args.flush_size)
+    finally:
+        cleanup()
+        close_pool()
+
+    print(f'save_to_db (по строке):   {args.rows / per_row:10.0f} строк/с')
+    print(f'CarWriter (пачки {args.flush_size}): {args.rows / batched:10.0f} строк/с')
+    print(f'CarWriter, повторные:     {args.rows / repeated:10.0f} строк/с')
+    print(f'Ускорение: x{per_row / batched:.1f}')
+
+if __name__ == '__main__':
+    main()
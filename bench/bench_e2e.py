@@ -0,0 +1,234 @@
+"""Сквозной бенчмарк scrape_autoria против локального mock-сервера AutoRia.
+
+Mock-сервер запускается в отдельном процессе, парсер - в текущем. Результаты
+(listings/сек, p50/p99 по стадиям, пиковый RSS, строк/сек в БД) сохраняются в JSON.
+
+Примеры:
+    python bench/bench_e2e.py --pages 20 --no-db
+    python bench/bench_e2e.py --pages 50 --throttle-rate 0.02 --env SCRAPE_MODE=pipeline --env RATE_CONTROL=1
+    python bench/bench_e2e.py --no-db --compare bench/results/e2e_20260101_120000.json
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import resource
+import socket
+import subprocess
+import sys
+import time
+from array import array
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'src'))
+
+from mock_server import MockConfig, add_arguments, make_app  # noqa: E402
+
+RESULTS_DIR = os.path.join(BENCH_DIR, 'results')
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def serve(config, port):
+    from aiohttp import web
+    web.run_app(make_app(config), host='127.0.0.1', port=port, print=None)
+
+def wait_for_port(port, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=0.2):
+                return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f'mock-сервер не запустился на порту {port}')
+
+def percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+def peak_rss_mb():
+    # ru_maxrss в Linux - килобайты; процессы разбора учитываются отдельно
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+    return round(own, 1), round(children, 1)
+
+class StageTimer:
+    """Обёртки над функциями стадий, собирающие длительности вызовов"""
+
+    def __init__(self):
+        self.samples = {}
+
+    def record(self, stage, seconds):
+        self.samples.setdefault(stage, []).append(seconds)
+
+    def wrap_async(self, func, stage_of):
+        async def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                self.record(stage_of(*args), time.perf_counter() - start)
+        return wrapper
+
+    def wrap_sync(self, func, stage):
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.record(stage, time.perf_counter() - start)
+        return wrapper
+
+    def report(self):
+        return {
+            stage: {
+                'count': len(values),
+                'p50_ms': round(percentile(values, 50) * 1000, 2),
+                'p99_ms': round(percentile(values, 99) * 1000, 2),
+                'total_s': round(sum(values), 3),
+            }
+            for stage, values in sorted(self.samples.items())
+        }
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BENCH_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def fetch_stage(session, url, *args):
+    if '?page=' in url:
+        return 'listing_fetch'
+    # JSON объявления (EXTRACT_MODE=json)
+    return 'api_fetch' if '/searchPage/' in url else 'detail_fetch'
+
+def run_scraper(base_url, args):
+    # Настройки парсера читаются из окружения при импорте модулей
+    os.environ.update({
+        'START_URL': f'{base_url}/uk/car/used/',
+        'AUTORIA_BASE_URL': base_url,
+        'MAX_PAGES': str(args.pages + 1),
+        'REQUEST_DELAY': '0',
+        'BATCH_DELAY': '0',
+        'LISTING_DELAY': '0',
+    })
+    for item in args.env:
+        key, _, value = item.partition('=')
+        os.environ[key] = value
+
+    import db
+    import fingerprint
+    import retry
+    import scraper
+
+    timer = StageTimer()
+    rows = {'written': 0}
+    # Уникальные ссылки по стадиям: отложенные повторы вызывают fetch для той же ссылки ещё раз
+    fetched = {}
+    timed_fetch = timer.wrap_async(scraper.fetch, fetch_stage)
+
+    async def counted_fetch(session, url, *args, **kwargs):
+        fetched.setdefault(fetch_stage(session, url), set()).add(url)
+        return await timed_fetch(session, url, *args, **kwargs)
+    scraper.fetch = counted_fetch
+    scraper.parse_html = timer.wrap_async(scraper.parse_html, lambda *a: 'parse')
+    scraper.resolve_phone = timer.wrap_async(scraper.resolve_phone, lambda *a: 'phone_lookup')
+
+    if args.no_db:
+        def write_cars(cars, mark_done=False, unchanged=()):
+            return len(cars), 0, 0
+        retry.load_dead_letters = lambda kind, max_runs, keep_days: []
+        retry.save_dead_letters = lambda rows, resolved: None
+        fingerprint.load_fingerprints = lambda: (array('q'), array('q'), array('q'))
+    else:
+        db.create_table()
+        write_cars = db.write_cars
+
+    def counted_write(cars, mark_done=False, unchanged=()):
+        result = write_cars(cars, mark_done, unchanged)
+        rows['written'] += len(cars)
+        return result
+    db.write_cars = timer.wrap_sync(counted_write, 'db_write')
+
+    start = time.perf_counter()
+    asyncio.run(scraper.scrape_autoria())
+    elapsed = time.perf_counter() - start
+    scraper.shutdown_parse_pool()
+    db.close_pool()
+
+    stages = timer.report()
+    db_seconds = stages.get('db_write', {}).get('total_s') or 0
+    rss, children_rss = peak_rss_mb()
+    # Объявление - одна страница или, в режиме json, один JSON (повторы той же ссылки не считаются)
+    listings = max(len(fetched.get(stage, ())) for stage in ('detail_fetch', 'api_fetch'))
+    return {
+        'elapsed_s': round(elapsed, 3),
+        'listings': listings,
+        'listings_per_s': round(listings / elapsed, 2),
+        'db_rows': rows['written'],
+        'db_rows_per_s': round(rows['written'] / db_seconds, 1) if db_seconds else None,
+        'peak_rss_mb': rss,
+        'peak_rss_children_mb': children_rss,
+        'stages': stages,
+    }
+
+def compare(previous, current):
+    print(f"\nСравнение с {previous.get('commit')} ({previous.get('timestamp')}):")
+    keys = ['listings_per_s', 'db_rows_per_s', 'peak_rss_mb', 'elapsed_s']
+    for key in keys:
+        old, new = previous['results'].get(key), current['results'].get(key)
+        if old and new:
+            print(f'  {key:16} {old:>10} -> {new:>10} ({(new - old) / old * 100:+.1f}%)')
+    for stage, values in current['results']['stages'].items():
+        old = previous['results']['stages'].get(stage)
+        if old:
+            print(f"  {stage + ' p99':16} {old['p99_ms']:>10} -> {values['p99_ms']:>10} мс")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    add_arguments(parser)
+    parser.add_argument('--no-db', action='store_true', help='не писать в Postgres (запись считается мгновенной)')
+    parser.add_argument('--env', action='append', default=[], metavar='KEY=VALUE',
+                        help='настройка парсера из .env, можно повторять')
+    parser.add_argument('--output', help='путь к JSON с результатами')
+    parser.add_argument('--compare', help='JSON предыдущего запуска для сравнения')
+    args = parser.parse_args()
+
+    port = free_port()
+    server = multiprocessing.Process(target=serve, args=(MockConfig.from_args(args), port), daemon=True)
+    server.start()
+    try:
+        wait_for_port(port)
+        results = run_scraper(f'http://127.0.0.1:{port}', args)
+    finally:
+        server.terminate()
+        server.join()
+
+    report = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'commit': git_commit(),
+        'mock': {k: v for k, v in vars(args).items() if k not in ('output', 'compare')},
+        'results': results,
+    }
+    print(json.dumps(results, indent=2, ensure_ascii=False))
+
+    output = args.output or os.path.join(RESULTS_DIR, f"e2e_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f'Результаты сохранены: {output}')
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            compare(json.load(f), report)
+
+if __name__ == '__main__':
+    main()
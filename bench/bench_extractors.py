@@ -0,0 +1,274 @@
+"""Стоимость разбора по экстракторам на корпусе страниц и порог регрессии.
+
+Для каждой страницы корпуса (parse_corpus.py) измеряется скорость (страниц/с) построения
+дерева, каждого safe_parse_*, extract_car_fields и полного пути разбора parse_car_page
+(parse_car_html - то, что выполняется после загрузки страницы), для выдачи - extract_car_links.
+Для полного пути дополнительно снимается пик выделенной памяти (tracemalloc).
+
+Результаты сравниваются с сохранённым базовым замером: код возврата 1, если скорость
+полного пути по корпусу (среднее геометрическое по страницам) упала больше --max-slowdown
+или пик памяти какой-либо страницы вырос больше --max-alloc-growth. Падение скорости
+отдельной страницы или экстрактора выводится как предупреждение: замер одной маленькой
+страницы слишком шумный для порога.
+Скорость сравнивается относительно калибровки (разбор эталонной страницы) непосредственно
+перед замером страницы, чтобы базовый замер с другой машины оставался применим, а колебания
+частоты процессора во время прогона не давали ложных регрессий.
+
+Примеры:
+    python bench/bench_extractors.py
+    python bench/bench_extractors.py --only detail_large --profile
+    python bench/bench_extractors.py --alloc-profile
+    python bench/bench_extractors.py --update-baseline
+"""
+import argparse
+import cProfile
+import gc
+import json
+import math
+import os
+import pstats
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'src'))
+
+from bs4 import BeautifulSoup  # noqa: E402
+import scraper  # noqa: E402
+from extract import extract_car_fields  # noqa: E402
+from bench_e2e import RESULTS_DIR, git_commit  # noqa: E402
+from pages import detail_html  # noqa: E402
+from parse_corpus import load_corpus, page_url  # noqa: E402
+
+BASELINE = os.path.join(BENCH_DIR, 'baselines', 'parse.json')
+
+# Экстракторы страницы авто: (html, url, дерево) -> результат
+DETAIL_EXTRACTORS = {
+    'soup': lambda html, url, soup: BeautifulSoup(html, 'lxml'),
+    'safe_parse_title': lambda html, url, soup: scraper.safe_parse_title(soup),
+    'safe_parse_price': lambda html, url, soup: scraper.safe_parse_price(soup),
+    'safe_parse_odometer': lambda html, url, soup: scraper.safe_parse_odometer(soup),
+    'safe_parse_username': lambda html, url, soup: scraper.safe_parse_username(soup),
+    'safe_parse_images': lambda html, url, soup: scraper.safe_parse_images(soup),
+    'safe_parse_car_details': lambda html, url, soup: scraper.safe_parse_car_details(soup),
+    'extract_car_fields': lambda html, url, soup: extract_car_fields(soup, scraper.parse_odometer),
+    'parse_car_html': lambda html, url, soup: scraper.parse_car_html(html, url),
+}
+LISTING_EXTRACTORS = {
+    'soup': lambda html, url, soup: BeautifulSoup(html, 'lxml'),
+    'extract_car_links': lambda html, url, soup: scraper.extract_car_links(html),
+}
+# Полный путь разбора страницы каждого вида - по нему работает порог регрессии
+FULL_PATH = {'detail': 'parse_car_html', 'listing': 'extract_car_links'}
+
+def per_second(func, min_time, repeat):
+    """Вызовов в секунду: лучший из repeat замеров по min_time секунд (как timeit, без сборщика мусора)"""
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return _per_second(func, min_time, repeat)
+    finally:
+        if gc_enabled:
+            gc.enable()
+        gc.collect()
+
+def _per_second(func, min_time, repeat):
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            break
+        number *= 2 if elapsed <= 0 else max(2, min(10, int(min_time / elapsed) + 1))
+    best = elapsed
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        best = min(best, time.perf_counter() - start)
+    return number / best
+
+def calibrate(min_time, repeat):
+    """Скорость эталонной работы этой машины: построение дерева страницы 50 КБ"""
+    html = detail_html(1, size_kb=50)
+    return per_second(lambda: BeautifulSoup(html, 'lxml'), min_time, repeat)
+
+def alloc_peak_kb(func):
+    """Пик памяти, выделенной за один вызов.
+
+    Сборщик мусора отключён: дерево BeautifulSoup циклическое, и момент сборки
+    иначе случайно меняет пик. Поэтому значение - всё, что вызов выделил и не освободил
+    подсчётом ссылок, и оно воспроизводимо между запусками.
+    """
+    func()  # прогрев: кэши селекторов и регулярных выражений не относятся к странице
+    gc.collect()
+    gc.disable()
+    tracemalloc.start()
+    try:
+        base = tracemalloc.get_traced_memory()[0]
+        func()
+        return round((tracemalloc.get_traced_memory()[1] - base) / 1024, 1)
+    finally:
+        tracemalloc.stop()
+        gc.enable()
+        gc.collect()
+
+def measure(pages, args):
+    results = {}
+    for entry, html in pages:
+        url = page_url(entry)
+        soup = BeautifulSoup(html, 'lxml')
+        extractors = DETAIL_EXTRACTORS if entry['kind'] == 'detail' else LISTING_EXTRACTORS
+        calibration = calibrate(args.min_time, args.repeat)
+        speeds = {
+            name: round(per_second(lambda: extractor(html, url, soup), args.min_time, args.repeat), 1)
+            for name, extractor in extractors.items()
+        }
+        full = FULL_PATH[entry['kind']]
+        results[entry['name']] = {
+            'kind': entry['kind'],
+            'size_kb': round(len(html) / 1024, 1),
+            'pages_per_s': speeds[full],
+            'alloc_peak_kb': alloc_peak_kb(lambda: extractors[full](html, url, soup)),
+            'calibration': round(calibration, 1),
+            # Скорость относительно эталона: по ней работает порог регрессии
+            'relative': {name: round(speed / calibration, 4) for name, speed in speeds.items()},
+            'extractors': speeds,
+        }
+        print(f"{entry['name']:24} {results[entry['name']]['size_kb']:8.1f} КБ "
+              f"{speeds[full]:10.1f} стр/с {results[entry['name']]['alloc_peak_kb']:10.1f} КБ памяти")
+    return results
+
+def run_full_path(pages):
+    for entry, html in pages:
+        url = page_url(entry)
+        if entry['kind'] == 'detail':
+            scraper.parse_car_html(html, url)
+        else:
+            scraper.extract_car_links(html)
+
+def profile(pages, args):
+    profiler = cProfile.Profile()
+    profiler.enable()
+    for _ in range(args.profile_rounds):
+        run_full_path(pages)
+    profiler.disable()
+    if args.profile_output:
+        profiler.dump_stats(args.profile_output)
+        print(f'Профиль сохранён: {args.profile_output}')
+    pstats.Stats(profiler).sort_stats('cumulative').print_stats(args.profile_top)
+
+def alloc_profile(pages, args):
+    run_full_path(pages)
+    gc.collect()
+    # Как в alloc_peak_kb: без сборщика мусора снимок содержит всё выделенное за проход
+    gc.disable()
+    tracemalloc.start(10)
+    try:
+        run_full_path(pages)
+        snapshot = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+        gc.enable()
+    print(f'\nВыделения памяти полного пути разбора (топ {args.profile_top} строк):')
+    for stat in snapshot.statistics('lineno')[:args.profile_top]:
+        print(f'  {stat}')
+
+def compare(baseline, current, args):
+    """Сравнение с базовым замером, возвращает список регрессий"""
+    if baseline['corpus_version'] != current['corpus_version']:
+        print(f"Базовый замер снят на корпусе версии {baseline['corpus_version']}, текущая версия "
+              f"{current['corpus_version']} - обновите его: --update-baseline")
+        return ['corpus_version']
+    print(f"\nСравнение с базовым замером {baseline['commit']} ({baseline['timestamp']})")
+    regressions = []
+    ratios = []
+    for name, page in current['pages'].items():
+        old = baseline['pages'].get(name)
+        if old is None:
+            continue
+        relative, old_relative = page['relative'], old['relative']
+        full = FULL_PATH[page['kind']]
+        speed = relative[full] / old_relative[full] - 1
+        ratios.append(speed + 1)
+        alloc = page['alloc_peak_kb'] / old['alloc_peak_kb'] - 1 if old['alloc_peak_kb'] else 0.0
+        flags = []
+        # Мелкие страницы выделяют единицы КБ - небольшие колебания там не регрессия
+        if alloc > args.max_alloc_growth and page['alloc_peak_kb'] - old['alloc_peak_kb'] > 16:
+            flags.append('ПАМЯТЬ')
+        slower = [
+            extractor for extractor, value in relative.items()
+            if extractor in old_relative and value < old_relative[extractor] * (1 - args.max_slowdown)
+        ]
+        print(f"  {name:24} скорость {speed:+7.1%}  память {alloc:+7.1%}  {' '.join(flags)}"
+              + (f"  (медленнее: {', '.join(slower)})" if slower else ''))
+        regressions += [f'{name}: {flag}' for flag in flags]
+    if ratios:
+        overall = math.exp(sum(map(math.log, ratios)) / len(ratios)) - 1
+        print(f'  {"корпус (ср. геом.)":24} скорость {overall:+7.1%}')
+        if overall < -args.max_slowdown:
+            regressions.append(f'корпус: СКОРОСТЬ {overall:+.1%}')
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--only', nargs='+', help='имена страниц корпуса')
+    parser.add_argument('--min-time', type=float, default=0.05, help='минимальная длительность замера, сек')
+    parser.add_argument('--repeat', type=int, default=3, help='замеров, из которых берётся лучший')
+    parser.add_argument('--baseline', default=BASELINE, help='JSON базового замера')
+    parser.add_argument('--update-baseline', action='store_true', help='сохранить замер как базовый')
+    parser.add_argument('--max-slowdown', type=float, default=0.2, help='допустимое падение скорости (доля)')
+    parser.add_argument('--max-alloc-growth', type=float, default=0.1, help='допустимый рост пика памяти (доля)')
+    parser.add_argument('--profile', action='store_true', help='cProfile полного пути разбора')
+    parser.add_argument('--profile-rounds', type=int, default=5, help='проходов по корпусу под профайлером')
+    parser.add_argument('--profile-top', type=int, default=25, help='строк в отчёте профайлера')
+    parser.add_argument('--profile-output', help='файл .prof для snakeviz/pstats')
+    parser.add_argument('--alloc-profile', action='store_true', help='места выделения памяти (tracemalloc)')
+    parser.add_argument('--output', help='путь к JSON с результатами')
+    args = parser.parse_args()
+    if args.only and args.update_baseline:
+        parser.error('базовый замер снимается по всему корпусу, без --only')
+
+    version, pages = load_corpus()
+    if args.only:
+        pages = [(entry, html) for entry, html in pages if entry['name'] in args.only]
+
+    if args.profile or args.alloc_profile:
+        if args.profile:
+            profile(pages, args)
+        if args.alloc_profile:
+            alloc_profile(pages, args)
+        return 0
+
+    print(f'Корпус версии {version}: {len(pages)} страниц')
+    report = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'commit': git_commit(),
+        'corpus_version': version,
+        'pages': measure(pages, args),
+    }
+
+    output = args.update_baseline and args.baseline or args.output or os.path.join(
+        RESULTS_DIR, f"parse_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+        f.write('\n')
+    print(f'Результаты сохранены: {output}')
+
+    if args.update_baseline or not os.path.exists(args.baseline):
+        return 0
+    with open(args.baseline, encoding='utf-8') as f:
+        regressions = compare(json.load(f), report, args)
+    if regressions:
+        print(f"Регрессия разбора: {', '.join(regressions)}")
+        return 1
+    print('Регрессий нет')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
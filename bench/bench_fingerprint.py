@@ -0,0 +1,186 @@
+"""Повторный обход почти неизменившейся выдачи: с отпечатками содержимого и без.
+
+Mock-сервер отдаёт выдачу ревизии 0 - первый обход записывает объявления вместе
+с отпечатками. На ревизии 1 у доли --change-rate объявлений меняется цена, у доли
+--churn-rate - только разметка; повторный обход выполняется без отпечатков и с ними,
+перед каждым база возвращается к ревизии 0 повторным первым обходом. Сравниваются
+CPU процесса, разборы страниц, запросы телефонов и запись в БД: строки upsert
+(каждая добавляет и строку истории car_observations), обновления last_seen и время db_write.
+
+Без --db база заменяется словарём отпечатков в памяти (как --no-db в bench_e2e.py).
+
+Примеры:
+    python bench/bench_fingerprint.py --pages 10
+    python bench/bench_fingerprint.py --pages 10 --change-rate 0.1 --churn-rate 0.2 --env SCRAPE_MODE=pipeline
+    python bench/bench_fingerprint.py --db --pages 10
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import sys
+import time
+import urllib.request
+from array import array
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'src'))
+
+from bench_e2e import RESULTS_DIR, free_port, git_commit, serve, wait_for_port  # noqa: E402
+from mock_server import MockConfig, add_arguments  # noqa: E402
+
+def mock_get(base_url, path):
+    with urllib.request.urlopen(f'{base_url}{path}') as response:
+        return json.load(response)
+
+class MemoryStore:
+    """Таблица cars для прогона без Postgres: listing_id -> (content_hash, fields_hash)"""
+
+    def __init__(self):
+        self.rows = {}
+
+    def write_cars(self, cars, mark_done=False, unchanged=()):
+        inserted = 0
+        for car in cars:
+            inserted += car.listing_id not in self.rows
+            self.rows[car.listing_id] = (car.content_hash, car.fields_hash)
+        for item in unchanged:
+            if item.content_hash is not None:
+                self.rows[item.listing_id] = (item.content_hash, self.rows[item.listing_id][1])
+        return inserted, len(cars) - inserted, 0
+
+    def load_fingerprints(self):
+        ids, content, fields = array('q'), array('q'), array('q')
+        for car_id in sorted(self.rows):
+            content_hash, fields_hash = self.rows[car_id]
+            ids.append(car_id)
+            content.append(content_hash or 0)
+            fields.append(fields_hash or 0)
+        return ids, content, fields
+
+async def crawl(scraper, phones, base_url, counters, revision, fingerprint):
+    mock_get(base_url, f'/_revision?value={revision}')
+    scraper.FINGERPRINT = fingerprint
+    # Каждый обход начинается с пустым кэшем телефонов, как отдельный запуск
+    phones.seller_phones.clear()
+    for key in counters:
+        counters[key] = 0
+    before = mock_get(base_url, '/_stats')
+    cpu, wall = time.process_time(), time.perf_counter()
+    await scraper.scrape_autoria()
+    cpu, wall = time.process_time() - cpu, time.perf_counter() - wall
+    after = mock_get(base_url, '/_stats')
+    return {
+        'cpu_s': round(cpu, 3),
+        'wall_s': round(wall, 3),
+        'detail_requests': after['detail'] + after['search'] - before['detail'] - before['search'],
+        'parses': counters['parses'],
+        'phone_requests': after['phones'] - before['phones'],
+        'upserts': counters['upserts'],
+        'touched': counters['touched'],
+        'db_write_s': round(counters['db_write_s'], 3),
+    }
+
+async def run(base_url, args):
+    # Настройки парсера читаются из окружения при импорте модулей
+    os.environ.update({
+        'START_URL': f'{base_url}/uk/car/used/',
+        'AUTORIA_BASE_URL': base_url,
+        'MAX_PAGES': str(args.pages + 1),
+        'REQUEST_DELAY': '0',
+        'BATCH_DELAY': '0',
+        'LISTING_DELAY': '0',
+        'PARSE_PROCESSES': '0',
+        'PHONE_MODE': 'inline',
+        'HTTP_CACHE_DIR': '',
+    })
+    for item in args.env:
+        key, _, value = item.partition('=')
+        os.environ[key] = value
+
+    import db
+    import fingerprint
+    import phones
+    import retry
+    import scraper
+
+    counters = {'parses': 0, 'upserts': 0, 'touched': 0, 'db_write_s': 0.0}
+    parse_html = scraper.parse_html
+
+    async def counted_parse(html, url):
+        counters['parses'] += 1
+        return await parse_html(html, url)
+    scraper.parse_html = counted_parse
+
+    store = None
+    if args.db:
+        db.create_table()
+        write_cars = db.write_cars
+    else:
+        store = MemoryStore()
+        write_cars = store.write_cars
+        fingerprint.load_fingerprints = store.load_fingerprints
+        retry.load_dead_letters = lambda kind, max_runs, keep_days: []
+        retry.save_dead_letters = lambda rows, resolved: None
+
+    def counted_write(cars, mark_done=False, unchanged=()):
+        start = time.perf_counter()
+        try:
+            return write_cars(cars, mark_done, unchanged)
+        finally:
+            counters['db_write_s'] += time.perf_counter() - start
+            counters['upserts'] += len(cars)
+            counters['touched'] += len(unchanged)
+    db.write_cars = counted_write
+
+    results = {}
+    for name, fingerprint_on in (('without', False), ('with', True)):
+        # Состояние ревизии 0 с отпечатками
+        if store is not None:
+            store.rows.clear()
+        await crawl(scraper, phones, base_url, counters, 0, True)
+        results[name] = await crawl(scraper, phones, base_url, counters, 1, fingerprint_on)
+    db.close_pool()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    add_arguments(parser)
+    parser.add_argument('--db', action='store_true', help='писать в Postgres из .env (по умолчанию - словарь в памяти)')
+    parser.add_argument('--env', action='append', default=[], metavar='KEY=VALUE',
+                        help='настройка парсера из .env, можно повторять')
+    parser.add_argument('--output', help='путь к JSON с результатами')
+    parser.set_defaults(pages=10, latency_ms=1.0, latency_p99_ms=5.0, change_rate=0.05, churn_rate=0.1)
+    args = parser.parse_args()
+
+    port = free_port()
+    server = multiprocessing.Process(target=serve, args=(MockConfig.from_args(args), port), daemon=True)
+    server.start()
+    try:
+        wait_for_port(port)
+        results = asyncio.run(run(f'http://127.0.0.1:{port}', args))
+    finally:
+        server.terminate()
+        server.join()
+
+    print(f"\nПовторный обход (изменена цена: {args.change_rate:.0%}, только разметка: {args.churn_rate:.0%}):")
+    print(f"{'':22}{'без отпечатков':>16}{'с отпечатками':>16}")
+    for key in results['without']:
+        print(f"  {key:20}{results['without'][key]:>16}{results['with'][key]:>16}")
+
+    report = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'commit': git_commit(),
+        'mock': {k: v for k, v in vars(args).items() if k != 'output'},
+        'results': results,
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f"fingerprint_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f'Результаты сохранены: {output}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+"""Извлечение полей объявления: JSON searchPage/v2 против разбора HTML страницы.
+
+Оба пути проходят одни и те же объявления локального mock-сервера через
+scraper.parse_car_page (EXTRACT_MODE=html и EXTRACT_MODE=json, телефоны inline).
+Для каждого пути считаются запросы и байты на объявление (по счётчикам mock-сервера
+и транспорта), процессорное и общее время; затем по каждому полю - доля
+объявлений, у которых значения обоих путей совпадают.
+
+Примеры:
+    python bench/bench_json.py --pages 5
+    python bench/bench_json.py --pages 5 --json-missing-rate 0.1 --size-kb 200
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import sys
+import time
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'src'))
+
+from bench_e2e import RESULTS_DIR, free_port, git_commit, serve, wait_for_port  # noqa: E402
+from mock_server import MockConfig, add_arguments  # noqa: E402
+from pages import listing_id  # noqa: E402
+
+# Поля CarRecord, которые сравниваются между путями (datetime_found у путей разное)
+FIELDS = ('listing_id', 'title', 'price_usd', 'odometer', 'username', 'phone_number',
+          'image_url', 'images_count', 'car_number', 'car_vin')
+
+async def mock_stats(session, base_url):
+    return json.loads((await session.get(f'{base_url}/_stats')).body)
+
+async def run_mode(scraper, base_url, urls, mode, concurrency):
+    import transport
+
+    scraper.EXTRACT_MODE = mode
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async with scraper.make_session() as session:
+        async def one(url):
+            async with semaphore:
+                return await scraper.parse_car_page(session, url)
+
+        before = await mock_stats(session, base_url)
+        received = transport.stats['bytes']
+        cpu, wall = time.process_time(), time.perf_counter()
+        cars = await asyncio.gather(*(one(url) for url in urls))
+        cpu, wall = time.process_time() - cpu, time.perf_counter() - wall
+        total_bytes = transport.stats['bytes'] - received
+        after = await mock_stats(session, base_url)
+
+    requests = {key: after[key] - before[key] for key in ('detail', 'search', 'phones')}
+    count = len(urls)
+    result = {
+        'listings': sum(car is not None for car in cars),
+        'requests': requests,
+        'requests_per_listing': round(sum(requests.values()) / count, 2),
+        'kb_per_listing': round(total_bytes / 1024 / count, 1),
+        'cpu_ms_per_listing': round(cpu * 1000 / count, 2),
+        'wall_s': round(wall, 3),
+    }
+    return result, {url: car for url, car in zip(urls, cars)}
+
+def field_match(html_cars, json_cars):
+    matches = {field: 0 for field in FIELDS}
+    compared = 0
+    for url, html_car in html_cars.items():
+        json_car = json_cars.get(url)
+        if html_car is None or json_car is None:
+            continue
+        compared += 1
+        for field in FIELDS:
+            if getattr(html_car, field) == getattr(json_car, field):
+                matches[field] += 1
+    return compared, {field: round(n / compared, 4) if compared else None for field, n in matches.items()}
+
+async def run(base_url, args):
+    # Настройки парсера читаются из окружения при импорте модулей
+    os.environ.update({
+        'AUTORIA_BASE_URL': base_url,
+        'PHONE_MODE': 'inline',
+        'HTTP_CACHE_DIR': '',
+        'PARSE_PROCESSES': '0',
+        'REQUEST_DELAY': '0',
+    })
+    import scraper
+
+    urls = [f'{base_url}/uk/auto_volkswagen_passat_{listing_id(page, n)}.html'
+            for page in range(1, args.pages + 1) for n in range(args.per_page)]
+    html_result, html_cars = await run_mode(scraper, base_url, urls, 'html', args.concurrency)
+    json_result, json_cars = await run_mode(scraper, base_url, urls, 'json', args.concurrency)
+    compared, match = field_match(html_cars, json_cars)
+    return {'html': html_result, 'json': json_result, 'compared': compared, 'field_match': match}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    add_arguments(parser)
+    parser.add_argument('--concurrency', type=int, default=10, help='одновременных объявлений')
+    parser.add_argument('--output', help='путь к JSON с результатами')
+    parser.set_defaults(pages=5, latency_ms=1.0, latency_p99_ms=5.0)
+    args = parser.parse_args()
+
+    port = free_port()
+    server = multiprocessing.Process(target=serve, args=(MockConfig.from_args(args), port), daemon=True)
+    server.start()
+    try:
+        wait_for_port(port)
+        results = asyncio.run(run(f'http://127.0.0.1:{port}', args))
+    finally:
+        server.terminate()
+        server.join()
+
+    for mode in ('html', 'json'):
+        r = results[mode]
+        print(f"{mode:5}: {r['listings']} авто, запросов на объявление {r['requests_per_listing']}, "
+              f"{r['kb_per_listing']} КБ, CPU {r['cpu_ms_per_listing']} мс, {r['wall_s']} с")
+    print(f"Совпадение полей ({results['compared']} объявлений):")
+    for field, share in results['field_match'].items():
+        print(f'  {field:14} {share:.1%}' if share is not None else f'  {field:14} -')
+
+    report = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'commit': git_commit(),
+        'mock': {k: v for k, v in vars(args).items() if k != 'output'},
+        'results': results,
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f"json_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f'Результаты сохранены: {output}')
+
+if __name__ == '__main__':
+    main()
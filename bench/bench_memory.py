@@ -0,0 +1,93 @@
+"""Память обхода от числа объявлений: пиковый RSS должен оставаться ровным.
+
+Для каждого размера выдачи bench_e2e.py запускается в отдельном процессе (пиковый RSS
+процесса не сбрасывается), из его результатов берётся peak_rss_mb. Прирост памяти
+на объявление между самым маленьким и самым большим прогоном показывает, растёт ли
+потребление вместе с числом объявлений.
+
+Примеры:
+    python bench/bench_memory.py --sizes 10 50 200
+    python bench/bench_memory.py --sizes 20 100 --env SCRAPE_MODE=pipeline
+    python bench/bench_memory.py --db --sizes 10 50
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'src'))
+
+from bench_e2e import RESULTS_DIR, git_commit  # noqa: E402
+
+BENCH_E2E = os.path.join(BENCH_DIR, 'bench_e2e.py')
+
+def run_size(pages, args):
+    with tempfile.TemporaryDirectory() as tmp:
+        output = os.path.join(tmp, 'e2e.json')
+        cmd = [
+            sys.executable, BENCH_E2E,
+            '--pages', str(pages), '--per-page', str(args.per_page),
+            '--size-kb', str(args.size_kb),
+            '--latency-ms', str(args.latency_ms), '--latency-p99-ms', str(args.latency_p99_ms),
+            '--output', output,
+        ]
+        if not args.db:
+            cmd.append('--no-db')
+        for item in args.env:
+            cmd += ['--env', item]
+        subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL)
+        with open(output, encoding='utf-8') as f:
+            results = json.load(f)['results']
+    return {
+        'pages': pages,
+        'listings': results['listings'],
+        'peak_rss_mb': results['peak_rss_mb'],
+        'elapsed_s': results['elapsed_s'],
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 50, 200], help='страниц выдачи в прогонах')
+    parser.add_argument('--per-page', type=int, default=20, help='объявлений на странице')
+    parser.add_argument('--size-kb', type=int, default=100, help='размер страницы авто')
+    parser.add_argument('--latency-ms', type=float, default=1.0)
+    parser.add_argument('--latency-p99-ms', type=float, default=5.0)
+    parser.add_argument('--db', action='store_true', help='писать в Postgres (по умолчанию --no-db)')
+    parser.add_argument('--env', action='append', default=[], metavar='KEY=VALUE',
+                        help='настройка парсера из .env, можно повторять')
+    parser.add_argument('--output', help='путь к JSON с результатами')
+    args = parser.parse_args()
+
+    runs = []
+    for pages in sorted(args.sizes):
+        result = run_size(pages, args)
+        runs.append(result)
+        print(f"страниц {pages:4}: {result['listings']:6} авто, пиковый RSS {result['peak_rss_mb']:7.1f} МБ, "
+              f"{result['elapsed_s']:.1f} с")
+
+    first, last = runs[0], runs[-1]
+    growth = None
+    if last['listings'] > first['listings']:
+        growth = round((last['peak_rss_mb'] - first['peak_rss_mb']) * 1024 / (last['listings'] - first['listings']), 2)
+        print(f'Прирост памяти: {growth} КБ на объявление '
+              f"({first['listings']} -> {last['listings']} авто)")
+
+    report = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'commit': git_commit(),
+        'params': {k: v for k, v in vars(args).items() if k != 'output'},
+        'runs': runs,
+        'kb_per_listing': growth,
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f"memory_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f'Результаты сохранены: {output}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+"""Пропускная способность разбора страниц авто в зависимости от числа процессов.
+
+Запуск:
+    python bench/bench_parse.py --pages 400 --size-kb 150 --processes 0 1 2 4
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import scraper  # noqa: E402
+from pages import detail_html  # noqa: E402
+
+async def parse_all(pages, concurrency):
+    queue = asyncio.Queue()
+    for item in pages:
+        queue.put_nowait(item)
+
+    async def worker():
+        while not queue.empty():
+            url, html = queue.get_nowait()
+            await scraper.parse_html(html, url)
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+def run(pages, processes):
+    scraper.PARSE_PROCESSES = processes
+    scraper.shutdown_parse_pool()
+    # Прогрев пула процессов, чтобы не учитывать время их запуска
+    asyncio.run(parse_all(pages[:max(processes, 1)], max(processes, 1)))
+    start = time.perf_counter()
+    asyncio.run(parse_all(pages, max(processes, 1) * 2))
+    elapsed = time.perf_counter() - start
+    scraper.shutdown_parse_pool()
+    return len(pages) / elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--pages', type=int, default=400)
+    parser.add_argument('--size-kb', type=int, default=150)
+    parser.add_argument('--processes', type=int, nargs='+', default=[0, 1, 2, 4])
+    args = parser.parse_args()
+
+    pages = [
+        (f'https://auto.ria.com/uk/auto_volkswagen_passat_{i}.html', detail_html(i, args.size_kb))
+        for i in range(args.pages)
+    ]
+    print(f'CPU: {os.cpu_count()}, страниц: {args.pages}, размер: ~{args.size_kb} КБ')
+    for processes in args.processes:
+        label = 'event loop' if processes == 0 else f'{processes} процесс(ов)'
+        print(f'{label:>16}: {run(pages, processes):8.1f} страниц/с')
+
+if __name__ == '__main__':
+    main()
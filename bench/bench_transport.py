@@ -0,0 +1,199 @@
+"""HTTP-транспорты парсера на локальных серверах HTTP/1.1 и HTTP/2.
+
+Сравниваются прежний путь запроса (TCPConnector с limit_per_host=5, ClientTimeout на каждый
+вызов, resp.text()), транспорт aiohttp с пулом по лимитам одновременных запросов и транспорт
+http2 (httpx, один мультиплексированный поток соединения). Нагрузка как у парсера: страницы
+авто под семафором MAX_CONCURRENT_REQUESTS и телефоны под отдельным семафором PHONE_WORKERS.
+Каждый вариант прогоняется без сжатия и со сжатием ответов (gzip или br по Accept-Encoding).
+
+Отчёт: запросов/с, p50/p99 задержки страницы (от получения слота семафора - ожидание
+соединения в пуле входит), CPU клиента на запрос, КБ на запрос по данным сервера
+и число открытых соединений.
+
+Примеры:
+    python bench/bench_transport.py
+    python bench/bench_transport.py --requests 1000 --concurrency 50 --latency-ms 80 --size-kb 150
+    python bench/bench_transport.py --variants aiohttp http2 --compression on
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import sys
+import time
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'src'))
+
+from bench_e2e import RESULTS_DIR, free_port, git_commit, percentile, serve, wait_for_port  # noqa: E402
+from h2_server import serve_h2  # noqa: E402
+from mock_server import MockConfig, add_arguments  # noqa: E402
+from pages import listing_id  # noqa: E402
+
+# Вариант -> сервер, на котором он проверяется
+VARIANTS = {'legacy': 'http1', 'aiohttp': 'http1', 'http2': 'http2'}
+
+class LegacyClient:
+    """Путь запроса до транспортов: как fetch/_call_phone_api и make_session прежде"""
+
+    def __init__(self, limit, headers):
+        import aiohttp
+
+        self.aiohttp = aiohttp
+        self.headers = headers
+        connector = aiohttp.TCPConnector(
+            limit=limit,
+            limit_per_host=5,
+            ttl_dns_cache=300,
+            use_dns_cache=True,
+            keepalive_timeout=30,
+            enable_cleanup_closed=True
+        )
+        self.session = aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=60, connect=10),
+                                             headers=headers)
+
+    async def page(self, url):
+        timeout = self.aiohttp.ClientTimeout(total=30, connect=10)
+        async with self.session.get(url, headers=self.headers, timeout=timeout) as resp:
+            return await resp.text() if resp.status == 200 else None
+
+    async def phone(self, url):
+        timeout = self.aiohttp.ClientTimeout(total=15)
+        async with self.session.get(url, timeout=timeout) as resp:
+            return await resp.json() if resp.status == 200 else None
+
+    async def close(self):
+        await self.session.close()
+
+class TransportClient:
+    """Тот же путь через transport.make_transport, как fetch и _call_phone_api сейчас"""
+
+    def __init__(self, name, limit, headers):
+        import transport
+
+        self.transport = transport
+        self.client = transport.make_transport(limit, headers, name)
+
+    async def page(self, url):
+        resp = await self.client.get(url, timeout=self.transport.PAGE_TIMEOUT)
+        return resp.text() if resp.status == 200 else None
+
+    async def phone(self, url):
+        resp = await self.client.get(url, timeout=self.transport.API_TIMEOUT)
+        return json.loads(resp.body) if resp.status == 200 else None
+
+    async def close(self):
+        await self.client.close()
+
+async def control(client, base_url, path):
+    return json.loads((await client.get(f'{base_url}{path}')).body)
+
+async def run_variant(variant, base_url, compression, args):
+    import transport
+    from transport import HEADERS
+
+    # Служебный клиент держит одно соединение весь прогон - в счётчик соединений варианта не входит
+    admin = transport.make_transport(1, {}, 'aiohttp' if VARIANTS[variant] == 'http1' else 'http2')
+    await control(admin, base_url, f"/_compress?value={int(compression == 'on')}")
+
+    if variant == 'legacy':
+        client = LegacyClient(args.concurrency, HEADERS)
+    else:
+        client = TransportClient(variant, args.concurrency + args.phone_workers, HEADERS)
+    pages = asyncio.Semaphore(args.concurrency)
+    phones = asyncio.Semaphore(args.phone_workers)
+    latencies = []
+    failed = 0
+
+    async def one(i):
+        nonlocal failed
+        car_id = listing_id(i // args.per_page + 1, i % args.per_page)
+        async with pages:
+            started = time.perf_counter()
+            html = await client.page(f'{base_url}/uk/auto_volkswagen_passat_{car_id}.html')
+            latencies.append(time.perf_counter() - started)
+        async with phones:
+            phone = await client.phone(f'{base_url}/users/phones/{car_id}?all')
+        failed += html is None or phone is None
+
+    before = await control(admin, base_url, '/_stats')
+    cpu, wall = time.process_time(), time.perf_counter()
+    try:
+        await asyncio.gather(*(one(i) for i in range(args.requests)))
+    finally:
+        await client.close()
+    cpu, wall = time.process_time() - cpu, time.perf_counter() - wall
+    after = await control(admin, base_url, '/_stats')
+    await admin.close()
+    requests = args.requests * 2
+    return {
+        'requests_per_s': round(requests / wall, 1),
+        'page_p50_ms': round(percentile(latencies, 50) * 1000, 1),
+        'page_p99_ms': round(percentile(latencies, 99) * 1000, 1),
+        'cpu_ms_per_request': round(cpu * 1000 / requests, 3),
+        'kb_per_request': round((after['bytes_sent'] - before['bytes_sent']) / 1024 / requests, 1),
+        'connections': after['connections'] - before['connections'],
+        'failed': failed,
+        'wall_s': round(wall, 3),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    add_arguments(parser)
+    parser.add_argument('--requests', type=int, default=400, help='страниц авто (и столько же запросов телефона)')
+    parser.add_argument('--concurrency', type=int, default=20, help='MAX_CONCURRENT_REQUESTS')
+    parser.add_argument('--phone-workers', type=int, default=5, help='PHONE_WORKERS')
+    parser.add_argument('--variants', nargs='+', choices=list(VARIANTS), default=list(VARIANTS))
+    parser.add_argument('--compression', nargs='+', choices=['off', 'on'], default=['off', 'on'])
+    parser.add_argument('--output', help='путь к JSON с результатами')
+    parser.set_defaults(latency_ms=20.0, latency_p99_ms=60.0)
+    args = parser.parse_args()
+    # Локальный HTTP/2-сервер - без TLS, транспорт должен начинать сразу с HTTP/2
+    os.environ['HTTP2_PRIOR_KNOWLEDGE'] = '1'
+
+    config = MockConfig.from_args(args)
+    ports = {'http1': free_port(), 'http2': free_port()}
+    servers = [
+        multiprocessing.Process(target=serve, args=(config, ports['http1']), daemon=True),
+        multiprocessing.Process(target=serve_h2, args=(config, ports['http2']), daemon=True),
+    ]
+    results = {}
+    for server in servers:
+        server.start()
+    try:
+        for port in ports.values():
+            wait_for_port(port)
+        for compression in args.compression:
+            for variant in args.variants:
+                base_url = f"http://127.0.0.1:{ports[VARIANTS[variant]]}"
+                name = f'{variant}/{compression}'
+                results[name] = asyncio.run(run_variant(variant, base_url, compression, args))
+                print(f'{name:16} {results[name]}')
+    finally:
+        for server in servers:
+            server.terminate()
+            server.join()
+
+    print(f"\n{args.requests} страниц + {args.requests} телефонов, одновременно {args.concurrency} + "
+          f"{args.phone_workers}, задержка сервера {args.latency_ms:g}/{args.latency_p99_ms:g} мс:")
+    print(f"{'':16}{'запр/с':>9}{'p50 мс':>9}{'p99 мс':>9}{'CPU мс':>9}{'КБ/запр':>9}{'соедин.':>9}")
+    for name, r in results.items():
+        print(f"{name:16}{r['requests_per_s']:>9}{r['page_p50_ms']:>9}{r['page_p99_ms']:>9}"
+              f"{r['cpu_ms_per_request']:>9}{r['kb_per_request']:>9}{r['connections']:>9}")
+
+    report = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'commit': git_commit(),
+        'mock': {k: v for k, v in vars(args).items() if k != 'output'},
+        'results': results,
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f"transport_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f'Результаты сохранены: {output}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+"""Масштабирование распределённого режима: пропускная способность от числа воркеров.
+
+Mock-сервер AutoRia запускается в отдельном процессе. Для каждого числа воркеров выдача
+ставится в очередь (SCRAPE_MODE=distributed, main.py --run-once), затем N процессов
+main.py --worker --until-done разбирают её через crawl_frontier. Нужен Postgres с
+настройками из .env; бенчмарк очищает crawl_frontier и удаляет авто mock-сервера из cars,
+поэтому не запускайте его на базе с идущим обходом.
+
+Примеры:
+    python bench/bench_workers.py --pages 20 --workers 1 2 4 8
+    python bench/bench_workers.py --latency-ms 200 --env WORKER_TASKS=2 --workers 1 4
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(BENCH_DIR, '..', 'src')
+sys.path.insert(0, SRC_DIR)
+
+from mock_server import MockConfig, add_arguments  # noqa: E402
+from bench_e2e import RESULTS_DIR, free_port, git_commit, serve, wait_for_port  # noqa: E402
+
+MAIN = os.path.join(SRC_DIR, 'main.py')
+
+def worker_env(base_url, args):
+    env = dict(os.environ)
+    env.update({
+        'START_URL': f'{base_url}/uk/car/used/',
+        'AUTORIA_BASE_URL': base_url,
+        'MAX_PAGES': str(args.pages + 1),
+        'SCRAPE_MODE': 'distributed',
+        'REQUEST_DELAY': '0',
+        'LISTING_DELAY': '0',
+        'INCREMENTAL': '0',
+        'HTTP_CACHE_DIR': '',
+        'METRICS_PORT': '0',
+        # Один воркер намеренно ограничен, чтобы упираться в задержку сайта, а не в CPU
+        'MAX_CONCURRENT_REQUESTS': '4',
+        'WORKER_TASKS': '4',
+        'WORKER_POLL_INTERVAL': '0.2',
+    })
+    for item in args.env:
+        key, _, value = item.partition('=')
+        env[key] = value
+    return env
+
+def reset(base_url):
+    from db import create_table, pooled_conn, frontier_reset
+    create_table()
+    with pooled_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute('DELETE FROM cars WHERE url LIKE %s', (base_url + '%',))
+        conn.commit()
+    frontier_reset(datetime.now().isoformat(timespec='seconds'))
+
+def count_rows(base_url):
+    from db import pooled_conn
+    with pooled_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute('SELECT count(*) FROM cars WHERE url LIKE %s', (base_url + '%',))
+            (rows,) = cur.fetchone()
+        conn.commit()
+    return rows
+
+def run_round(base_url, workers, args):
+    env = worker_env(base_url, args)
+    reset(base_url)
+    subprocess.run([sys.executable, '-u', MAIN, '--run-once'], env=env, check=True,
+                   stdout=subprocess.DEVNULL)
+    start = time.perf_counter()
+    procs = [
+        subprocess.Popen([sys.executable, '-u', MAIN, '--worker', '--until-done'],
+                         env={**env, 'WORKER_ID': f'bench-{i}'}, stdout=subprocess.DEVNULL)
+        for i in range(workers)
+    ]
+    codes = [proc.wait() for proc in procs]
+    elapsed = time.perf_counter() - start
+    rows = count_rows(base_url)
+    return {
+        'workers': workers,
+        'elapsed_s': round(elapsed, 3),
+        'rows': rows,
+        'listings_per_s': round(rows / elapsed, 2),
+        'failed_workers': sum(1 for code in codes if code != 0),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    add_arguments(parser)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--env', action='append', default=[], metavar='KEY=VALUE',
+                        help='настройка воркеров из .env, можно повторять')
+    parser.add_argument('--output', help='путь к JSON с результатами')
+    args = parser.parse_args()
+
+    port = free_port()
+    base_url = f'http://127.0.0.1:{port}'
+    server = multiprocessing.Process(target=serve, args=(MockConfig.from_args(args), port), daemon=True)
+    server.start()
+    rounds = []
+    try:
+        wait_for_port(port)
+        for workers in args.workers:
+            result = run_round(base_url, workers, args)
+            rounds.append(result)
+            base = rounds[0]['listings_per_s'] / rounds[0]['workers']
+            speedup = result['listings_per_s'] / rounds[0]['listings_per_s']
+            efficiency = result['listings_per_s'] / (base * workers) * 100
+            print(f"воркеров {workers:3}: {result['rows']} авто за {result['elapsed_s']:.1f} с, "
+                  f"{result['listings_per_s']:.1f}/с, ускорение x{speedup:.2f}, эффективность {efficiency:.0f}%")
+    finally:
+        server.terminate()
+        server.join()
+        from db import close_pool
+        close_pool()
+
+    report = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'commit': git_commit(),
+        'mock': {k: v for k, v in vars(args).items() if k not in ('output', 'workers')},
+        'rounds': rounds,
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f"workers_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f'Результаты сохранены: {output}')
+
+if __name__ == '__main__':
+    main()
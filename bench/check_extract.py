@@ -0,0 +1,59 @@
+"""Дифференциальная проверка: extract_car_fields против safe_parse_* на корпусе страниц.
+
+Запуск (код возврата 1 при расхождениях):
+    python bench/check_extract.py
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from bs4 import BeautifulSoup  # noqa: E402
+import scraper  # noqa: E402
+from extract import extract_car_fields  # noqa: E402
+from parse_corpus import load_corpus  # noqa: E402
+
+def legacy_fields(soup):
+    image_url, images_count = scraper.safe_parse_images(soup)
+    car_number, car_vin = scraper.safe_parse_car_details(soup)
+    id_tag = soup.find('div', {'data-id': True})
+    return {
+        'title': scraper.safe_parse_title(soup),
+        'price_usd': scraper.safe_parse_price(soup),
+        'odometer': scraper.safe_parse_odometer(soup),
+        'username': scraper.safe_parse_username(soup),
+        'image_url': image_url,
+        'images_count': images_count,
+        'car_number': car_number,
+        'car_vin': car_vin,
+        'data_id': id_tag.get('data-id') if id_tag else None,
+    }
+
+def load_pages():
+    _, pages = load_corpus('detail')
+    for entry, html in pages:
+        yield entry['name'], html
+
+def main():
+    mismatches = 0
+    legacy_time = compiled_time = 0.0
+    for name, html in load_pages():
+        soup = BeautifulSoup(html, 'lxml')
+        start = time.perf_counter()
+        expected = legacy_fields(soup)
+        legacy_time += time.perf_counter() - start
+        start = time.perf_counter()
+        actual = extract_car_fields(soup, scraper.parse_odometer)
+        compiled_time += time.perf_counter() - start
+        diff = {k: (expected[k], actual[k]) for k in expected if expected[k] != actual[k]}
+        status = 'OK' if not diff else 'РАСХОЖДЕНИЕ'
+        print(f'{status:12} {name}')
+        for field, (want, got) in diff.items():
+            print(f'    {field}: safe_parse={want!r} extract={got!r}')
+        mismatches += bool(diff)
+    print(f'safe_parse_*: {legacy_time * 1000:.1f} мс, extract_car_fields: {compiled_time * 1000:.1f} мс')
+    return 1 if mismatches else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
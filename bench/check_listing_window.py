@@ -0,0 +1,88 @@
+"""Проверка окна выдачи: LISTING_WINDOW 1, 3 и 8 дают одинаковые ссылки против mock-сервера.
+
+iter_listing_pages загружает страницы выдачи наперёд, но отдаёт их по порядку, поэтому
+набор ссылок и точка остановки не должны зависеть от окна - и при выдаче, кончающейся
+раньше MAX_PAGES, и при упоре в MAX_PAGES. Ошибки mock-сервера по умолчанию выключены:
+исчерпавшая попытки страница останавливает обход в разных местах при разных окнах.
+
+Запуск (код возврата 1 при расхождениях):
+    python bench/check_listing_window.py
+    python bench/check_listing_window.py --pages 30 --windows 1 2 5 16
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import sys
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'src'))
+
+from bench_e2e import free_port, serve, wait_for_port  # noqa: E402
+from mock_server import MockConfig, add_arguments  # noqa: E402
+
+async def crawl(scraper, base_url, max_pages):
+    """(номера отданных страниц, ссылки в порядке выдачи, выдача пройдена до конца)"""
+    pages, urls, outcome = [], [], {}
+    async with scraper.make_session() as session:
+        async for page, links in scraper.iter_listing_pages(session, f'{base_url}/uk/car/used/', 1,
+                                                            outcome, max_pages):
+            pages.append(page)
+            urls.extend(links)
+    return pages, urls, outcome['complete']
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    add_arguments(parser)
+    parser.add_argument('--windows', type=int, nargs='+', default=[1, 3, 8], help='значения LISTING_WINDOW')
+    parser.set_defaults(pages=12, latency_ms=5.0, latency_p99_ms=30.0)
+    args = parser.parse_args()
+
+    port = free_port()
+    base_url = f'http://127.0.0.1:{port}'
+    # Настройки парсера читаются из окружения при импорте модулей
+    os.environ.update({'AUTORIA_BASE_URL': base_url, 'LISTING_DELAY': '0', 'REQUEST_DELAY': '0'})
+    import scraper
+
+    server = multiprocessing.Process(target=serve, args=(MockConfig.from_args(args), port), daemon=True)
+    server.start()
+    mismatches = 0
+    try:
+        wait_for_port(port)
+        # Выдача кончается раньше MAX_PAGES и обход упирается в MAX_PAGES посреди выдачи
+        for max_pages in (args.pages + 5, max(1, args.pages // 2)):
+            results = {}
+            for window in args.windows:
+                scraper.LISTING_WINDOW = window
+                results[window] = asyncio.run(crawl(scraper, base_url, max_pages))
+            reference_window = args.windows[0]
+            ref_pages, ref_urls, ref_complete = results[reference_window]
+            print(f'MAX_PAGES={max_pages}: окно {reference_window} - страниц {len(ref_pages)}, '
+                  f'ссылок {len(ref_urls)}, выдача пройдена: {ref_complete}')
+            for window, (pages, urls, complete) in results.items():
+                if window == reference_window:
+                    continue
+                problems = []
+                if set(urls) != set(ref_urls):
+                    problems.append(f'ссылки: лишних {len(set(urls) - set(ref_urls))}, '
+                                    f'недостающих {len(set(ref_urls) - set(urls))}')
+                elif urls != ref_urls:
+                    problems.append('другой порядок ссылок')
+                if pages != ref_pages:
+                    problems.append(f'страницы {pages[:1]}..{pages[-1:]} вместо {ref_pages[:1]}..{ref_pages[-1:]}')
+                if complete != ref_complete:
+                    problems.append(f'выдача пройдена: {complete}')
+                mismatches += bool(problems)
+                print(f"  окно {window}: {'; '.join(problems) or 'совпадает'}")
+    finally:
+        server.terminate()
+        server.join()
+
+    if mismatches:
+        print(f'Расхождений: {mismatches}')
+        return 1
+    print('Ссылки выдачи не зависят от LISTING_WINDOW')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,46 @@
+"""Проверка рендера метрик Prometheus: метки разных типов и все виды метрик.
+
+Запуск (код возврата 1 при ошибке):
+    python bench/check_metrics.py
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import metrics  # noqa: E402
+
+def main():
+    problems = []
+    counter = metrics.Counter('check_requests_total', 'Проверка', ('kind', 'status'))
+    # Коды ответа приходят числами, ошибки транспорта - строками
+    counter.inc(kind='detail', status=200)
+    counter.inc(kind='detail', status='error')
+    counter.inc(kind='detail', status='too_large')
+    counter.inc(kind='detail', status=200)
+    gauge = metrics.Gauge('check_in_flight', 'Проверка', ('kind',))
+    gauge.inc(kind=1)
+    gauge.inc(kind='detail')
+    histogram = metrics.Histogram('check_seconds', 'Проверка', ('stage',))
+    histogram.observe(0.1, stage=1)
+    histogram.observe(0.2, stage='parse')
+    try:
+        text = metrics.render()
+    except Exception as e:
+        print(f'render() упал: {e!r}')
+        return 1
+    for line in ('check_requests_total{kind="detail",status="200"} 2',
+                 'check_requests_total{kind="detail",status="error"} 1',
+                 'check_requests_total{kind="detail",status="too_large"} 1',
+                 'check_in_flight{kind="1"} 1',
+                 'check_seconds_count{stage="parse"} 1'):
+        if line not in text.splitlines():
+            problems.append(line)
+    if problems:
+        print('Нет строк в выводе /metrics:\n  ' + '\n  '.join(problems))
+        return 1
+    print('Рендер метрик: OK')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,120 @@
+"""Mock-сервер AutoRia по HTTP/2 без TLS (h2c, prior knowledge) на пакете h2.
+
+Отдаёт тот же MockSite, что и aiohttp-сервер mock_server.py, поэтому транспорты
+сравниваются на одинаковых ответах. Запросы одного соединения обрабатываются
+параллельно (мультиплексирование), отправка тела учитывает окна управления потоком.
+
+Запуск отдельно:
+    python bench/h2_server.py --port 8443 --pages 50 --latency-ms 80 --compress
+"""
+import argparse
+import asyncio
+from urllib.parse import parse_qsl, urlsplit
+
+import h2.config
+import h2.connection
+import h2.events
+import h2.exceptions
+
+from mock_server import MockConfig, MockSite, add_arguments
+
+class H2Protocol(asyncio.Protocol):
+    def __init__(self, site):
+        self.site = site
+        self.conn = h2.connection.H2Connection(
+            h2.config.H2Configuration(client_side=False, header_encoding='utf-8'))
+        self.transport = None
+        self.tasks = {}
+        # Потоки, ожидающие расширения окна управления потоком
+        self.window_open = {}
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.site.counters['connections'] += 1
+        self.conn.initiate_connection()
+        self.transport.write(self.conn.data_to_send())
+
+    def connection_lost(self, exc):
+        for task in self.tasks.values():
+            task.cancel()
+        for event in self.window_open.values():
+            event.set()
+
+    def data_received(self, data):
+        try:
+            events = self.conn.receive_data(data)
+        except h2.exceptions.ProtocolError:
+            self.transport.write(self.conn.data_to_send())
+            self.transport.close()
+            return
+        for event in events:
+            if isinstance(event, h2.events.RequestReceived):
+                headers = dict(event.headers)
+                self.tasks[event.stream_id] = asyncio.create_task(self.handle(event.stream_id, headers))
+            elif isinstance(event, h2.events.WindowUpdated):
+                # stream_id 0 - окно всего соединения: будим все ожидающие потоки
+                for stream_id, waiter in list(self.window_open.items()):
+                    if event.stream_id in (0, stream_id):
+                        waiter.set()
+            elif isinstance(event, h2.events.StreamReset):
+                task = self.tasks.pop(event.stream_id, None)
+                if task is not None:
+                    task.cancel()
+            elif isinstance(event, h2.events.ConnectionTerminated):
+                self.transport.close()
+        self.transport.write(self.conn.data_to_send())
+
+    async def handle(self, stream_id, headers):
+        try:
+            url = urlsplit(headers[':path'])
+            status, response_headers, body = await self.site.respond(
+                url.path, dict(parse_qsl(url.query)), headers.get('accept-encoding', ''))
+            self.conn.send_headers(stream_id, [
+                (':status', str(status)),
+                ('content-length', str(len(body))),
+                *((name.lower(), value) for name, value in response_headers.items()),
+            ])
+            self.transport.write(self.conn.data_to_send())
+            await self.send_body(stream_id, body)
+        except (asyncio.CancelledError, h2.exceptions.StreamClosedError):
+            pass
+        finally:
+            self.tasks.pop(stream_id, None)
+
+    async def send_body(self, stream_id, body):
+        view = memoryview(body)
+        while True:
+            window = min(self.conn.local_flow_control_window(stream_id), self.conn.max_outbound_frame_size)
+            if window <= 0 and view:
+                waiter = self.window_open[stream_id] = asyncio.Event()
+                await waiter.wait()
+                self.window_open.pop(stream_id, None)
+                if self.transport.is_closing():
+                    return
+                continue
+            chunk, view = view[:window], view[window:]
+            self.conn.send_data(stream_id, chunk.tobytes(), end_stream=not view)
+            self.transport.write(self.conn.data_to_send())
+            if not view:
+                return
+
+def serve_h2(config, port, host='127.0.0.1'):
+    """Запуск HTTP/2-сервера (блокирующий, для отдельного процесса)"""
+    async def run():
+        site = MockSite(config)
+        server = await asyncio.get_running_loop().create_server(lambda: H2Protocol(site), host, port)
+        async with server:
+            await server.serve_forever()
+    asyncio.run(run())
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8443)
+    add_arguments(parser)
+    args = parser.parse_args()
+    print(f'Mock AutoRia (h2c): http://{args.host}:{args.port}/uk/car/used/')
+    serve_h2(MockConfig.from_args(args), args.port, args.host)
+
+if __name__ == '__main__':
+    main()
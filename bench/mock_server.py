@@ -0,0 +1,230 @@
+"""Локальный mock-сервер AutoRia: выдача, страницы авто и оба API телефонов.
+
+Запуск отдельно:
+    python bench/mock_server.py --port 8080 --pages 50 --latency-ms 80 --throttle-rate 0.02
+"""
+import argparse
+import asyncio
+import gzip
+import json
+import math
+import random
+import re
+from aiohttp import web
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+from pages import car_json, detail_html, listing_html, phone_for
+
+class MockConfig:
+    def __init__(self, pages=20, per_page=20, size_kb=100, photos=12, sellers=0,
+                 latency_ms=50.0, latency_p99_ms=250.0, error_rate=0.0, throttle_rate=0.0,
+                 retry_after=1.0, json_missing_rate=0.0, change_rate=0.0, churn_rate=0.0, compress=False,
+                 seed=0):
+        self.pages = pages
+        self.per_page = per_page
+        self.size_kb = size_kb
+        self.photos = photos
+        # 0 - у каждого объявления свой продавец, иначе объявления делят sellers продавцов
+        self.sellers = sellers
+        self.latency_ms = latency_ms
+        self.latency_p99_ms = latency_p99_ms
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        # Доля ответов searchPage/v2 без одного из полей (проверка дополнения из HTML)
+        self.json_missing_rate = json_missing_rate
+        # Повторный обход: с ревизии 1 у доли change_rate объявлений меняется цена,
+        # у доли churn_rate - только разметка страницы (баннер); ревизию задаёт /_revision
+        self.change_rate = change_rate
+        self.churn_rate = churn_rate
+        self.revision = 0
+        # Сжатие ответов по Accept-Encoding клиента (br, если установлен brotli, иначе gzip)
+        self.compress = compress
+        self.seed = seed
+
+    @classmethod
+    def from_args(cls, args):
+        return cls(pages=args.pages, per_page=args.per_page, size_kb=args.size_kb, photos=args.photos,
+                   sellers=args.sellers, latency_ms=args.latency_ms, latency_p99_ms=args.latency_p99_ms,
+                   error_rate=args.error_rate, throttle_rate=args.throttle_rate,
+                   retry_after=args.retry_after, json_missing_rate=args.json_missing_rate,
+                   change_rate=args.change_rate, churn_rate=args.churn_rate, compress=args.compress,
+                   seed=args.seed)
+
+def add_arguments(parser):
+    parser.add_argument('--pages', type=int, default=20, help='страниц выдачи')
+    parser.add_argument('--per-page', type=int, default=20, help='объявлений на странице')
+    parser.add_argument('--size-kb', type=int, default=100, help='размер страницы авто')
+    parser.add_argument('--photos', type=int, default=12)
+    parser.add_argument('--sellers', type=int, default=0, help='число продавцов (0 - у каждого свой)')
+    parser.add_argument('--latency-ms', type=float, default=50.0, help='медиана задержки ответа')
+    parser.add_argument('--latency-p99-ms', type=float, default=250.0, help='p99 задержки ответа')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='доля ответов 500')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='доля ответов 429')
+    parser.add_argument('--retry-after', type=float, default=1.0, help='Retry-After для 429, сек')
+    parser.add_argument('--json-missing-rate', type=float, default=0.0,
+                        help='доля ответов searchPage/v2 без одного из полей')
+    parser.add_argument('--change-rate', type=float, default=0.0,
+                        help='доля объявлений с новой ценой с ревизии 1')
+    parser.add_argument('--churn-rate', type=float, default=0.0,
+                        help='доля страниц с изменённой разметкой без изменения полей с ревизии 1')
+    parser.add_argument('--compress', action='store_true', help='сжимать ответы (gzip или br)')
+    parser.add_argument('--seed', type=int, default=0)
+
+DETAIL_RE = re.compile(r'^/uk/[^/]*_(\d+)\.html$')
+PHONES_RE = re.compile(r'^/users/phones/(\d+)$')
+SEARCH_RE = re.compile(r'^/demo/bu/searchPage/v2/view/auto/(\d+)$')
+# Поля, которые могут отсутствовать в ответе searchPage/v2: (раздел или None, ключ)
+JSON_OPTIONAL = [(None, 'title'), (None, 'USD'), ('autoData', 'raceInt'), ('userInfo', 'name'),
+                 (None, 'photoData'), (None, 'plateNumber'), (None, 'VIN')]
+
+HTML = 'text/html; charset=utf-8'
+JSON = 'application/json; charset=utf-8'
+
+def _encoder(accept_encoding):
+    """(название, функция сжатия) для Accept-Encoding клиента или None"""
+    accepted = {item.split(';')[0].strip() for item in accept_encoding.split(',')}
+    if 'br' in accepted and brotli is not None:
+        # Невысокое качество, как у сайтов для динамических страниц
+        return 'br', lambda body: brotli.compress(body, quality=4)
+    if 'gzip' in accepted:
+        return 'gzip', lambda body: gzip.compress(body, compresslevel=6, mtime=0)
+    return None
+
+class MockSite:
+    """Ответы mock-сайта независимо от протокола: respond() -> (статус, заголовки, тело).
+
+    Один и тот же сайт отдаёт aiohttp-сервер (HTTP/1.1, make_app) и HTTP/2-сервер (h2_server.py).
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.rnd = random.Random(config.seed)
+        # Логнормальное распределение задержки с заданными медианой и p99
+        self.mu = math.log(max(config.latency_ms, 0.001))
+        self.sigma = max(0.0, math.log(max(config.latency_p99_ms, config.latency_ms)
+                                       / max(config.latency_ms, 0.001)) / 2.326)
+        self.counters = {'listing': 0, 'detail': 0, 'phones': 0, 'search': 0, '429': 0, '500': 0,
+                         'bytes_sent': 0, 'connections': 0}
+
+    def seller_of(self, car_id):
+        return car_id % self.config.sellers if self.config.sellers else car_id
+
+    def revised(self, car_id, rate, salt):
+        # Выбор объявлений детерминирован: одна ревизия - одни и те же изменения
+        revision = self.config.revision
+        return revision > 0 and rate > 0 and random.Random(f'{salt}:{car_id}:{revision}').random() < rate
+
+    def price_shift(self, car_id):
+        return 100 * self.config.revision if self.revised(car_id, self.config.change_rate, 'price') else 0
+
+    async def respond(self, path, query, accept_encoding=''):
+        if path.startswith('/_'):
+            return self.control(path, query)
+        config = self.config
+        if config.latency_ms > 0:
+            await asyncio.sleep(self.rnd.lognormvariate(self.mu, self.sigma) / 1000)
+        roll = self.rnd.random()
+        if roll < config.throttle_rate:
+            self.counters['429'] += 1
+            return 429, {'Retry-After': f'{config.retry_after:g}'}, b''
+        if roll < config.throttle_rate + config.error_rate:
+            self.counters['500'] += 1
+            return 500, {}, b''
+        status, content_type, body = self.route(path, query)
+        headers = {'Content-Type': content_type}
+        encoder = _encoder(accept_encoding) if config.compress and body else None
+        if encoder is not None:
+            headers['Content-Encoding'], body = encoder[0], encoder[1](body)
+        self.counters['bytes_sent'] += len(body)
+        return status, headers, body
+
+    def route(self, path, query):
+        if path == '/uk/car/used/':
+            return self.listing(int(query.get('page', '1')))
+        match = DETAIL_RE.match(path)
+        if match:
+            return self.detail(int(match.group(1)))
+        match = PHONES_RE.match(path)
+        if match:
+            self.counters['phones'] += 1
+            phone = phone_for(self.seller_of(int(match.group(1))))
+            return 200, JSON, json.dumps([{'phone': phone}]).encode()
+        match = SEARCH_RE.match(path)
+        if match:
+            return self.search_view(int(match.group(1)))
+        return 404, 'text/plain; charset=utf-8', b'404: Not Found'
+
+    def listing(self, page):
+        self.counters['listing'] += 1
+        if page > self.config.pages:
+            return 200, HTML, b'<html><body><div class="content-bar"></div></body></html>'
+        return 200, HTML, listing_html('', page, self.config.per_page).encode()
+
+    def detail(self, car_id):
+        self.counters['detail'] += 1
+        config = self.config
+        html = detail_html(car_id, config.size_kb, config.photos, self.seller_of(car_id), self.price_shift(car_id))
+        banner = (f'<div class="banner">{config.revision}</div>'
+                  if self.revised(car_id, config.churn_rate, 'churn') else '')
+        # Как на сайте: в каждом ответе свой токен в скрипте
+        html = html.replace('</body>', f'{banner}<script>window.__token="{self.rnd.getrandbits(64):x}"</script></body>')
+        return 200, HTML, html.encode()
+
+    def search_view(self, car_id):
+        self.counters['search'] += 1
+        data = car_json(car_id, self.config.photos, self.seller_of(car_id), self.price_shift(car_id))
+        if self.config.json_missing_rate and self.rnd.random() < self.config.json_missing_rate:
+            section, key = self.rnd.choice(JSON_OPTIONAL)
+            (data[section] if section else data).pop(key)
+        return 200, JSON, json.dumps(data).encode()
+
+    def control(self, path, query):
+        """Служебные адреса: /_stats, /_revision?value=N, /_compress?value=0|1"""
+        if path == '/_stats':
+            data = self.counters
+        elif path == '/_revision':
+            self.config.revision = int(query['value'])
+            data = {'revision': self.config.revision}
+        elif path == '/_compress':
+            self.config.compress = query['value'] == '1'
+            data = {'compress': self.config.compress}
+        else:
+            return 404, {'Content-Type': 'text/plain; charset=utf-8'}, b'404: Not Found'
+        return 200, {'Content-Type': JSON}, json.dumps(data).encode()
+
+def make_app(config):
+    """Mock-сайт как приложение aiohttp (HTTP/1.1)"""
+    site = MockSite(config)
+    connections = set()
+
+    async def handle(request):
+        # Соединение опознаётся по адресу клиента: порты за время прогона не повторяются
+        peer = request.transport.get_extra_info('peername') if request.transport else None
+        if peer not in connections:
+            connections.add(peer)
+            site.counters['connections'] += 1
+        status, headers, body = await site.respond(request.path, request.query,
+                                                   request.headers.get('Accept-Encoding', ''))
+        return web.Response(status=status, headers=headers, body=body)
+
+    app = web.Application()
+    app.router.add_get('/{tail:.*}', handle)
+    app['site'] = site
+    return app
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    add_arguments(parser)
+    args = parser.parse_args()
+    print(f'Mock AutoRia: http://{args.host}:{args.port}/uk/car/used/')
+    web.run_app(make_app(MockConfig.from_args(args)), host=args.host, port=args.port, print=None)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""Генерация синтетических страниц AutoRia для бенчмарков.
+
+Разметка повторяет селекторы, которые ищет scraper.py: заголовок, цена, пробег,
+продавец, галерея, госномер и VIN. Размер страницы добивается блоками «шума».
+"""
+import random
+
+def filler(size_kb, seed=0):
+    rnd = random.Random(seed)
+    blocks = []
+    size = 0
+    while size < size_kb * 1024:
+        block = (f'<div class="noise-{rnd.randint(0, 999)}"><p>'
+                 + ' '.join(str(rnd.randint(0, 10 ** 6)) for _ in range(20))
+                 + '</p><span>text</span></div>')
+        blocks.append(block)
+        size += len(block)
+    return ''.join(blocks)
+
+def detail_html(car_id, size_kb=100, photos=12, seller_id=None, price_shift=0):
+    gallery = ''.join(
+        f'<img src="https://cdn0.riastatic.com/photosnew/auto/photo/car__{car_id}{n}f.jpg">'
+        for n in range(photos)
+    )
+    return f'''<html><head><title>Auto {car_id}</title></head><body>
+<div data-id="{car_id}" data-user-id="{seller_id if seller_id is not None else car_id}">
+<h1 class="head">Volkswagen Passat {2000 + car_id % 25}</h1>
+<div class="price_value"><strong>{10000 + car_id % 50000 + price_shift:,} $</strong></div>
+{filler(size_kb // 2, car_id)}
+<div class="base-information"><div>Пробег</div><span>{car_id % 300} тыс. км</span></div>
+<div class="seller_info_name">Продавец {car_id % 1000}</div>
+<div class="gallery-main"><img class="outline m-auto" src="https://cdn0.riastatic.com/photosnew/auto/photo/main_{car_id}f.jpg">{gallery}</div>
+<div class="item_params">
+  <span class="label">Госномер</span><span>AA {car_id % 10000:04d} BB</span>
+  <span class="label">VIN-код</span><span>WVWZZZ3CZ{car_id:08d}</span>
+</div>
+{filler(size_kb // 2, car_id + 1)}
+</div></body></html>'''
+
+def listing_id(page, n):
+    """ID объявления n на странице выдачи page (восьмизначный, как на сайте)"""
+    return 30000000 + page * 1000 + n
+
+def listing_html(base_url, page, per_page=20):
+    """Страница выдачи; base_url='' даёт относительные ссылки, как на сайте"""
+    links = ''.join(
+        f'<section class="ticket-item"><a class="address" href="{base_url}/uk/auto_volkswagen_passat_{listing_id(page, n)}.html">'
+        f'Volkswagen Passat</a></section>'
+        for n in range(per_page)
+    )
+    return f'<html><body><div class="content-bar">{links}</div></body></html>'
+
+def phone_for(seller_id):
+    return f'(067) {seller_id % 1000:03d} {seller_id % 100:02d} {seller_id % 97:02d}'
+
+def car_json(car_id, photos=12, seller_id=None, price_shift=0):
+    """Ответ searchPage/v2/view/auto/{id} с теми же данными, что и detail_html"""
+    seller_id = seller_id if seller_id is not None else car_id
+    race = car_id % 300
+    return {
+        'autoData': {
+            'autoId': car_id,
+            'raceInt': race,
+            'race': f'{race} тыс. км',
+            'year': 2000 + car_id % 25,
+        },
+        'title': f'Volkswagen Passat {2000 + car_id % 25}',
+        'USD': 10000 + car_id % 50000 + price_shift,
+        'userId': seller_id,
+        'userInfo': {'name': f'Продавец {car_id % 1000}', 'phone': phone_for(seller_id)},
+        'photoData': {
+            'count': photos + 1,
+            'seoLinkF': f'https://cdn0.riastatic.com/photosnew/auto/photo/main_{car_id}f.jpg',
+        },
+        'plateNumber': f'AA {car_id % 10000:04d} BB',
+        'VIN': f'WVWZZZ3CZ{car_id:08d}',
+        'linkToView': f'/uk/auto_volkswagen_passat_{car_id}.html',
+    }
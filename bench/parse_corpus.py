@@ -0,0 +1,70 @@
+"""Версионированный корпус страниц для проверки и бенчмарков разбора.
+
+Состав корпуса описан в corpus/manifest.json: страницы-файлы и сгенерированные pages.py
+(большие страницы не хранятся в репозитории). У каждой страницы записан sha256, поэтому
+любое изменение файла или генератора обнаруживается при загрузке; после намеренного
+изменения увеличьте version и пересчитайте хэши:
+    python bench/parse_corpus.py --update
+"""
+import argparse
+import hashlib
+import json
+import os
+
+from pages import detail_html, listing_html
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'corpus')
+MANIFEST = os.path.join(CORPUS_DIR, 'manifest.json')
+
+def read_manifest():
+    with open(MANIFEST, encoding='utf-8') as f:
+        return json.load(f)
+
+def _render(entry):
+    if 'file' in entry:
+        with open(os.path.join(CORPUS_DIR, entry['file']), encoding='utf-8') as f:
+            return f.read()
+    generator = entry['generator']
+    if entry['kind'] == 'listing':
+        return listing_html('', generator['page'], generator.get('per_page', 20))
+    return detail_html(generator['car_id'], generator.get('size_kb', 100), generator.get('photos', 12))
+
+def page_url(entry):
+    """Адрес страницы для разбора (ID объявления в ссылке, как на сайте)"""
+    return entry.get('url') or f"https://auto.ria.com/uk/auto_corpus_{entry['name']}.html"
+
+def load_corpus(kind=None, verify=True):
+    """(версия корпуса, [(запись манифеста, HTML)]); ValueError, если страница не совпадает с хэшем"""
+    manifest = read_manifest()
+    pages = []
+    for entry in manifest['pages']:
+        if kind is not None and entry['kind'] != kind:
+            continue
+        html = _render(entry)
+        if verify and hashlib.sha256(html.encode('utf-8')).hexdigest() != entry['sha256']:
+            raise ValueError(f"Страница корпуса {entry['name']} изменилась: увеличьте version "
+                             f"в {MANIFEST} и выполните parse_corpus.py --update")
+        pages.append((entry, html))
+    return manifest['version'], pages
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--update', action='store_true', help='пересчитать sha256 страниц в манифесте')
+    args = parser.parse_args()
+
+    manifest = read_manifest()
+    for entry in manifest['pages']:
+        html = _render(entry)
+        digest = hashlib.sha256(html.encode('utf-8')).hexdigest()
+        status = 'OK' if digest == entry.get('sha256') else 'ИЗМЕНЕНА'
+        print(f"{status:9} {entry['kind']:8} {entry['name']:24} {len(html) / 1024:8.1f} КБ")
+        if args.update:
+            entry['sha256'] = digest
+    if args.update:
+        with open(MANIFEST, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2, ensure_ascii=False)
+            f.write('\n')
+        print(f"Манифест обновлён, версия корпуса {manifest['version']}")
+
+if __name__ == '__main__':
+    main()
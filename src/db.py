@@ -1,6 +1,12 @@
 import os
-import psycopg2
-from psycopg2.extras import RealDictCursor
+import time
+import asyncio
+import logging
+from array import array
+from datetime import date
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from metrics import CARS, STAGE_SECONDS, log_event
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -13,15 +19,120 @@ DB_PARAMS = {
     'port': os.getenv('POSTGRES_PORT', '5433'),  # Default to 5433 if not set
 }
 
+# Порог размера и времени для пакетной записи в БД
+DB_FLUSH_SIZE = int(os.getenv('DB_FLUSH_SIZE', '200'))
+DB_FLUSH_INTERVAL = float(os.getenv('DB_FLUSH_INTERVAL', '5.0'))
+
+# Размер пула соединений (и потоков, выполняющих запросы вне event loop)
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '4'))
+# Соединения сверх DB_POOL_SIZE для работы вне потоков run_db: create_table в event loop
+# и выгрузка export_cars в потоке планировщика
+DB_POOL_RESERVE = int(os.getenv('DB_POOL_RESERVE', '2'))
+
+CAR_COLUMNS = (
+    'listing_id', 'url', 'title', 'price_usd', 'odometer', 'username', 'phone_number',
+    'image_url', 'images_count', 'car_number', 'car_vin', 'datetime_found',
+    'content_hash', 'fields_hash',
+)
+# Типы для VALUES внутри CTE (без них NULL в первой строке даёт колонку типа text)
+_COLUMN_TYPES = {
+    'listing_id': 'BIGINT', 'price_usd': 'NUMERIC', 'odometer': 'INTEGER', 'phone_number': 'BIGINT',
+    'images_count': 'INTEGER', 'datetime_found': 'TIMESTAMP', 'content_hash': 'BIGINT', 'fields_hash': 'BIGINT',
+}
+# Не меняются при повторной встрече объявления: datetime_found - время первого обнаружения
+_FIRST_SEEN_COLUMNS = ('listing_id', 'datetime_found')
+
+class CarRecord:
+    """Авто для записи в БД: слоты вместо словаря (около 110 байт против ~650 у dict с 12 ключами)"""
+    __slots__ = CAR_COLUMNS
+
+    def __init__(self, **fields):
+        for col in CAR_COLUMNS:
+            setattr(self, col, fields.pop(col, None))
+        if fields:
+            raise TypeError(f"Неизвестные поля авто: {', '.join(fields)}")
+
+    def as_row(self):
+        return tuple(getattr(self, col) for col in CAR_COLUMNS)
+
+class UnchangedListing:
+    """Объявление, не изменившееся с прошлой записи (отпечатки совпали): обновляется только last_seen"""
+    __slots__ = ('listing_id', 'url', 'content_hash', 'seen_at')
+
+    def __init__(self, listing_id, url, content_hash, seen_at):
+        self.listing_id = listing_id
+        self.url = url
+        # Новый отпечаток страницы, если она изменилась, а поля авто - нет
+        self.content_hash = content_hash
+        self.seen_at = seen_at
+
+_pool = None
+_executor = None
+# Месяцы, для которых секция car_observations уже создана этим процессом
+_history_months = set()
+
+# psycopg2 загружается при первом обращении к БД: стадии без БД (discover в файл, dump)
+# и замер холодного старта его не импортируют
+
 def get_conn():
+    import psycopg2
+
     return psycopg2.connect(**DB_PARAMS)
 
+def get_pool():
+    """Общий пул соединений, создаётся при первом обращении"""
+    global _pool
+    if _pool is None:
+        from psycopg2.pool import ThreadedConnectionPool
+
+        _pool = ThreadedConnectionPool(1, DB_POOL_SIZE + DB_POOL_RESERVE, **DB_PARAMS)
+    return _pool
+
+def execute_values(cur, sql, argslist, **kwargs):
+    from psycopg2.extras import execute_values
+
+    return execute_values(cur, sql, argslist, **kwargs)
+
+@contextmanager
+def pooled_conn():
+    """Соединение из пула: откат при ошибке и возврат в пул после использования"""
+    pool = get_pool()
+    conn = pool.getconn()
+    try:
+        yield conn
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        pool.putconn(conn)
+
+async def run_db(func, *args):
+    """Выполнение блокирующей функции БД в ограниченном пуле потоков, не блокируя event loop"""
+    global _executor
+    if _executor is None:
+        # Потоков столько же, сколько соединений в пуле без резерва: запросы через run_db
+        # не упираются в лимит пула, а резерв остаётся для соединений вне этих потоков
+        _executor = ThreadPoolExecutor(max_workers=DB_POOL_SIZE, thread_name_prefix='db')
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, func, *args)
+
+def close_pool():
+    """Закрытие пула потоков и всех соединений при завершении работы"""
+    global _pool, _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+        _executor = None
+    if _pool is not None:
+        _pool.closeall()
+        _pool = None
+
 def create_table():
-    with get_conn() as conn:
+    with pooled_conn() as conn:
         with conn.cursor() as cur:
             cur.execute('''
             CREATE TABLE IF NOT EXISTS cars (
                 id SERIAL PRIMARY KEY,
+                listing_id BIGINT,
                 url TEXT UNIQUE,
                 title TEXT,
                 price_usd NUMERIC,
@@ -32,7 +143,633 @@ def create_table():
                 images_count INTEGER,
                 car_number TEXT,
                 car_vin TEXT,
-                datetime_found TIMESTAMP
+                datetime_found TIMESTAMP,
+                last_seen TIMESTAMP
+            );
+            ALTER TABLE cars ADD COLUMN IF NOT EXISTS listing_id BIGINT;
+            ALTER TABLE cars ADD COLUMN IF NOT EXISTS last_seen TIMESTAMP;
+            ''')
+            # Отпечатки страницы и полей (FINGERPRINT=1) и признаки перевыставленного авто:
+            # identity_hash - хэш VIN (или госномера без VIN), relist_of - первое объявление этого авто;
+            # phone_checked_at/phone_attempts - последний и число безуспешных запросов телефона backfill
+            cur.execute(r'''
+            ALTER TABLE cars ADD COLUMN IF NOT EXISTS content_hash BIGINT;
+            ALTER TABLE cars ADD COLUMN IF NOT EXISTS fields_hash BIGINT;
+            ALTER TABLE cars ADD COLUMN IF NOT EXISTS relist_of BIGINT;
+            ALTER TABLE cars ADD COLUMN IF NOT EXISTS phone_checked_at TIMESTAMP;
+            ALTER TABLE cars ADD COLUMN IF NOT EXISTS phone_attempts INTEGER NOT NULL DEFAULT 0;
+            ALTER TABLE cars ADD COLUMN IF NOT EXISTS identity_hash BIGINT GENERATED ALWAYS AS (
+                CASE
+                    WHEN length(regexp_replace(car_vin, '[^0-9A-Za-z]', '', 'g')) >= 11
+                        THEN hashtextextended('vin:' || upper(regexp_replace(car_vin, '[^0-9A-Za-z]', '', 'g')), 0)
+                    WHEN length(regexp_replace(car_number, '[\s-]', '', 'g')) >= 4
+                        THEN hashtextextended('num:' || upper(regexp_replace(car_number, '[\s-]', '', 'g')), 0)
+                END
+            ) STORED;
+            ''')
+            # История цены и пробега: строка на каждое наблюдение, секции по месяцам
+            cur.execute('''
+            CREATE TABLE IF NOT EXISTS car_observations (
+                listing_id BIGINT NOT NULL,
+                observed_at TIMESTAMP NOT NULL,
+                price_usd NUMERIC,
+                odometer INTEGER
+            ) PARTITION BY RANGE (observed_at);
+            CREATE INDEX IF NOT EXISTS car_observations_listing_idx
+                ON car_observations (listing_id, observed_at);
+            ''')
+            months = _create_history_partitions(cur, _upcoming_months())
+            months |= _migrate_listing_ids(cur)
+            cur.execute('''
+            CREATE INDEX IF NOT EXISTS cars_datetime_found_idx ON cars (datetime_found);
+            CREATE INDEX IF NOT EXISTS cars_car_vin_idx ON cars (car_vin) WHERE car_vin IS NOT NULL;
+            CREATE INDEX IF NOT EXISTS cars_phone_number_idx ON cars (phone_number) WHERE phone_number IS NOT NULL;
+            CREATE INDEX IF NOT EXISTS cars_identity_hash_idx ON cars (identity_hash) WHERE identity_hash IS NOT NULL;
+            CREATE INDEX IF NOT EXISTS cars_missing_phone_idx ON cars (id)
+                INCLUDE (phone_checked_at, phone_attempts) WHERE phone_number IS NULL;
+            ''')
+            # Фронтир обхода: состояние каждой ссылки и контрольные точки запуска (FRONTIER=1)
+            cur.execute('''
+            CREATE TABLE IF NOT EXISTS crawl_frontier (
+                url TEXT PRIMARY KEY,
+                state TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                updated_at TIMESTAMP NOT NULL DEFAULT now()
+            );
+            -- Аренда ссылки воркером (SCRAPE_MODE=distributed): истёкшая аренда снова доступна
+            ALTER TABLE crawl_frontier ADD COLUMN IF NOT EXISTS worker TEXT;
+            ALTER TABLE crawl_frontier ADD COLUMN IF NOT EXISTS leased_until TIMESTAMP;
+            CREATE INDEX IF NOT EXISTS crawl_frontier_state_idx ON crawl_frontier (state);
+            CREATE TABLE IF NOT EXISTS crawl_state (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            );
+            ''')
+            # Водяные знаки инкрементальных выгрузок (export.py)
+            cur.execute('''
+            CREATE TABLE IF NOT EXISTS export_state (
+                name TEXT PRIMARY KEY,
+                watermark TIMESTAMP,
+                updated_at TIMESTAMP NOT NULL DEFAULT now()
+            );
+            ''')
+            # Ссылки, исчерпавшие попытки загрузки (retry.py): повторяются в следующих запусках
+            cur.execute('''
+            CREATE TABLE IF NOT EXISTS dead_letters (
+                url TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                attempts INTEGER NOT NULL,
+                runs INTEGER NOT NULL DEFAULT 1,
+                error TEXT,
+                failed_at TIMESTAMP NOT NULL DEFAULT now()
             );
             ''')
             conn.commit()
+    _history_months.update(months)
+
+def _next_month(year, month):
+    return (year + 1, 1) if month == 12 else (year, month + 1)
+
+def _upcoming_months():
+    """Текущий и следующий месяц: их секции создаются заранее"""
+    today = date.today()
+    return [(today.year, today.month), _next_month(today.year, today.month)]
+
+def ensure_history_partitions(months=None):
+    """Создание секций car_observations отдельной транзакцией (по умолчанию текущий и следующий месяц).
+
+    Вызывается при старте (create_table), ежедневно из расписания и перед записью пачки,
+    если в ней есть месяц без известной процессу секции, - транзакция записи DDL не выполняет.
+    """
+    months = set(_upcoming_months() if months is None else months)
+    if months <= _history_months:
+        return
+    with pooled_conn() as conn:
+        with conn.cursor() as cur:
+            created = _create_history_partitions(cur, months)
+        conn.commit()
+    _history_months.update(created)
+
+def _create_history_partitions(cur, months):
+    """Секции car_observations по месяцам, возвращает созданные.
+
+    Вызывающий добавляет их в _history_months только после commit.
+    """
+    months = sorted(set(months) - _history_months)
+    if months:
+        # Процессы, одновременно создающие одну секцию, выстраиваются в очередь до конца транзакции:
+        # без блокировки параллельный CREATE TABLE IF NOT EXISTS падает на каталоге
+        cur.execute('SELECT pg_advisory_xact_lock(hashtext(%s))', ('autoria:history_partitions',))
+    created = set()
+    for year, month in months:
+        next_year, next_month = _next_month(year, month)
+        cur.execute(
+            f'CREATE TABLE IF NOT EXISTS car_observations_{year}{month:02d} '
+            f'PARTITION OF car_observations FOR VALUES FROM (%s) TO (%s)',
+            (date(year, month, 1), date(next_year, next_month, 1)),
+        )
+        created.add((year, month))
+    return created
+
+def _migrate_listing_ids(cur):
+    """Однократный перевод таблицы на ключ listing_id (ID объявления из ссылки).
+
+    Все существующие строки попадают в историю наблюдений; из нескольких строк одного
+    объявления (ссылка сменила slug) остаётся последняя.
+    """
+    cur.execute("SELECT to_regclass('cars_listing_id_key')")
+    if cur.fetchone()[0] is not None:
+        return set()
+    cur.execute(r'''
+        UPDATE cars SET listing_id = substring(url from '_(\d+)\.html')::BIGINT
+        WHERE listing_id IS NULL
+    ''')
+    cur.execute("""
+        SELECT DISTINCT extract(year FROM datetime_found)::INTEGER, extract(month FROM datetime_found)::INTEGER
+        FROM cars WHERE listing_id IS NOT NULL AND datetime_found IS NOT NULL
+    """)
+    months = _create_history_partitions(cur, cur.fetchall())
+    cur.execute('''
+        INSERT INTO car_observations (listing_id, observed_at, price_usd, odometer)
+        SELECT listing_id, datetime_found, price_usd, odometer FROM cars
+        WHERE listing_id IS NOT NULL AND datetime_found IS NOT NULL;
+        DELETE FROM cars WHERE id IN (
+            SELECT id FROM (
+                SELECT id, row_number() OVER (PARTITION BY listing_id ORDER BY id DESC) AS rn
+                FROM cars WHERE listing_id IS NOT NULL
+            ) duplicates WHERE rn > 1
+        );
+        UPDATE cars SET last_seen = datetime_found WHERE last_seen IS NULL;
+        CREATE UNIQUE INDEX cars_listing_id_key ON cars (listing_id);
+    ''')
+    return months
+
+def insert_cars(conn, cars):
+    """Запись пачки авто одним запросом, возвращает (вставлено, обновлено, перевыставлено).
+
+    Текущее состояние объявления обновляется по listing_id (цена, пробег и т.д.,
+    last_seen - время последней встречи), а в car_observations в том же запросе
+    добавляется наблюдение цены и пробега. Авто без listing_id пропускаются.
+    Секции истории за месяцы пачки должны существовать (ensure_history_partitions).
+    Новые объявления с VIN или госномером уже известного авто связываются с его
+    первым объявлением через relist_of.
+    """
+    # Одна команда не может обновить строку дважды - оставляем последнюю версию объявления
+    cars = list({car.listing_id: car for car in cars if car.listing_id is not None}.values())
+    if not cars:
+        conn.commit()
+        return 0, 0, 0
+    columns = ', '.join(CAR_COLUMNS)
+    updates = [f'{col} = EXCLUDED.{col}' for col in CAR_COLUMNS
+               if col not in _FIRST_SEEN_COLUMNS and col != 'phone_number']
+    # Телефон из backfill не затирается, если при повторном обходе его не запрашивали
+    updates.append('phone_number = COALESCE(EXCLUDED.phone_number, cars.phone_number)')
+    updates.append('last_seen = EXCLUDED.last_seen')
+    template = '(' + ', '.join(f"%s::{_COLUMN_TYPES.get(col, 'TEXT')}" for col in CAR_COLUMNS) + ')'
+    rows = [car.as_row() for car in cars]
+    with conn.cursor() as cur:
+        # xmax = 0 только у только что вставленных строк
+        written = execute_values(
+            cur,
+            f'''
+            WITH batch ({columns}) AS (VALUES %s),
+            history AS (
+                INSERT INTO car_observations (listing_id, observed_at, price_usd, odometer)
+                SELECT listing_id, datetime_found, price_usd, odometer FROM batch
+            )
+            INSERT INTO cars ({columns}, last_seen)
+            SELECT batch.*, datetime_found FROM batch
+            ON CONFLICT (listing_id) DO UPDATE SET {', '.join(updates)}
+            RETURNING listing_id, (xmax = 0);
+            ''',
+            rows,
+            template=template,
+            page_size=len(rows),
+            fetch=True,
+        )
+        new_ids = [car_id for car_id, is_new in written if is_new]
+        relisted = _link_relisted(cur, new_ids) if new_ids else 0
+    conn.commit()
+    return len(new_ids), len(written) - len(new_ids), relisted
+
+def _link_relisted(cur, new_ids):
+    """relist_of для новых объявлений авто, уже встречавшегося под другим ID (поиск по индексу identity_hash)"""
+    cur.execute('''
+        WITH earliest AS (
+            SELECT DISTINCT ON (n.listing_id) n.listing_id, COALESCE(o.relist_of, o.listing_id) AS root
+            FROM cars n
+            JOIN cars o ON o.identity_hash = n.identity_hash
+                AND (o.datetime_found, o.listing_id) < (n.datetime_found, n.listing_id)
+            WHERE n.listing_id = ANY(%s) AND n.identity_hash IS NOT NULL
+            ORDER BY n.listing_id, o.datetime_found, o.listing_id
+        )
+        UPDATE cars SET relist_of = earliest.root FROM earliest WHERE cars.listing_id = earliest.listing_id
+    ''', (new_ids,))
+    return cur.rowcount
+
+def touch_cars(cur, unchanged):
+    """Неизменившиеся объявления: last_seen и новый отпечаток страницы, без истории и upsert"""
+    execute_values(
+        cur,
+        '''
+        UPDATE cars SET last_seen = v.seen_at, content_hash = COALESCE(v.content_hash, cars.content_hash)
+        FROM (VALUES %s) AS v (listing_id, content_hash, seen_at)
+        WHERE cars.listing_id = v.listing_id
+        ''',
+        [(item.listing_id, item.content_hash, item.seen_at) for item in unchanged],
+        template='(%s::BIGINT, %s::BIGINT, %s::TIMESTAMP)',
+        page_size=len(unchanged),
+    )
+
+def write_cars(cars, mark_done=False, unchanged=()):
+    """Запись пачки авто через соединение из пула, возвращает (вставлено, обновлено, перевыставлено).
+
+    unchanged - объявления без изменений (UnchangedListing), у них обновляется только last_seen.
+    При mark_done ссылки отмечаются в crawl_frontier как done в той же транзакции,
+    поэтому после сбоя фронтир не расходится с таблицей cars.
+    """
+    # Секция нового месяца создаётся до транзакции записи (на стыке месяцев без расписания)
+    ensure_history_partitions({(car.datetime_found.year, car.datetime_found.month) for car in cars})
+    with pooled_conn() as conn:
+        with conn.cursor() as cur:
+            if mark_done:
+                cur.execute('''
+                    UPDATE crawl_frontier SET state = 'done', updated_at = now()
+                    WHERE url = ANY(%s)
+                ''', ([car.url for car in cars] + [item.url for item in unchanged],))
+            if unchanged:
+                touch_cars(cur, unchanged)
+        return insert_cars(conn, cars)
+
+def load_known_listings(recrawl_before=None):
+    """ID сохранённых объявлений: (свежие, устаревшие - последний раз встречены до recrawl_before)"""
+    fresh, stale = [], []
+    with pooled_conn() as conn:
+        # Именованный курсор читает таблицу порциями, не загружая все строки разом
+        with conn.cursor(name='known_listings') as cur:
+            cur.itersize = 10000
+            cur.execute('''
+                SELECT listing_id, COALESCE(last_seen, datetime_found)
+                FROM cars WHERE listing_id IS NOT NULL
+            ''')
+            for car_id, seen in cur:
+                if recrawl_before is not None and (seen is None or seen < recrawl_before):
+                    stale.append(car_id)
+                else:
+                    fresh.append(car_id)
+        conn.commit()
+    return fresh, stale
+
+def load_fingerprints():
+    """Отпечатки сохранённых объявлений: массивы listing_id (по возрастанию), content_hash, fields_hash.
+
+    Массивы int64 - 24 байта на объявление; отсутствующий отпечаток хранится как 0.
+    """
+    ids, content, fields = array('q'), array('q'), array('q')
+    with pooled_conn() as conn:
+        with conn.cursor(name='fingerprints') as cur:
+            cur.itersize = 10000
+            cur.execute('''
+                SELECT listing_id, COALESCE(content_hash, 0), COALESCE(fields_hash, 0) FROM cars
+                WHERE listing_id IS NOT NULL AND (content_hash IS NOT NULL OR fields_hash IS NOT NULL)
+                ORDER BY listing_id
+            ''')
+            for car_id, content_hash, fields_hash in cur:
+                ids.append(car_id)
+                content.append(content_hash)
+                fields.append(fields_hash)
+        conn.commit()
+    return ids, content, fields
+
+def select_known_ids(ids):
+    """Какие из переданных ID объявлений уже есть в cars (поиск по уникальному индексу)"""
+    with pooled_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute('SELECT listing_id FROM cars WHERE listing_id = ANY(%s)', (list(ids),))
+            known = {row[0] for row in cur.fetchall()}
+        conn.commit()
+    return known
+
+def try_run_lock(name):
+    """Межпроцессная блокировка запуска (advisory lock Postgres).
+
+    Возвращает отдельное соединение, которое держит блокировку до закрытия,
+    или None, если запуск с таким именем уже идёт в другом процессе.
+    """
+    conn = get_conn()
+    try:
+        with conn.cursor() as cur:
+            cur.execute('SELECT pg_try_advisory_lock(hashtext(%s))', (f'autoria:{name}',))
+            (locked,) = cur.fetchone()
+        conn.commit()
+    except Exception:
+        conn.close()
+        raise
+    if not locked:
+        conn.close()
+        return None
+    return conn
+
+def select_missing_phones(after_id, limit, retry_hours, max_attempts):
+    """Пачка (id, url) авто без телефона с id больше after_id.
+
+    Пропускаются авто, телефон которых уже запрашивался за последние retry_hours часов
+    или безуспешно max_attempts раз.
+    """
+    with pooled_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute('''
+                SELECT id, url FROM cars
+                WHERE phone_number IS NULL AND id > %s
+                    AND phone_attempts < %s
+                    AND (phone_checked_at IS NULL OR phone_checked_at < now() - %s * interval '1 hour')
+                ORDER BY id
+                LIMIT %s
+            ''', (after_id, max_attempts, retry_hours, limit))
+            rows = cur.fetchall()
+        conn.commit()
+    return rows
+
+def update_phones(pairs, missed=()):
+    """Пакетное обновление телефонов одним UPDATE ... FROM (VALUES ...);
+    у авто missed (телефон не найден) отмечается попытка"""
+    with pooled_conn() as conn:
+        with conn.cursor() as cur:
+            if pairs:
+                execute_values(
+                    cur,
+                    '''
+                    UPDATE cars SET phone_number = v.phone, phone_checked_at = now()
+                    FROM (VALUES %s) AS v(id, phone)
+                    WHERE cars.id = v.id
+                    ''',
+                    pairs,
+                    template='(%s::INTEGER, %s::BIGINT)',
+                    page_size=len(pairs),
+                )
+            if missed:
+                cur.execute('''
+                    UPDATE cars SET phone_checked_at = now(), phone_attempts = phone_attempts + 1
+                    WHERE id = ANY(%s)
+                ''', (list(missed),))
+        conn.commit()
+
+def load_dead_letters(kind, max_runs, keep_days):
+    """Ссылки из dead_letters, не исчерпавшие max_runs запусков, для повторной загрузки.
+
+    Ссылки других типов и не повторявшиеся keep_days дней удаляются.
+    """
+    with pooled_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute('''
+                DELETE FROM dead_letters WHERE kind <> %s OR failed_at < now() - %s * interval '1 day'
+            ''', (kind, keep_days))
+            cur.execute('''
+                SELECT url FROM dead_letters WHERE kind = %s AND runs < %s ORDER BY failed_at
+            ''', (kind, max_runs))
+            urls = [row[0] for row in cur.fetchall()]
+        conn.commit()
+    return urls
+
+def save_dead_letters(rows, resolved):
+    """Сохранение (url, kind, attempts, error) исчерпавших попытки и удаление загруженных повторно"""
+    with pooled_conn() as conn:
+        with conn.cursor() as cur:
+            if rows:
+                execute_values(cur, '''
+                    INSERT INTO dead_letters (url, kind, attempts, error) VALUES %s
+                    ON CONFLICT (url) DO UPDATE SET
+                        attempts = dead_letters.attempts + EXCLUDED.attempts,
+                        runs = dead_letters.runs + 1,
+                        error = EXCLUDED.error,
+                        failed_at = now()
+                ''', rows, page_size=len(rows))
+            if resolved:
+                cur.execute('DELETE FROM dead_letters WHERE url = ANY(%s)', (list(resolved),))
+        conn.commit()
+
+def _read_crawl_state(cur):
+    cur.execute('SELECT key, value FROM crawl_state')
+    return dict(cur.fetchall())
+
+def _write_crawl_state(cur, key, value):
+    cur.execute('''
+        INSERT INTO crawl_state (key, value) VALUES (%s, %s)
+        ON CONFLICT (key) DO UPDATE SET value = EXCLUDED.value
+    ''', (key, value))
+
+def frontier_open():
+    """Начало запуска: ссылки, оставшиеся in_progress после сбоя, возвращаются в pending.
+
+    Ссылки с действующей арендой воркеров не трогаются.
+    Возвращает (контрольные точки из crawl_state, количество ссылок по состояниям).
+    """
+    with pooled_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute('''
+                UPDATE crawl_frontier SET state = 'pending', updated_at = now()
+                WHERE state = 'in_progress' AND (leased_until IS NULL OR leased_until < now())
+            ''')
+            state = _read_crawl_state(cur)
+            cur.execute('SELECT state, count(*) FROM crawl_frontier GROUP BY state')
+            counts = dict(cur.fetchall())
+        conn.commit()
+    return state, counts
+
+def frontier_reset(started_at):
+    """Новый запуск: очистка фронтира и контрольных точек предыдущего"""
+    with pooled_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute('TRUNCATE crawl_frontier')
+            cur.execute('DELETE FROM crawl_state')
+            _write_crawl_state(cur, 'run_started', started_at)
+        conn.commit()
+
+def frontier_set(key, value):
+    """Запись контрольной точки запуска"""
+    with pooled_conn() as conn:
+        with conn.cursor() as cur:
+            _write_crawl_state(cur, key, value)
+        conn.commit()
+
+def frontier_add_page(page, urls, claim=True):
+    """Ссылки страницы выдачи и номер страницы как контрольная точка - одной транзакцией.
+
+    При claim возвращает ссылки, взятые в работу (in_progress), иначе - добавленные
+    как pending для воркеров; в обоих случаях в порядке выдачи, без уже известных фронтиру.
+    """
+    with pooled_conn() as conn:
+        with conn.cursor() as cur:
+            selected = set()
+            if urls:
+                added = execute_values(
+                    cur,
+                    'INSERT INTO crawl_frontier (url) VALUES %s ON CONFLICT (url) DO NOTHING RETURNING url',
+                    [(url,) for url in urls],
+                    page_size=len(urls),
+                    fetch=True,
+                )
+                selected = {url for (url,) in added}
+                if claim:
+                    cur.execute('''
+                        UPDATE crawl_frontier SET state = 'in_progress', updated_at = now()
+                        WHERE url = ANY(%s) AND state = 'pending'
+                        RETURNING url
+                    ''', (urls,))
+                    selected = {url for (url,) in cur.fetchall()}
+            _write_crawl_state(cur, 'listing_page', str(page))
+        conn.commit()
+    return [url for url in urls if url in selected]
+
+def frontier_claim(limit, worker=None, lease_seconds=None):
+    """Пачка ожидающих ссылок, переведённых в in_progress.
+
+    С lease_seconds ссылки арендуются воркером на это время; ссылки с истёкшей арендой
+    (воркер упал или завис) забираются заново. SKIP LOCKED не даёт воркерам ждать друг друга.
+    """
+    with pooled_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute('''
+                UPDATE crawl_frontier
+                SET state = 'in_progress', worker = %(worker)s, updated_at = now(),
+                    leased_until = now() + %(lease)s::INTEGER * INTERVAL '1 second'
+                WHERE url IN (
+                    SELECT url FROM crawl_frontier
+                    WHERE state = 'pending'
+                       OR (%(lease)s::INTEGER IS NOT NULL AND state = 'in_progress' AND leased_until < now())
+                    ORDER BY updated_at
+                    LIMIT %(limit)s
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING url
+            ''', {'worker': worker, 'lease': lease_seconds, 'limit': limit})
+            urls = [url for (url,) in cur.fetchall()]
+        conn.commit()
+    return urls
+
+def frontier_mark_failed(urls):
+    """Отметка ссылок, которые не удалось загрузить или разобрать"""
+    with pooled_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute('''
+                UPDATE crawl_frontier SET state = 'failed', attempts = attempts + 1, updated_at = now()
+                WHERE url = ANY(%s)
+            ''', (list(urls),))
+        conn.commit()
+
+def frontier_progress():
+    """Контрольные точки запуска и количество ссылок по состояниям (без изменения фронтира)"""
+    with pooled_conn() as conn:
+        with conn.cursor() as cur:
+            state = _read_crawl_state(cur)
+            cur.execute('SELECT state, count(*) FROM crawl_frontier GROUP BY state')
+            counts = dict(cur.fetchall())
+        conn.commit()
+    return state, counts
+
+def frontier_counts():
+    """Количество ссылок фронтира по состояниям"""
+    with pooled_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute('SELECT state, count(*) FROM crawl_frontier GROUP BY state')
+            counts = dict(cur.fetchall())
+        conn.commit()
+    return counts
+
+class CarWriter:
+    """Буферизованная запись авто: сброс пачкой по размеру или по времени.
+
+    Запись выполняется в пуле потоков БД (run_db), поэтому event loop не блокируется.
+    """
+
+    def __init__(self, flush_size=DB_FLUSH_SIZE, flush_interval=DB_FLUSH_INTERVAL, mark_done=False):
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        # Отмечать записанные ссылки в crawl_frontier как done (FRONTIER=1)
+        self.mark_done = mark_done
+        self.buffer = []
+        # Объявления без изменений (UnchangedListing) - сбрасываются вместе с буфером
+        self.unchanged = []
+        self.last_flush = time.monotonic()
+        self.inserted = 0
+        self.updated = 0
+        self.skipped = 0
+        self.touched = 0
+        self.relisted = 0
+        self.failed = 0
+
+    async def add(self, car):
+        """Добавление авто (или неизменившегося объявления) в буфер, сброс при достижении порога"""
+        if isinstance(car, UnchangedListing):
+            self.unchanged.append(car)
+        else:
+            self.buffer.append(car)
+        if len(self.buffer) + len(self.unchanged) >= self.flush_size:
+            await self.flush()
+        else:
+            await self.flush_if_due()
+
+    async def flush_if_due(self):
+        """Сброс буфера, если с прошлого сброса прошло flush_interval секунд"""
+        if (self.buffer or self.unchanged) and time.monotonic() - self.last_flush >= self.flush_interval:
+            await self.flush()
+
+    async def flush(self):
+        """Запись буфера в БД, возвращает (вставлено, пропущено)"""
+        batch, self.buffer = self.buffer, []
+        unchanged, self.unchanged = self.unchanged, []
+        self.last_flush = time.monotonic()
+        if not batch and not unchanged:
+            return 0, 0
+        with STAGE_SECONDS.time(stage='db_write'):
+            inserted, updated, relisted, written, unchanged = await self._write(batch, unchanged)
+        if not written and not unchanged:
+            return 0, 0
+        skipped = len(written) - inserted - updated
+        self.inserted += inserted
+        self.updated += updated
+        self.skipped += skipped
+        self.touched += len(unchanged)
+        self.relisted += relisted
+        CARS.inc(inserted, result='inserted')
+        CARS.inc(updated, result='updated')
+        CARS.inc(skipped, result='duplicate')
+        CARS.inc(relisted, result='relisted')
+        print(f"Запись в БД: вставлено {inserted}, обновлено {updated}, без изменений {len(unchanged)}, "
+              f"пропущено (дубли, без ID) {skipped}" + (f", перевыставлено {relisted}" if relisted else ''))
+        return inserted, skipped
+
+    async def _write(self, batch, unchanged):
+        """Запись пачки; при ошибке пачка делится пополам, так что теряются только строки,
+        которые не записываются и поодиночке (выход за диапазон типа, ограничение и т.п.).
+
+        Возвращает (вставлено, обновлено, перевыставлено, записанные авто, записанные без изменений).
+        """
+        try:
+            inserted, updated, relisted = await run_db(write_cars, batch, self.mark_done, unchanged)
+            return inserted, updated, relisted, batch, unchanged
+        except Exception as e:
+            import psycopg2
+
+            items = batch + unchanged
+            if isinstance(e, (psycopg2.OperationalError, psycopg2.InterfaceError)):
+                # БД недоступна - деление пачки не поможет
+                self.failed += len(items)
+                CARS.inc(len(items), result='db_failed')
+                print(f"Ошибка пакетной записи в БД ({len(items)} строк): {e}")
+                return 0, 0, 0, [], []
+            if len(items) == 1:
+                self.failed += 1
+                CARS.inc(result='db_failed')
+                log_event(logging.ERROR, 'db_row_failed', url=items[0].url, listing_id=items[0].listing_id,
+                          error=repr(e))
+                return 0, 0, 0, [], []
+            print(f"Ошибка пакетной записи в БД ({len(items)} строк), запись по частям: {e}")
+        totals = [0, 0, 0, [], []]
+        middle = len(items) // 2
+        for part in (items[:middle], items[middle:]):
+            result = await self._write([item for item in part if not isinstance(item, UnchangedListing)],
+                                       [item for item in part if isinstance(item, UnchangedListing)])
+            for i, value in enumerate(result):
+                totals[i] += value
+        return tuple(totals)
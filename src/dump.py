@@ -1,19 +1,51 @@
 import os
-from datetime import datetime
+import shutil
+from datetime import datetime, timedelta
 from dotenv import load_dotenv
 import subprocess
 
 load_dotenv()
 
+# Формат дампа: custom (один файл, -F c) или directory (каталог, -F d, параллельно в DUMP_JOBS потоков)
+DUMP_FORMAT = os.getenv('DUMP_FORMAT', 'custom')
+DUMP_JOBS = int(os.getenv('DUMP_JOBS', '4'))
+# Хранение дампов: сколько последних оставлять и максимальный возраст в днях (0 - без ограничения)
+DUMP_KEEP = int(os.getenv('DUMP_KEEP', '7'))
+DUMP_KEEP_DAYS = float(os.getenv('DUMP_KEEP_DAYS', '0'))
+
+DUMPS_DIR = os.path.join(os.path.dirname(__file__), '..', 'dumps')
+
+def prune_dumps(dumps_dir=DUMPS_DIR, keep=DUMP_KEEP, keep_days=DUMP_KEEP_DAYS):
+    """Удаление старых дампов (файлов и каталогов dump_*) сверх лимита по количеству и возрасту"""
+    # Имена содержат время создания, поэтому сортировка по имени - по возрасту
+    dumps = sorted(name for name in os.listdir(dumps_dir) if name.startswith('dump_'))
+    expired = dumps[:-keep] if keep > 0 else []
+    if keep_days > 0:
+        cutoff = datetime.now() - timedelta(days=keep_days)
+        for name in dumps:
+            path = os.path.join(dumps_dir, name)
+            if datetime.fromtimestamp(os.path.getmtime(path)) < cutoff and name not in expired:
+                expired.append(name)
+    for name in expired:
+        path = os.path.join(dumps_dir, name)
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        else:
+            os.remove(path)
+        print(f'Удалён старый дамп: {name}')
+
 def dump_db():
     db = os.getenv('POSTGRES_DB')
     user = os.getenv('POSTGRES_USER')
     password = os.getenv('POSTGRES_PASSWORD') or ''
     host = os.getenv('POSTGRES_HOST')
     port = os.getenv('POSTGRES_PORT')
-    dumps_dir = os.path.join(os.path.dirname(__file__), '..', 'dumps')
+    dumps_dir = DUMPS_DIR
     os.makedirs(dumps_dir, exist_ok=True)
-    filename = f"dump_{datetime.now().strftime('%Y%m%d_%H%M%S')}.sql"
+    if DUMP_FORMAT == 'directory':
+        filename = f"dump_{datetime.now().strftime('%Y%m%d_%H%M%S')}.dir"
+    else:
+        filename = f"dump_{datetime.now().strftime('%Y%m%d_%H%M%S')}.sql"
     filepath = os.path.join(dumps_dir, filename)
     print(f'Создание дампа БД: {filepath}')
     # Создаём .pgpass
@@ -28,7 +60,13 @@ def dump_db():
         '-p', str(port),
         '-U', user,
         '-d', db,
-        '-F', 'c',
+    ]
+    if DUMP_FORMAT == 'directory':
+        # Таблицы выгружаются параллельно; восстановление: pg_restore -j N -d <db> <каталог>
+        cmd += ['-F', 'd', '-j', str(DUMP_JOBS)]
+    else:
+        cmd += ['-F', 'c']
+    cmd += [
         '-b',
         '-v',
         '-f', filepath
@@ -37,3 +75,10 @@ def dump_db():
         subprocess.run(cmd, check=True)
     except Exception as e:
         print(f'Ошибка дампа: {e}')
+        # Неполный дамп не должен вытеснить удачные при очистке
+        if os.path.isdir(filepath):
+            shutil.rmtree(filepath)
+        elif os.path.exists(filepath):
+            os.remove(filepath)
+        return
+    prune_dumps(dumps_dir)
@@ -0,0 +1,212 @@
+import gzip
+import os
+from datetime import datetime, timedelta
+from dotenv import load_dotenv
+from db import pooled_conn
+
+load_dotenv()
+
+# Каталог выгрузок и формат: csv, jsonl или parquet (нужен pyarrow)
+EXPORT_DIR = os.getenv('EXPORT_DIR') or os.path.join(os.path.dirname(__file__), '..', 'dumps', 'export')
+EXPORT_FORMAT = os.getenv('EXPORT_FORMAT', 'csv')
+# Размер одной части до сжатия (МБ) и строк в части для parquet
+EXPORT_CHUNK_MB = float(os.getenv('EXPORT_CHUNK_MB', '64'))
+EXPORT_CHUNK_ROWS = int(os.getenv('EXPORT_CHUNK_ROWS', '500000'))
+EXPORT_GZIP_LEVEL = int(os.getenv('EXPORT_GZIP_LEVEL', '6'))
+# Выгружаются только строки старше N секунд: авто с более поздним datetime_found
+# могут ещё лежать в буфере записи, и водяной знак не должен их перепрыгнуть
+EXPORT_SETTLE_SECONDS = float(os.getenv('EXPORT_SETTLE_SECONDS', '600'))
+
+EXPORT_NAME = 'cars'
+EXPORT_COLUMNS = (
+    'id', 'listing_id', 'url', 'title', 'price_usd', 'odometer', 'username', 'phone_number',
+    'image_url', 'images_count', 'car_number', 'car_vin', 'datetime_found', 'last_seen',
+)
+
+class ChunkedGzipWriter:
+    """Файловый объект для COPY TO: пишет поток в сжатые части фиксированного размера.
+
+    COPY отдаёт данные построчно (одна строка - один вызов write), поэтому части
+    переключаются только на границе строк; заголовок CSV повторяется в каждой части.
+    Часть пишется во временный файл .part и переименовывается после закрытия.
+    """
+
+    def __init__(self, prefix, suffix, chunk_bytes, header=False):
+        self.prefix = prefix
+        self.suffix = suffix
+        self.chunk_bytes = chunk_bytes
+        self.expect_header = header
+        self.header = b''
+        self.file = None
+        self.path = None
+        self.size = 0
+        self.rows = 0
+        self.paths = []
+
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        if self.expect_header:
+            self.header, self.expect_header = data, False
+            return
+        if self.file is None:
+            self._open()
+        self.file.write(data)
+        self.size += len(data)
+        self.rows += 1
+        if self.size >= self.chunk_bytes:
+            self._close()
+
+    def _open(self):
+        self.path = f'{self.prefix}_{len(self.paths) + 1:04d}{self.suffix}'
+        self.file = gzip.open(self.path + '.part', 'wb', compresslevel=EXPORT_GZIP_LEVEL)
+        self.file.write(self.header)
+        self.size = len(self.header)
+
+    def _close(self):
+        self.file.close()
+        os.replace(self.path + '.part', self.path)
+        self.paths.append(self.path)
+        self.file = None
+
+    def close(self):
+        if self.file is not None:
+            self._close()
+
+    def discard(self):
+        """Удаление недописанной части после ошибки"""
+        if self.file is not None:
+            self.file.close()
+            os.remove(self.path + '.part')
+            self.file = None
+
+def _read_watermark(cur):
+    cur.execute('SELECT watermark FROM export_state WHERE name = %s', (EXPORT_NAME,))
+    row = cur.fetchone()
+    return row[0] if row else None
+
+def _write_watermark(cur, watermark):
+    cur.execute('''
+        INSERT INTO export_state (name, watermark, updated_at) VALUES (%s, %s, now())
+        ON CONFLICT (name) DO UPDATE SET watermark = EXCLUDED.watermark, updated_at = now()
+    ''', (EXPORT_NAME, watermark))
+
+def _select_sql(cur, since, until):
+    columns = ', '.join(EXPORT_COLUMNS)
+    condition = 'datetime_found <= %s' if since is None else 'datetime_found > %s AND datetime_found <= %s'
+    params = (until,) if since is None else (since, until)
+    return cur.mogrify(f'SELECT {columns} FROM cars WHERE {condition} ORDER BY datetime_found, id',
+                       params).decode('utf-8')
+
+def _copy_text(cur, select, fmt, writer):
+    if fmt == 'csv':
+        cur.copy_expert(f'COPY ({select}) TO STDOUT WITH (FORMAT csv, HEADER)', writer)
+    else:
+        # CSV с символами-разделителями, которых нет в JSON: строки уходят без кавычек и экранирования
+        cur.copy_expert(
+            f"COPY (SELECT row_to_json(t) FROM ({select}) t) TO STDOUT "
+            f"WITH (FORMAT csv, QUOTE E'\\x01', DELIMITER E'\\x02')",
+            writer,
+        )
+
+def _copy_parquet(conn, select, prefix):
+    """Колоночный формат: строки читаются именованным курсором порциями, по группе строк на порцию"""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise RuntimeError('EXPORT_FORMAT=parquet требует пакет pyarrow') from e
+
+    schema = pa.schema([
+        ('id', pa.int64()), ('listing_id', pa.int64()), ('url', pa.string()), ('title', pa.string()),
+        ('price_usd', pa.float64()), ('odometer', pa.int64()), ('username', pa.string()), ('phone_number', pa.int64()),
+        ('image_url', pa.string()), ('images_count', pa.int64()), ('car_number', pa.string()),
+        ('car_vin', pa.string()), ('datetime_found', pa.timestamp('us')), ('last_seen', pa.timestamp('us')),
+    ])
+    price = EXPORT_COLUMNS.index('price_usd')
+    paths, rows, writer, path = [], 0, None, None
+    batch_rows = min(EXPORT_CHUNK_ROWS, 50000)
+    try:
+        with conn.cursor(name='export_cars') as cur:
+            cur.itersize = batch_rows
+            cur.execute(select)
+            while True:
+                batch = cur.fetchmany(batch_rows)
+                if not batch:
+                    break
+                if writer is None:
+                    path = f'{prefix}_{len(paths) + 1:04d}.parquet'
+                    writer = pq.ParquetWriter(path + '.part', schema, compression='zstd')
+                    chunk_rows = 0
+                columns = list(zip(*batch))
+                columns[price] = [None if value is None else float(value) for value in columns[price]]
+                writer.write_table(pa.Table.from_arrays(
+                    [pa.array(values, type=field.type) for values, field in zip(columns, schema)],
+                    schema=schema))
+                rows += len(batch)
+                chunk_rows += len(batch)
+                if chunk_rows >= EXPORT_CHUNK_ROWS:
+                    writer.close()
+                    os.replace(path + '.part', path)
+                    paths.append(path)
+                    writer = None
+        if writer is not None:
+            writer.close()
+            os.replace(path + '.part', path)
+            paths.append(path)
+            writer = None
+    finally:
+        if writer is not None:
+            writer.close()
+            os.remove(path + '.part')
+    return paths, rows
+
+def export_cars(fmt=EXPORT_FORMAT, full=False):
+    """Выгрузка авто, найденных после водяного знака, потоком через COPY TO STDOUT.
+
+    Строки не накапливаются в памяти: COPY пишет их напрямую в сжатые части.
+    Водяной знак сдвигается в той же транзакции только после записи всех частей,
+    поэтому прерванная выгрузка при следующем запуске повторяется целиком.
+    full=True выгружает всю таблицу, не учитывая и не сдвигая водяной знак.
+    """
+    if fmt not in ('csv', 'jsonl', 'parquet'):
+        raise ValueError(f'Неизвестный формат выгрузки: {fmt}')
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    # Недописанные части прерванных выгрузок
+    for name in os.listdir(EXPORT_DIR):
+        if name.endswith('.part'):
+            os.remove(os.path.join(EXPORT_DIR, name))
+
+    until = datetime.now() - timedelta(seconds=EXPORT_SETTLE_SECONDS)
+    with pooled_conn() as conn:
+        with conn.cursor() as cur:
+            since = None if full else _read_watermark(cur)
+            select = _select_sql(cur, since, until)
+        if since is not None and since >= until:
+            conn.commit()
+            print('Выгрузка: новых строк нет')
+            return []
+
+        label = 'full' if since is None else since.strftime('%Y%m%d_%H%M%S')
+        prefix = os.path.join(EXPORT_DIR, f"{EXPORT_NAME}_{label}_{until.strftime('%Y%m%d_%H%M%S')}")
+        print(f'Выгрузка {fmt}: строки с datetime_found в ({since}, {until}]')
+        if fmt == 'parquet':
+            paths, rows = _copy_parquet(conn, select, prefix)
+        else:
+            writer = ChunkedGzipWriter(prefix, f'.{fmt}.gz', int(EXPORT_CHUNK_MB * 1024 * 1024),
+                                       header=fmt == 'csv')
+            try:
+                with conn.cursor() as cur:
+                    _copy_text(cur, select, fmt, writer)
+                writer.close()
+            except Exception:
+                writer.discard()
+                raise
+            paths, rows = writer.paths, writer.rows
+        if not full:
+            with conn.cursor() as cur:
+                _write_watermark(cur, until)
+        conn.commit()
+
+    print(f'Выгрузка завершена: {rows} строк, файлов: {len(paths)}')
+    return paths
@@ -0,0 +1,239 @@
+import re
+from bisect import bisect_right
+import soupsieve as sv
+
+# Декларативное описание полей: селекторы перечислены в порядке приоритета (fallback),
+# как в safe_parse_* из scraper.py
+FIELD_SELECTORS = {
+    'title': ['h1', '.auto-head_title', '.head-title'],
+    'price_usd': ['.price_value', '.price-ticket', '[data-currency="USD"]', '.auto-price_value'],
+    'odometer': ['[data-name="race"]', '.item_params .race'],
+    'username': ['.seller_info_name', '.seller-name', '[data-name="seller_name"]', '.auto-seller_name'],
+    'image_url': ['.outline.m-auto', '.photo-620x465', '.gallery-main img', '.auto-photo img'],
+    'images': ['img[src*="cdn"], img[data-src*="cdn"]'],
+    'details': ['.item_params .label', '.auto-params .label', '[data-name="tech_params"] .label'],
+    # ID продавца для кэша телефонов (атрибут первого найденного элемента)
+    'seller_id': ['[data-user-id]', '[data-seller-id]'],
+}
+
+# Правая часть селектора: тег, классы и атрибуты, которые обязан иметь подходящий элемент
+_COMPOUND_RE = re.compile(r'([^\s>+~]+)\s*$')
+_TAG_RE = re.compile(r'^([a-zA-Z][\w-]*)')
+_CLASS_RE = re.compile(r'\.([\w-]+)')
+_ATTR_RE = re.compile(r'\[([\w-]+)')
+
+def _index_key(selector):
+    """Ключ для предварительного отбора кандидатов: ('name'|'class'|'attr', значение)"""
+    compound = _COMPOUND_RE.search(selector.strip()).group(1)
+    classes = _CLASS_RE.findall(compound)
+    if classes:
+        return 'class', classes[0].lower()
+    attrs = _ATTR_RE.findall(compound)
+    if attrs:
+        return 'attr', attrs[0].lower()
+    tag = _TAG_RE.match(compound)
+    if tag:
+        return 'name', tag.group(1).lower()
+    return None, None
+
+class CompiledSpec:
+    """Скомпилированные селекторы полей с индексом для одного прохода по дереву"""
+
+    def __init__(self, field_selectors):
+        self.selectors = []  # (поле, приоритет, скомпилированный селектор)
+        self.by_name, self.by_class, self.by_attr = {}, {}, {}
+        self.unindexed = []
+        for field, selectors in field_selectors.items():
+            for priority, selector in enumerate(selectors):
+                sel_id = len(self.selectors)
+                self.selectors.append((field, priority, sv.compile(selector)))
+                # Группы через запятую индексируем по каждой альтернативе
+                for alternative in selector.split(','):
+                    kind, key = _index_key(alternative)
+                    index = {'name': self.by_name, 'class': self.by_class, 'attr': self.by_attr}.get(kind)
+                    if index is None:
+                        self.unindexed.append(sel_id)
+                    else:
+                        index.setdefault(key, []).append(sel_id)
+
+    def candidates(self, tag):
+        """ID селекторов, которым элемент может соответствовать (необходимое условие)"""
+        found = set(self.unindexed)
+        found.update(self.by_name.get(tag.name, ()))
+        for name, value in tag.attrs.items():
+            found.update(self.by_attr.get(name.lower(), ()))
+            if name == 'class':
+                for cls in value:
+                    found.update(self.by_class.get(cls.lower(), ()))
+        return found
+
+SPEC = CompiledSpec(FIELD_SELECTORS)
+
+class _Scan:
+    """Результат одного прохода: элементы в порядке документа и совпадения селекторов"""
+
+    def __init__(self, soup, spec):
+        self.tags = soup.find_all(True)
+        self.matches = [[] for _ in spec.selectors]
+        self.span_positions = []
+        self.mileage_div = None
+        self.data_id_div = None
+        for pos, tag in enumerate(self.tags):
+            name = tag.name
+            if name == 'span':
+                self.span_positions.append(pos)
+            elif name == 'div':
+                if self.mileage_div is None:
+                    string = tag.string
+                    if isinstance(string, str) and 'Пробег' in string:
+                        self.mileage_div = pos
+                if self.data_id_div is None and tag.has_attr('data-id'):
+                    self.data_id_div = pos
+            for sel_id in spec.candidates(tag):
+                if spec.selectors[sel_id][2].match(tag):
+                    self.matches[sel_id].append(pos)
+        self.by_field = {}
+        for sel_id, (field, priority, _) in enumerate(spec.selectors):
+            self.by_field.setdefault(field, []).append(self.matches[sel_id])
+
+    def first(self, field):
+        """Первые совпадения каждого селектора поля в порядке приоритета (как select_one)"""
+        for positions in self.by_field[field]:
+            if positions:
+                yield self.tags[positions[0]]
+
+    def next_span(self, pos):
+        """Аналог find_next('span'): первый span после элемента в порядке документа"""
+        i = bisect_right(self.span_positions, pos)
+        if i < len(self.span_positions):
+            return self.tags[self.span_positions[i]]
+        return None
+
+def _text(scan, field):
+    for tag in scan.first(field):
+        return tag.get_text(strip=True)
+    return None
+
+def _price(scan):
+    for tag in scan.first('price_usd'):
+        price_clean = re.sub(r'[^\d]', '', tag.get_text(strip=True))
+        if price_clean.isdigit():
+            return int(price_clean)
+    return None
+
+def _odometer(scan, parse_odometer):
+    candidates = []
+    if scan.mileage_div is not None:
+        candidates.append(scan.mileage_div)
+    for positions in scan.by_field['odometer']:
+        if positions:
+            candidates.append(positions[0])
+    for pos in candidates:
+        odometer_text = None
+        next_span = scan.next_span(pos)
+        if next_span:
+            odometer_text = next_span.get_text(strip=True)
+        if not odometer_text:
+            odometer_text = scan.tags[pos].get_text(strip=True)
+        if odometer_text:
+            return parse_odometer(odometer_text)
+    return None
+
+def _images(scan):
+    image_url = None
+    for tag in scan.first('image_url'):
+        src = tag.get('src') or tag.get('data-src')
+        if src:
+            image_url = src
+            break
+    images_count = 0
+    for pos in scan.by_field['images'][0]:
+        img = scan.tags[pos]
+        if 'photo' in (img.get('src', '') + img.get('data-src', '')):
+            images_count += 1
+    return image_url, images_count
+
+def _details(scan):
+    car_number = None
+    car_vin = None
+    # Порядок как у safe_parse_car_details: по селекторам, внутри - по документу; побеждает последнее
+    for positions in scan.by_field['details']:
+        for pos in positions:
+            label_text = scan.tags[pos].get_text()
+            if 'Номер кузова' in label_text or 'VIN' in label_text:
+                next_span = scan.next_span(pos)
+                if next_span:
+                    car_vin = next_span.get_text(strip=True)
+            if 'Госномер' in label_text or 'номер' in label_text.lower():
+                next_span = scan.next_span(pos)
+                if next_span:
+                    car_number = next_span.get_text(strip=True)
+    return car_number, car_vin
+
+def _safe(func, default, *args):
+    # Ошибка в одном поле не должна ломать остальные - как try/except в safe_parse_*
+    try:
+        return func(*args)
+    except Exception:
+        return default
+
+def extract_car_fields(soup, parse_odometer):
+    """Все поля страницы авто за один проход по дереву.
+
+    Результат совпадает с последовательным вызовом safe_parse_* из scraper.py,
+    плюс data_id - атрибут первого div[data-id] для определения ID объявления
+    и seller_id - ID продавца, если он есть в разметке.
+    """
+    scan = _Scan(soup, SPEC)
+    image_url, images_count = _safe(_images, (None, 0), scan)
+    car_number, car_vin = _safe(_details, (None, None), scan)
+    data_id = None
+    if scan.data_id_div is not None:
+        data_id = scan.tags[scan.data_id_div].get('data-id')
+    seller_id = None
+    for tag in scan.first('seller_id'):
+        seller_id = tag.get('data-user-id') or tag.get('data-seller-id')
+        break
+    return {
+        'title': _safe(_text, None, scan, 'title'),
+        'price_usd': _safe(_price, None, scan),
+        'odometer': _safe(_odometer, None, scan, parse_odometer),
+        'username': _safe(_text, None, scan, 'username'),
+        'image_url': image_url,
+        'images_count': images_count,
+        'car_number': car_number,
+        'car_vin': car_vin,
+        'data_id': data_id,
+        'seller_id': seller_id,
+    }
+
+def car_fields_from_json(data):
+    """Поля авто из ответа searchPage/v2/view/auto/{id}: те же ключи, что у extract_car_fields,
+    плюс car_id и телефон. Отсутствующие в ответе поля - None (их можно взять из HTML).
+    """
+    auto = data.get('autoData') or {}
+    user = data.get('userInfo') or {}
+    photos = data.get('photoData') or {}
+    title = data.get('title')
+    if not title and (data.get('markName') or data.get('modelName')):
+        parts = [data.get('markName'), data.get('modelName'), auto.get('year')]
+        title = ' '.join(str(part) for part in parts if part)
+    price = data.get('USD')
+    race = auto.get('raceInt')
+    car_id = auto.get('autoId') or data.get('autoId')
+    seller_id = data.get('userId')
+    phone = user.get('phone')
+    return {
+        'car_id': str(car_id) if car_id else None,
+        'title': title,
+        'price_usd': int(price) if isinstance(price, (int, float)) else None,
+        # raceInt - пробег в тысячах км, как "95 тыс. км" на странице
+        'odometer': race * 1000 if isinstance(race, int) else None,
+        'username': user.get('name') or data.get('userName') or None,
+        'image_url': photos.get('seoLinkF') or None,
+        'images_count': photos.get('count'),
+        'car_number': data.get('plateNumber') or None,
+        'car_vin': data.get('VIN') or None,
+        'seller_id': str(seller_id) if seller_id else None,
+        'phone': re.sub(r'\D', '', phone) if phone else None,
+    }
@@ -0,0 +1,97 @@
+import hashlib
+import os
+import re
+from bisect import bisect_left
+from datetime import datetime
+from dotenv import load_dotenv
+from db import UnchangedListing, load_fingerprints, run_db
+from incremental import listing_id
+
+load_dotenv()
+
+# Отпечатки содержимого: объявление, которое не изменилось с прошлой записи,
+# не разбирается, телефон не запрашивается, в БД обновляется только last_seen
+FINGERPRINT = os.getenv('FINGERPRINT', '0') == '1'
+# Дополнительные изменчивые фрагменты страницы (регулярное выражение), не влияющие на отпечаток:
+# счётчики просмотров, токены и т.п. Скрипты, стили, комментарии и пробелы отбрасываются всегда
+FINGERPRINT_IGNORE = os.getenv('FINGERPRINT_IGNORE', '')
+
+_VOLATILE_RE = re.compile(
+    r'<script\b.*?</script>|<style\b.*?</style>|<!--.*?-->'
+    + (f'|{FINGERPRINT_IGNORE}' if FINGERPRINT_IGNORE else ''),
+    re.S | re.I,
+)
+
+# Поля авто, из которых складывается отпечаток полей (телефон и даты не входят)
+FINGERPRINT_FIELDS = ('title', 'price_usd', 'odometer', 'username', 'image_url', 'images_count',
+                      'car_number', 'car_vin')
+
+def _hash(data):
+    # 64-битный blake2b со знаком - помещается в BIGINT
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), 'big', signed=True)
+
+def content_hash(html):
+    """Отпечаток нормализованной страницы: без скриптов, стилей, комментариев и лишних пробелов"""
+    # split/join схлопывает пробелы вчетверо быстрее регулярного выражения
+    return _hash(' '.join(_VOLATILE_RE.sub('', html).split()).encode('utf-8'))
+
+def fields_hash(fields):
+    """Отпечаток извлечённых полей авто"""
+    return _hash(repr(tuple(fields.get(field) for field in FINGERPRINT_FIELDS)).encode('utf-8'))
+
+class Fingerprints:
+    """Отпечатки сохранённых объявлений и счётчики решений.
+
+    Проверка в два шага: отпечаток страницы совпал - разбор не нужен; страница изменилась,
+    но поля совпали (сменилась реклама, счётчик и т.п.) - не нужны телефон и upsert.
+    """
+
+    def __init__(self, ids, content, fields):
+        self.ids = ids
+        self.content = content
+        self.fields = fields
+        self.counts = {'unchanged': 0, 'same_fields': 0, 'changed': 0, 'new': 0}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _find(self, car_id):
+        if car_id is None:
+            return None
+        i = bisect_left(self.ids, car_id)
+        return i if i < len(self.ids) and self.ids[i] == car_id else None
+
+    def check_page(self, url, html):
+        """(UnchangedListing или None, отпечаток страницы)"""
+        car_id = listing_id(url)
+        content = content_hash(html)
+        i = self._find(car_id)
+        if i is not None and self.content[i] == content:
+            self.counts['unchanged'] += 1
+            return UnchangedListing(car_id, url, None, datetime.now()), content
+        return None, content
+
+    def check_fields(self, url, parsed):
+        """Отпечаток полей записывается в parsed; UnchangedListing, если поля не изменились"""
+        car_id = listing_id(url)
+        parsed['fields_hash'] = fields_hash(parsed)
+        i = self._find(car_id)
+        if i is None:
+            self.counts['new'] += 1
+            return None
+        if self.fields[i] == parsed['fields_hash']:
+            self.counts['same_fields'] += 1
+            return UnchangedListing(car_id, url, parsed.get('content_hash'), datetime.now())
+        self.counts['changed'] += 1
+        return None
+
+    def summary(self):
+        return (f"без изменений: {self.counts['unchanged']}, изменилась только страница: "
+                f"{self.counts['same_fields']}, изменились поля: {self.counts['changed']}, "
+                f"новых: {self.counts['new']}")
+
+async def load_fingerprint_index():
+    """Загрузка отпечатков сохранённых объявлений из таблицы cars"""
+    fingerprints = Fingerprints(*await run_db(load_fingerprints))
+    print(f'Отпечатки: в БД {len(fingerprints)} объявлений с отпечатком')
+    return fingerprints
@@ -0,0 +1,87 @@
+import asyncio
+import logging
+import os
+from datetime import datetime
+from dotenv import load_dotenv
+from db import run_db, try_run_lock
+from metrics import FRESHNESS_LAG, log_event
+
+load_dotenv()
+
+# Выдача для коротких проходов: должна быть отсортирована от новых к старым
+FRESH_START_URL = os.getenv('FRESH_START_URL') or os.getenv('START_URL')
+# Интервал коротких проходов в минутах (SCHEDULE_MODE=continuous)
+FRESH_INTERVAL = float(os.getenv('FRESH_INTERVAL', '5'))
+# Максимум страниц за проход и сколько страниц подряд без новых объявлений означают,
+# что проход дошёл до уже известных
+FRESH_MAX_PAGES = int(os.getenv('FRESH_MAX_PAGES', '20'))
+FRESH_STOP_PAGES = max(1, int(os.getenv('FRESH_STOP_PAGES', '1')))
+
+async def run_exclusive(name, func, *args):
+    """Запуск задачи, если такая же не выполняется (в этом или другом процессе).
+
+    Блокировка держится на отдельном соединении Postgres, поэтому перезапуск сервиса,
+    ручной --run-once и второй контейнер не обходят сайт одновременно с расписанием.
+    """
+    lock = await run_db(try_run_lock, name)
+    if lock is None:
+        print(f'Пропуск {name}: предыдущий запуск ещё не завершён')
+        return None
+    try:
+        return await func(*args)
+    finally:
+        await asyncio.to_thread(lock.close)
+
+def _percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+class FreshnessLag:
+    """Задержка обнаружения новых объявлений коротким проходом.
+
+    Даты публикации на странице нет, поэтому задержка оценивается сверху: объявление,
+    которого не было в прошлом завершённом проходе, появилось не раньше его начала.
+    Задержка = datetime_found - начало последнего прохода, дошедшего до известных объявлений.
+    После перезапуска сервиса первый проход задержку не оценивает.
+    """
+
+    def __init__(self):
+        self.since = None
+        self.lags = []
+
+    def start_pass(self):
+        self.lags = []
+        return datetime.now()
+
+    def wrap(self, writer):
+        """Буфер записи, учитывающий задержку каждого сохраняемого авто"""
+        return _LagWriter(self, writer)
+
+    def observe(self, car):
+        if self.since is None:
+            return
+        lag = max(0.0, (car.datetime_found - self.since).total_seconds())
+        self.lags.append(lag)
+        FRESHNESS_LAG.observe(lag)
+        log_event(logging.INFO, 'freshness_lag', url=car.url, lag_s=round(lag, 1))
+
+    def finish_pass(self, started_at, complete):
+        """Итог прохода; начало завершённого прохода становится точкой отсчёта следующего"""
+        estimated = self.since is not None
+        if complete:
+            self.since = started_at
+        if not self.lags:
+            return 'новых объявлений нет' if estimated else 'задержка не оценивалась (первый проход)'
+        return (f'задержка обнаружения (оценка сверху): p50 {_percentile(self.lags, 50):.0f} с, '
+                f'p99 {_percentile(self.lags, 99):.0f} с, макс. {max(self.lags):.0f} с')
+
+class _LagWriter:
+    def __init__(self, lag, writer):
+        self.lag = lag
+        self.writer = writer
+
+    async def add(self, car):
+        self.lag.observe(car)
+        await self.writer.add(car)
+
+freshness = FreshnessLag()
@@ -0,0 +1,108 @@
+import os
+import socket
+from datetime import datetime
+from dotenv import load_dotenv
+from db import (run_db, frontier_open, frontier_reset, frontier_set, frontier_add_page,
+                frontier_claim, frontier_mark_failed, frontier_counts, frontier_progress)
+
+load_dotenv()
+
+# Сохранение прогресса обхода в БД с продолжением после сбоя или перезапуска (1 - включено)
+FRONTIER = os.getenv('FRONTIER', '0') == '1'
+# Сколько незавершённых ссылок забирать из фронтира за один запрос при продолжении
+FRONTIER_CLAIM_BATCH = int(os.getenv('FRONTIER_CLAIM_BATCH', '500'))
+
+# Воркеры (--worker): сколько ссылок арендовать за раз, срок аренды и пауза при пустой очереди
+WORKER_CLAIM_BATCH = int(os.getenv('WORKER_CLAIM_BATCH', '10'))
+WORKER_LEASE_SECONDS = int(os.getenv('WORKER_LEASE_SECONDS', '300'))
+WORKER_POLL_INTERVAL = float(os.getenv('WORKER_POLL_INTERVAL', '5'))
+WORKER_ID = os.getenv('WORKER_ID') or f'{socket.gethostname()}-{os.getpid()}'
+
+class Frontier:
+    """Состояние обхода в Postgres: ссылки pending -> in_progress -> done/failed.
+
+    Каждая страница выдачи сохраняется вместе с контрольной точкой (номер страницы),
+    done отмечается при записи авто в той же транзакции (CarWriter(mark_done=True)).
+    Незавершённый запуск продолжается со следующей страницы выдачи, а ссылки,
+    не дошедшие до БД, обрабатываются заново.
+    """
+
+    def __init__(self, state):
+        self.started_at = state.get('run_started')
+        self.start_page = int(state.get('listing_page', '0')) + 1
+        self.discovery_done = state.get('discovery_done') == '1'
+
+    @classmethod
+    async def open(cls):
+        """Продолжение незавершённого запуска или начало нового"""
+        state, counts = await run_db(frontier_open)
+        if 'run_started' in state and 'run_finished' not in state:
+            frontier = cls(state)
+            print(f"Фронтир: продолжение запуска от {frontier.started_at}, "
+                  f"выдача со страницы {frontier.start_page}"
+                  f"{' (собрана)' if frontier.discovery_done else ''}, "
+                  f"ожидают обработки: {counts.get('pending', 0)}, готово: {counts.get('done', 0)}")
+            return frontier
+        started_at = datetime.now().isoformat(timespec='seconds')
+        await run_db(frontier_reset, started_at)
+        print(f"Фронтир: новый запуск {started_at}")
+        return cls({'run_started': started_at})
+
+    async def iter_pending(self):
+        """Ссылки, оставшиеся с прерванного запуска, пачками (уже переведены в in_progress)"""
+        while True:
+            urls = await run_db(frontier_claim, FRONTIER_CLAIM_BATCH)
+            if not urls:
+                return
+            yield urls
+
+    async def add_page(self, page, urls, claim=True):
+        """Сохранение ссылок страницы выдачи, возвращает ещё не обработанные в этом запуске.
+
+        При claim=False ссылки остаются в pending для воркеров (SCRAPE_MODE=distributed).
+        """
+        return await run_db(frontier_add_page, page, urls, claim)
+
+    async def finish_discovery(self):
+        self.discovery_done = True
+        await run_db(frontier_set, 'discovery_done', '1')
+
+    async def mark_failed(self, url):
+        await run_db(frontier_mark_failed, [url])
+
+    async def close(self):
+        """Запуск завершён, если выдача собрана и не осталось ссылок в работе"""
+        counts = await run_db(frontier_counts)
+        finished = self.discovery_done and not counts.get('pending') and not counts.get('in_progress')
+        if finished:
+            await run_db(frontier_set, 'run_finished', datetime.now().isoformat(timespec='seconds'))
+        print(f"Фронтир: готово {counts.get('done', 0)}, ошибок {counts.get('failed', 0)}, "
+              f"не завершено {counts.get('pending', 0) + counts.get('in_progress', 0)}"
+              f"{'' if finished else ' - запуск продолжится при следующем старте'}")
+        return finished
+
+class WorkQueue:
+    """Очередь задач воркера поверх crawl_frontier: аренда ссылок с FOR UPDATE SKIP LOCKED.
+
+    Воркеров может быть сколько угодно (процессы или контейнеры); ссылки упавшего воркера
+    возвращаются в работу после истечения аренды, повторная запись авто безопасна (upsert по listing_id).
+    """
+
+    def __init__(self, worker_id=WORKER_ID):
+        self.worker_id = worker_id
+
+    async def lease(self):
+        return await run_db(frontier_claim, WORKER_CLAIM_BATCH, self.worker_id, WORKER_LEASE_SECONDS)
+
+    async def mark_failed(self, url):
+        await run_db(frontier_mark_failed, [url])
+
+    async def finished(self):
+        """Запуск завершён: выдача собрана и ни одной ссылки не ждёт обработки"""
+        state, counts = await run_db(frontier_progress)
+        if 'run_finished' in state:
+            return True
+        if state.get('discovery_done') != '1' or counts.get('pending') or counts.get('in_progress'):
+            return False
+        await run_db(frontier_set, 'run_finished', datetime.now().isoformat(timespec='seconds'))
+        return True
@@ -0,0 +1,156 @@
+import gzip
+import hashlib
+import json
+import os
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Каталог кэша HTTP-ответов (пусто - кэш выключен)
+HTTP_CACHE_DIR = os.getenv('HTTP_CACHE_DIR', '')
+# Сколько секунд ответ считается свежим без перепроверки на сервере
+HTTP_CACHE_TTL = float(os.getenv('HTTP_CACHE_TTL', '0'))
+# Удалять записи старше N дней и держать кэш не больше N мегабайт
+HTTP_CACHE_MAX_AGE_DAYS = float(os.getenv('HTTP_CACHE_MAX_AGE_DAYS', '7'))
+HTTP_CACHE_MAX_MB = float(os.getenv('HTTP_CACHE_MAX_MB', '1024'))
+# Офлайн-режим: отдавать только закэшированные страницы, без обращения к сайту
+HTTP_CACHE_OFFLINE = os.getenv('HTTP_CACHE_OFFLINE', '0') == '1'
+
+def _sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+class HttpCache:
+    """Дисковый кэш ответов: тела хранятся сжатыми по хэшу содержимого,
+    для каждого URL - небольшая запись со ссылкой на тело и валидаторами (ETag/Last-Modified).
+    """
+
+    def __init__(self, root, ttl=HTTP_CACHE_TTL, max_age_days=HTTP_CACHE_MAX_AGE_DAYS,
+                 max_mb=HTTP_CACHE_MAX_MB, offline=HTTP_CACHE_OFFLINE):
+        self.root = root
+        self.ttl = ttl
+        self.max_age = max_age_days * 86400
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.offline = offline
+        self.stats = {'hits': 0, 'revalidated': 0, 'misses': 0, 'stored': 0}
+        os.makedirs(os.path.join(root, 'urls'), exist_ok=True)
+        os.makedirs(os.path.join(root, 'objects'), exist_ok=True)
+
+    def _url_path(self, url):
+        key = _sha256(url.encode())
+        return os.path.join(self.root, 'urls', key[:2], key + '.json')
+
+    def _object_path(self, digest):
+        return os.path.join(self.root, 'objects', digest[:2], digest + '.gz')
+
+    def lookup(self, url):
+        """Запись кэша для URL или None"""
+        try:
+            with open(self._url_path(url), encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not os.path.exists(self._object_path(entry['sha256'])):
+            return None
+        return entry
+
+    def is_fresh(self, entry):
+        return time.time() - entry['stored_at'] < self.ttl
+
+    def validators(self, entry):
+        """Заголовки условного запроса для перепроверки записи на сервере"""
+        headers = {}
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def read(self, entry):
+        """Тело закэшированного ответа"""
+        with gzip.open(self._object_path(entry['sha256']), 'rb') as f:
+            return f.read().decode('utf-8')
+
+    def store(self, url, body, headers):
+        """Сохранение ответа; одинаковые тела хранятся один раз"""
+        data = body.encode('utf-8')
+        digest = _sha256(data)
+        object_path = self._object_path(digest)
+        if not os.path.exists(object_path):
+            os.makedirs(os.path.dirname(object_path), exist_ok=True)
+            tmp_path = f'{object_path}.{os.getpid()}.tmp'
+            with gzip.open(tmp_path, 'wb', compresslevel=6) as f:
+                f.write(data)
+            os.replace(tmp_path, object_path)
+        entry = {
+            'url': url,
+            'sha256': digest,
+            'etag': headers.get('ETag'),
+            'last_modified': headers.get('Last-Modified'),
+            'stored_at': time.time(),
+        }
+        self._write_entry(url, entry)
+        self.stats['stored'] += 1
+        return entry
+
+    def touch(self, url, entry):
+        """Сервер подтвердил актуальность (304) - обновляем время записи"""
+        entry['stored_at'] = time.time()
+        self._write_entry(url, entry)
+
+    def _write_entry(self, url, entry):
+        path = self._url_path(url)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, path)
+
+    def evict(self):
+        """Удаление устаревших записей, затем самых старых до лимита размера и сборка мусора тел"""
+        now = time.time()
+        entries = []
+        for dirpath, _, filenames in os.walk(os.path.join(self.root, 'urls')):
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                try:
+                    with open(path, encoding='utf-8') as f:
+                        entry = json.load(f)
+                except (OSError, ValueError):
+                    os.remove(path)
+                    continue
+                if now - entry['stored_at'] > self.max_age:
+                    os.remove(path)
+                else:
+                    entries.append((entry['stored_at'], path, entry['sha256']))
+
+        objects = {}
+        for dirpath, _, filenames in os.walk(os.path.join(self.root, 'objects')):
+            for name in filenames:
+                if name.endswith('.gz'):
+                    path = os.path.join(dirpath, name)
+                    objects[name[:-len('.gz')]] = (path, os.path.getsize(path))
+
+        # Самые свежие записи сохраняем, пока укладываемся в лимит размера
+        referenced = set()
+        total = 0
+        removed = 0
+        for _, path, digest in sorted(entries, reverse=True):
+            size = objects.get(digest, (None, 0))[1] if digest not in referenced else 0
+            if total + size > self.max_bytes:
+                os.remove(path)
+                removed += 1
+                continue
+            total += size
+            referenced.add(digest)
+
+        for digest, (path, _) in objects.items():
+            if digest not in referenced:
+                os.remove(path)
+        print(f"Кэш HTTP: {len(referenced)} тел, {total // 1024} КБ, удалено записей по размеру: {removed}")
+
+    def summary(self):
+        return (f"попаданий: {self.stats['hits']}, подтверждено 304: {self.stats['revalidated']}, "
+                f"промахов: {self.stats['misses']}, сохранено: {self.stats['stored']}")
+
+http_cache = HttpCache(HTTP_CACHE_DIR) if HTTP_CACHE_DIR else None
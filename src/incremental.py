@@ -0,0 +1,118 @@
+import os
+import re
+from array import array
+from bisect import bisect_left
+from datetime import datetime, timedelta
+from dotenv import load_dotenv
+from db import load_known_listings, run_db
+
+load_dotenv()
+
+# Инкрементальный режим: не загружать объявления, которые уже есть в БД
+INCREMENTAL = os.getenv('INCREMENTAL', '0') == '1'
+# Повторно обходить объявления, не обновлявшиеся N дней (по last_seen, 0 - никогда)
+RECRAWL_AFTER_DAYS = float(os.getenv('RECRAWL_AFTER_DAYS', '0'))
+
+LISTING_ID_RE = re.compile(r'_(\d+)\.html')
+
+def listing_id(url):
+    """Числовой ID объявления из ссылки вида .../auto_bmw_x5_38123456.html"""
+    match = LISTING_ID_RE.search(url)
+    return int(match.group(1)) if match else None
+
+def _compact(ids):
+    # Отсортированный массив int64: 8 байт на объявление вместо ~70 у set из int
+    return array('q', sorted(set(ids)))
+
+def _contains(ids, value):
+    i = bisect_left(ids, value)
+    return i < len(ids) and ids[i] == value
+
+class IdSet:
+    """Множество ID объявлений для дедупликации при обходе выдачи: битовая карта.
+
+    Память зависит от разброса ID (около 1,2 МБ на 10 млн номеров), а не от количества
+    объявлений. ID, которые растянули бы карту больше MAX_SPAN бит, хранятся в обычном set.
+    """
+    MAX_SPAN = 1 << 28
+
+    def __init__(self):
+        self.base = None
+        self.bits = bytearray()
+        self.outliers = set()
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def add(self, value):
+        """Добавляет ID, возвращает True, если его ещё не было"""
+        if self.base is None:
+            self.base = value & ~7
+        if value < self.base:
+            shift = (self.base - value + 7) // 8
+            if (len(self.bits) + shift) * 8 > self.MAX_SPAN:
+                return self._add_outlier(value)
+            self.bits[0:0] = bytes(shift)
+            self.base -= shift * 8
+        offset = value - self.base
+        if offset >= self.MAX_SPAN:
+            return self._add_outlier(value)
+        byte, mask = offset >> 3, 1 << (offset & 7)
+        if byte >= len(self.bits):
+            # Растим с запасом, чтобы не перевыделять на каждой странице выдачи
+            self.bits.extend(bytes(max(byte + 1 - len(self.bits), len(self.bits) // 4)))
+        if self.bits[byte] & mask:
+            return False
+        self.bits[byte] |= mask
+        self.count += 1
+        return True
+
+    def _add_outlier(self, value):
+        if value in self.outliers:
+            return False
+        self.outliers.add(value)
+        self.count += 1
+        return True
+
+class KnownListings:
+    """Компактный индекс сохранённых объявлений со счётчиками решений"""
+
+    def __init__(self, fresh, stale):
+        self.fresh = _compact(fresh)
+        self.stale = _compact(stale)
+        self.counts = {'new': 0, 'skipped': 0, 'recrawl': 0}
+
+    def __len__(self):
+        return len(self.fresh) + len(self.stale)
+
+    def status(self, url):
+        """new - нет в БД, skipped - свежая запись, recrawl - запись устарела"""
+        car_id = listing_id(url)
+        if car_id is None:
+            return 'new'
+        if _contains(self.fresh, car_id):
+            return 'skipped'
+        if _contains(self.stale, car_id):
+            return 'recrawl'
+        return 'new'
+
+    def should_fetch(self, url):
+        """Учитывает решение в счётчиках и возвращает, нужно ли загружать страницу"""
+        status = self.status(url)
+        self.counts[status] += 1
+        return status != 'skipped'
+
+    def summary(self):
+        return (f"новых: {self.counts['new']}, повторно обойдено: {self.counts['recrawl']}, "
+                f"пропущено (уже в БД): {self.counts['skipped']}")
+
+async def load_known():
+    """Загрузка индекса известных объявлений из таблицы cars"""
+    recrawl_before = None
+    if RECRAWL_AFTER_DAYS > 0:
+        recrawl_before = datetime.now() - timedelta(days=RECRAWL_AFTER_DAYS)
+    fresh, stale = await run_db(load_known_listings, recrawl_before)
+    known = KnownListings(fresh, stale)
+    print(f"Инкрементальный режим: в БД {len(known)} объявлений, из них устаревших {len(known.stale)}")
+    return known
@@ -1,48 +1,290 @@
-import asyncio
+import argparse
 import os
 import sys
 from dotenv import load_dotenv
-from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from db import create_table
-from scraper import scrape_autoria
-from dump import dump_db
-
-print('sys.argv:', sys.argv)
+from metrics import setup_logging
 
 load_dotenv()
 
+# Расписание обхода: daily - полный обход раз в день в SCRAPING_TIME;
+# continuous - дополнительно короткие проходы по новым объявлениям каждые FRESH_INTERVAL минут
+SCHEDULE_MODE = os.getenv('SCHEDULE_MODE', 'daily')
 SCRAPING_TIME = os.getenv('SCRAPING_TIME', '12:00')
 DUMP_TIME = os.getenv('DUMP_TIME', '12:00')
+# Время инкрементальной выгрузки новых авто (пусто - выключена)
+EXPORT_TIME = os.getenv('EXPORT_TIME', '')
+# Интервал backfill телефонов в минутах (только PHONE_MODE=deferred)
+PHONE_BACKFILL_INTERVAL = int(os.getenv('PHONE_BACKFILL_INTERVAL', '30'))
+
+BENCH_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'bench')
+
+# Прежние флаги запуска -> подкоманды (docker-compose и cron с ними продолжают работать)
+LEGACY_FLAGS = {
+    '--run-once': ['run'],
+    '--fresh-once': ['fresh'],
+    '--backfill-phones': ['backfill-phones'],
+    '--worker': ['fetch-details', '--follow'],
+    '--export-now': ['export'],
+    '--dump-now': ['dump'],
+}
+
+# Стадии возвращают функцию запуска: импорты выполняются при выборе стадии, работа - при вызове
+
+def serve_stage(args):
+    import asyncio
+    from datetime import datetime
+    from apscheduler.schedulers.asyncio import AsyncIOScheduler
+    from db import create_table, close_pool, ensure_history_partitions
+    from dump import dump_db
+    from export import export_cars
+    from freshness import FRESH_INTERVAL, run_exclusive
+    from metrics import METRICS_PORT, start_metrics_server
+    from phones import PHONE_MODE, run_backfill
+    from scraper import close_parse_pool, scrape_autoria, scrape_fresh
+
+    async def scheduled_main():
+        print(f'Режим: расписание ({SCHEDULE_MODE})')
+        create_table()
+        if METRICS_PORT:
+            await start_metrics_server(METRICS_PORT)
+        scheduler = AsyncIOScheduler()
+        # Полный обход и короткие проходы не пересекаются сами с собой, но могут идти параллельно
+        scheduler.add_job(run_exclusive, 'cron', args=('sweep', scrape_autoria),
+                          hour=SCRAPING_TIME.split(':')[0], minute=SCRAPING_TIME.split(':')[1], max_instances=1)
+        if SCHEDULE_MODE == 'continuous':
+            scheduler.add_job(run_exclusive, 'interval', args=('fresh', scrape_fresh), minutes=FRESH_INTERVAL,
+                              max_instances=1, coalesce=True, next_run_time=datetime.now())
+        # Секция истории следующего месяца создаётся заранее, до первой записи в нём
+        scheduler.add_job(ensure_history_partitions, 'cron', hour=0, minute=5)
+        scheduler.add_job(dump_db, 'cron', hour=DUMP_TIME.split(':')[0], minute=DUMP_TIME.split(':')[1])
+        if EXPORT_TIME:
+            scheduler.add_job(export_cars, 'cron', hour=EXPORT_TIME.split(':')[0], minute=EXPORT_TIME.split(':')[1],
+                              max_instances=1)
+        if PHONE_MODE == 'deferred':
+            scheduler.add_job(run_backfill, 'interval', minutes=PHONE_BACKFILL_INTERVAL, max_instances=1)
+        scheduler.start()
+        print('Сервис запущен. Ожидание задач...')
+        try:
+            while True:
+                await asyncio.sleep(3600)
+        finally:
+            scheduler.shutdown(wait=False)
+            # Пул разбора общий для полного обхода и коротких проходов - закрывается с сервисом
+            await close_parse_pool()
+            close_pool()
+
+    return lambda: asyncio.run(scheduled_main())
+
+def run_stage(args):
+    import asyncio
+    from db import create_table, close_pool
+    from freshness import run_exclusive
+    from scraper import close_parse_pool, scrape_autoria
+
+    async def run_once():
+        print('Ручной запуск парсера...')
+        create_table()
+        try:
+            await run_exclusive('sweep', scrape_autoria)
+        finally:
+            await close_parse_pool()
+            close_pool()
+        print('Парсинг завершён.')
+
+    return lambda: asyncio.run(run_once())
+
+def fresh_stage(args):
+    import asyncio
+    from db import create_table, close_pool
+    from freshness import run_exclusive
+    from scraper import close_parse_pool, scrape_fresh
+
+    async def run_fresh_once():
+        print('Ручной короткий проход по новым объявлениям...')
+        create_table()
+        try:
+            await run_exclusive('fresh', scrape_fresh)
+        finally:
+            await close_parse_pool()
+            close_pool()
+        print('Проход завершён.')
+
+    return lambda: asyncio.run(run_fresh_once())
+
+def discover_stage(args):
+    import asyncio
+    from scraper import discover
+
+    if args.output is None:
+        # Без файла ссылки уходят в очередь crawl_frontier - нужны схема и пул БД
+        from db import create_table, close_pool
+
+    async def run_discover():
+        if args.output is None:
+            create_table()
+        try:
+            await discover(args.output)
+        finally:
+            if args.output is None:
+                close_pool()
+        print('Сбор ссылок завершён.')
+
+    return lambda: asyncio.run(run_discover())
+
+def fetch_details_stage(args):
+    import asyncio
+    from db import create_table, close_pool
+    from metrics import METRICS_PORT, start_metrics_server
+    from scraper import close_parse_pool, fetch_details, run_worker
+
+    async def run_fetch_details():
+        create_table()
+        try:
+            if args.input is not None:
+                if args.input == '-':
+                    await fetch_details(sys.stdin)
+                else:
+                    with open(args.input, encoding='utf-8') as f:
+                        await fetch_details(f)
+            else:
+                # Без --input - воркер очереди crawl_frontier (распределённый режим)
+                print('Запуск воркера распределённого режима...')
+                if METRICS_PORT:
+                    await start_metrics_server(METRICS_PORT)
+                await run_worker(until_done=not args.follow)
+                print('Воркер остановлен.')
+        finally:
+            await close_parse_pool()
+            close_pool()
+
+    return lambda: asyncio.run(run_fetch_details())
+
+def backfill_phones_stage(args):
+    import asyncio
+    from db import create_table, close_pool
+    from phones import run_backfill
+
+    async def run():
+        print('Ручной backfill телефонов...')
+        create_table()
+        try:
+            await run_backfill()
+        finally:
+            close_pool()
+        print('Backfill завершён.')
+
+    return lambda: asyncio.run(run())
+
+def export_stage(args):
+    from db import close_pool
+    from export import EXPORT_FORMAT, export_cars
+
+    # Схема не создаётся: ALTER TABLE в create_table ждал бы блокировки таблицы у идущего обхода
+    def run():
+        print('Ручная выгрузка новых авто...')
+        try:
+            export_cars(args.format or EXPORT_FORMAT, full=args.full)
+        finally:
+            close_pool()
+        print('Выгрузка завершена.')
+
+    return run
+
+def dump_stage(args):
+    from dump import dump_db
+
+    def run():
+        print('Ручной дамп базы...')
+        dump_db()
+        print('Дамп завершён.')
+
+    return run
+
+def init_db_stage(args):
+    from db import create_table, close_pool
+
+    def run():
+        create_table()
+        close_pool()
+        print('Схема БД создана.')
+
+    return run
+
+def bench_stage(args):
+    import runpy
+
+    path = os.path.join(BENCH_DIR, f'bench_{args.name}.py')
+    if not os.path.exists(path):
+        path = os.path.join(BENCH_DIR, f'{args.name}.py')
+
+    def run():
+        # Бенчмарк запускается как скрипт: свои аргументы, свой sys.path
+        sys.argv = [path, *args.args]
+        sys.path.insert(0, BENCH_DIR)
+        runpy.run_path(path, run_name='__main__')
+
+    return run
+
+def bench_names():
+    if not os.path.isdir(BENCH_DIR):
+        return []
+    return sorted(name[len('bench_'):-3] if name.startswith('bench_') else name[:-3]
+                  for name in os.listdir(BENCH_DIR)
+                  if name.endswith('.py') and (name.startswith('bench_') or name.startswith('check_')))
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='Парсер AutoRia: сервис по расписанию и отдельные стадии')
+    parser.add_argument('--import-only', action='store_true',
+                        help='только загрузить модули стадии и выйти (замер холодного старта)')
+    commands = parser.add_subparsers(dest='command', metavar='команда')
+
+    def command(name, stage, help_text):
+        sub = commands.add_parser(name, help=help_text, description=help_text)
+        sub.set_defaults(stage=stage)
+        return sub
+
+    command('serve', serve_stage, f'сервис по расписанию (по умолчанию, SCHEDULE_MODE={SCHEDULE_MODE})')
+    command('run', run_stage, 'полный обход сейчас (выдача и страницы авто, SCRAPE_MODE)')
+    command('fresh', fresh_stage, 'короткий проход по новым объявлениям')
+    sub = command('discover', discover_stage, 'обход выдачи: ссылки в файл или в очередь crawl_frontier')
+    sub.add_argument('--output', help='файл для ссылок, по одной на строку (без него - crawl_frontier)')
+    sub = command('fetch-details', fetch_details_stage,
+                  'загрузка и разбор страниц авто: по списку ссылок или из очереди crawl_frontier')
+    sub.add_argument('--input', help='файл ссылок стадии discover (- для stdin); без него - очередь crawl_frontier')
+    sub.add_argument('--follow', action='store_true',
+                     help='без --input: ждать новые запуски, а не выходить после обработки текущего')
+    command('backfill-phones', backfill_phones_stage, 'заполнение телефонов у авто без них')
+    sub = command('export', export_stage, 'инкрементальная выгрузка новых авто')
+    sub.add_argument('--full', action='store_true', help='выгрузить все авто, а не только новые')
+    sub.add_argument('--format', choices=['csv', 'jsonl', 'parquet'], help='формат (по умолчанию EXPORT_FORMAT)')
+    command('dump', dump_stage, 'дамп БД через pg_dump')
+    command('init-db', init_db_stage, 'создание и обновление схемы БД')
+    sub = command('bench', bench_stage, 'запуск бенчмарка из bench/')
+    sub.add_argument('name', choices=bench_names(), help='бенчмарк: bench/bench_<name>.py или check_*.py')
+    sub.add_argument('args', nargs=argparse.REMAINDER, help='аргументы бенчмарка')
+    return parser
+
+def translate_legacy(argv):
+    """Прежние флаги (--run-once, --worker --until-done и т.п.) -> аргументы подкоманды"""
+    for flag, command in LEGACY_FLAGS.items():
+        if flag in argv:
+            rest = [arg for arg in argv if arg != flag]
+            if flag == '--worker' and '--until-done' in rest:
+                command = ['fetch-details']
+                rest.remove('--until-done')
+            # Общие опции остаются перед подкомандой
+            options = [arg for arg in rest if arg == '--import-only']
+            return options + command + [arg for arg in rest if arg != '--import-only']
+    return argv
 
-async def scheduled_main():
-    create_table()
-    scheduler = AsyncIOScheduler()
-    scheduler.add_job(scrape_autoria, 'cron', hour=SCRAPING_TIME.split(':')[0], minute=SCRAPING_TIME.split(':')[1])
-    scheduler.add_job(dump_db, 'cron', hour=DUMP_TIME.split(':')[0], minute=DUMP_TIME.split(':')[1])
-    scheduler.start()
-    print('Сервис запущен. Ожидание задач...')
-    while True:
-        await asyncio.sleep(3600)
-
-async def run_once():
-    print('Ручной запуск парсера...')
-    create_table()
-    await scrape_autoria()
-    print('Парсинг завершён.')
-
-def run_dump_now():
-    print('Ручной дамп базы...')
-    create_table()
-    dump_db()
-    print('Дамп завершён.')
+def main(argv=None):
+    args = build_parser().parse_args(translate_legacy(sys.argv[1:] if argv is None else argv))
+    # Без подкоманды - сервис по расписанию, как раньше
+    run = getattr(args, 'stage', serve_stage)(args)
+    if args.import_only:
+        return
+    setup_logging()
+    run()
 
 if __name__ == '__main__':
-    if '--run-once' in sys.argv:
-        print('Режим: ручной парсинг')
-        asyncio.run(run_once())
-    elif '--dump-now' in sys.argv:
-        print('Режим: ручной дамп')
-        run_dump_now()
-    else:
-        print('Режим: расписание')
-        asyncio.run(scheduled_main())
+    main()
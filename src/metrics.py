@@ -0,0 +1,186 @@
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Порт HTTP-эндпоинта /metrics в режиме расписания (0 - выключен)
+METRICS_PORT = int(os.getenv('METRICS_PORT', '0'))
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+
+log = logging.getLogger('autoria')
+
+def log_event(level, event, **fields):
+    """Структурированное событие одной строкой JSON; форматируется только если уровень включён"""
+    if log.isEnabledFor(level):
+        log.log(level, json.dumps({'ts': round(time.time(), 3), 'event': event, **fields},
+                                  ensure_ascii=False, default=str))
+
+def setup_logging():
+    logging.basicConfig(level=LOG_LEVEL.upper(), format='%(message)s')
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _labels_text(names, values):
+    if not names:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + '}'
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        REGISTRY.append(self)
+
+    def _key(self, labels):
+        # Значения меток - строки: status=200 и status='error' в одной серии должны сортироваться
+        return tuple(str(labels.get(name, '')) for name in self.label_names)
+
+    def header(self):
+        return [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def __init__(self, name, help_text, labels=()):
+        super().__init__(name, help_text, labels)
+        self.values = {}
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self):
+        return [f'{self.name}{_labels_text(self.label_names, key)} {value}'
+                for key, value in sorted(self.values.items())]
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def __init__(self, name, help_text, labels=()):
+        super().__init__(name, help_text, labels)
+        self.values = {}
+        self.functions = {}
+
+    def set(self, value, **labels):
+        self.values[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set_function(self, func, **labels):
+        """Значение вычисляется при каждом чтении метрик (например, длина очереди); None - убрать"""
+        key = self._key(labels)
+        if func is None:
+            self.functions.pop(key, None)
+            self.values.pop(key, None)
+        else:
+            self.functions[key] = func
+
+    def render(self):
+        values = dict(self.values)
+        for key, func in self.functions.items():
+            values[key] = func()
+        return [f'{self.name}{_labels_text(self.label_names, key)} {value}'
+                for key, value in sorted(values.items())]
+
+class Histogram(_Metric):
+    kind = 'histogram'
+    DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(buckets)
+        self.series = {}  # ключ меток -> [счётчики по корзинам, сумма, количество]
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        series = self.series.get(key)
+        if series is None:
+            series = self.series[key] = [[0] * len(self.buckets), 0.0, 0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[0][i] += 1
+                break
+        series[1] += value
+        series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self):
+        lines = []
+        for key, (counts, total, count) in sorted(self.series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                labels = _labels_text(self.label_names + ('le',), key + (f'{bound:g}',))
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _labels_text(self.label_names + ('le',), key + ('+Inf',))
+            lines.append(f'{self.name}_bucket{labels} {count}')
+            lines.append(f'{self.name}_sum{_labels_text(self.label_names, key)} {total}')
+            lines.append(f'{self.name}_count{_labels_text(self.label_names, key)} {count}')
+        return lines
+
+REGISTRY = []
+
+HTTP_REQUESTS = Counter('autoria_http_requests_total', 'HTTP-запросы к сайту по типу и коду ответа',
+                        ('kind', 'status'))
+HTTP_BYTES = Counter('autoria_http_response_bytes_total', 'Байты тел ответов после распаковки по сжатию',
+                     ('encoding',))
+HTTP_RETRIES = Counter('autoria_http_retries_total', 'Повторные попытки HTTP-запросов', ('kind',))
+DEAD_LETTERS = Counter('autoria_dead_letters_total', 'Ссылки, исчерпавшие попытки загрузки', ('kind',))
+BREAKER_TRIPS = Counter('autoria_breaker_trips_total', 'Срабатывания предохранителя хоста', ('host',))
+IN_FLIGHT = Gauge('autoria_http_in_flight', 'HTTP-запросы в процессе выполнения', ('kind',))
+STAGE_SECONDS = Histogram('autoria_stage_seconds', 'Длительность стадий обработки', ('stage',))
+QUEUE_DEPTH = Gauge('autoria_queue_depth', 'Количество элементов в очередях конвейера', ('queue',))
+CARS = Counter('autoria_cars_total', 'Обработанные объявления по результату', ('result',))
+EXTRACT_SOURCE = Counter('autoria_extract_source_total', 'Источник полей авто в режиме EXTRACT_MODE=json',
+                         ('source',))
+PHONE_CACHE = Counter('autoria_phone_cache_total', 'Обращения к кэшу телефонов продавцов', ('result',))
+RATE = Gauge('autoria_rate_limit', 'Текущие параметры адаптивного управления скоростью', ('param',))
+FRESHNESS_LAG = Histogram('autoria_freshness_lag_seconds',
+                          'Задержка обнаружения новых объявлений коротким проходом (оценка сверху)',
+                          buckets=(60, 300, 600, 1800, 3600, 3 * 3600, 12 * 3600, 24 * 3600))
+
+def render():
+    """Все метрики в текстовом формате Prometheus"""
+    lines = []
+    for metric in REGISTRY:
+        body = metric.render()
+        if body:
+            lines.extend(metric.header())
+            lines.extend(body)
+    return '\n'.join(lines) + '\n'
+
+async def start_metrics_server(port=METRICS_PORT):
+    """HTTP-эндпоинт /metrics на том же event loop, что и планировщик"""
+    from aiohttp import web
+
+    async def handle(request):
+        return web.Response(body=render().encode('utf-8'),
+                            headers={'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'})
+
+    app = web.Application()
+    app.router.add_get('/metrics', handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, '0.0.0.0', port).start()
+    print(f'Метрики доступны на http://0.0.0.0:{port}/metrics')
+    return runner
@@ -0,0 +1,184 @@
+import asyncio
+import json
+import logging
+import os
+import re
+from collections import OrderedDict
+from dotenv import load_dotenv
+from db import run_db, select_missing_phones, update_phones
+from incremental import listing_id
+from ratelimit import rate_controller, parse_retry_after
+from retry import RETRY_STATUSES, RetryLater, retries
+from metrics import HTTP_REQUESTS, PHONE_CACHE, STAGE_SECONDS, log_event
+from transport import API_TIMEOUT, HEADERS, BodyTooLarge, TransportError, make_transport
+
+load_dotenv()
+
+# Базовый адрес сайта (для бенчмарков подменяется локальным mock-сервером)
+AUTORIA_BASE_URL = os.getenv('AUTORIA_BASE_URL', 'https://auto.ria.com')
+# Данные объявления в JSON (вместе с телефоном продавца): .format(car_id)
+SEARCH_VIEW_URL = AUTORIA_BASE_URL + '/demo/bu/searchPage/v2/view/auto/{}?lang_id=4'
+
+# inline - телефон запрашивается до записи авто, deferred - авто записывается сразу,
+# телефоны заполняет отдельный backfill
+PHONE_MODE = os.getenv('PHONE_MODE', 'inline')
+# Отдельный бюджет одновременных запросов к API телефонов
+PHONE_WORKERS = int(os.getenv('PHONE_WORKERS', '5'))
+# Размер пачки backfill: столько авто загружается, опрашивается и обновляется за раз
+PHONE_BACKFILL_BATCH = int(os.getenv('PHONE_BACKFILL_BATCH', '200'))
+# Повторный запрос телефона у авто без него - не чаще раза в PHONE_BACKFILL_RETRY_HOURS часов
+# и не больше PHONE_BACKFILL_MAX_ATTEMPTS раз (объявления без телефона не опрашиваются вечно)
+PHONE_BACKFILL_RETRY_HOURS = float(os.getenv('PHONE_BACKFILL_RETRY_HOURS', '24'))
+PHONE_BACKFILL_MAX_ATTEMPTS = int(os.getenv('PHONE_BACKFILL_MAX_ATTEMPTS', '3'))
+# Сколько продавцов держать в кэше телефонов (вытесняются давно не встречавшиеся)
+PHONE_CACHE_SIZE = int(os.getenv('PHONE_CACHE_SIZE', '100000'))
+
+# Семафор API телефонов: медленный API не занимает слоты загрузки страниц
+phone_semaphore = asyncio.Semaphore(PHONE_WORKERS)
+
+# Кэш телефонов по продавцу: у дилеров десятки объявлений с одним номером (LRU)
+seller_phones = OrderedDict()
+
+stats = {'lookups': 0, 'cache_hits': 0, 'api_calls': 0, 'found': 0}
+
+def _report_throttle(resp):
+    # API телефонов на том же хосте - его 429/503 тоже снижают общую скорость
+    if rate_controller is not None and resp.status in (429, 503):
+        rate_controller.on_throttle(parse_retry_after(resp.headers.get('Retry-After')))
+
+def _phone_from_list(data):
+    if isinstance(data, list) and data:
+        return data[0].get('phone')
+    return None
+
+def _phone_from_view(data):
+    return data.get('userInfo', {}).get('phone')
+
+async def _call_phone_api(session, api_url, extract):
+    """Запрос к API телефонов с повторами: пауза перед повтором проходит вне слота семафора"""
+    while True:
+        try:
+            phone = await _phone_request(session, api_url, extract)
+        except RetryLater as e:
+            delay = retries.failed(api_url, 'phone', e)
+            if delay is None:
+                return None
+            await asyncio.sleep(delay)
+            continue
+        retries.succeeded(api_url)
+        return phone
+
+async def _phone_request(session, api_url, extract):
+    """Одна попытка запроса к API телефонов; временные ошибки выбрасываются как RetryLater"""
+    async with retries.breaker(api_url).attempt() as breaker:
+        async with phone_semaphore:  # Ограничиваем одновременные запросы к API телефонов
+            stats['api_calls'] += 1
+            if rate_controller is not None:
+                await rate_controller.acquire_token()
+            try:
+                resp = await session.get(api_url, timeout=API_TIMEOUT)
+            except BodyTooLarge:
+                HTTP_REQUESTS.inc(kind='phone', status='too_large')
+                return None
+            except TransportError as e:
+                HTTP_REQUESTS.inc(kind='phone', status='error')
+                breaker.failure()
+                raise RetryLater(str(e)) from e
+        HTTP_REQUESTS.inc(kind='phone', status=resp.status)
+        _report_throttle(resp)
+        if resp.status in RETRY_STATUSES:
+            breaker.failure()
+            raise RetryLater(f'HTTP {resp.status}', parse_retry_after(resp.headers.get('Retry-After')))
+        breaker.success()
+    if resp.status != 200:
+        return None
+    try:
+        phone = extract(json.loads(resp.body))
+    except Exception:
+        return None
+    return re.sub(r'\D', '', phone) if phone else None
+
+async def fetch_phone(session, car_id, url):
+    """Получение телефона несколькими способами; между запросами слот API освобождается"""
+    try:
+        # Способ 1: API для получения телефона
+        phone = await _call_phone_api(session, f'{AUTORIA_BASE_URL}/users/phones/{car_id}?all',
+                                      _phone_from_list)
+        if phone:
+            return phone
+    except Exception as e:
+        log_event(logging.WARNING, 'phone_error', api='phones', car_id=car_id, error=repr(e))
+
+    try:
+        # Способ 2: Альтернативный API
+        phone = await _call_phone_api(session, SEARCH_VIEW_URL.format(car_id), _phone_from_view)
+        if phone:
+            return phone
+    except Exception as e:
+        log_event(logging.WARNING, 'phone_error', api='search_view', car_id=car_id, error=repr(e))
+
+    return None
+
+async def resolve_phone(session, car_id, seller_id=None, url=None):
+    """Телефон объявления: из кэша продавца или через API"""
+    stats['lookups'] += 1
+    if seller_id and seller_id in seller_phones:
+        stats['cache_hits'] += 1
+        PHONE_CACHE.inc(result='hit')
+        seller_phones.move_to_end(seller_id)
+        return seller_phones[seller_id]
+    PHONE_CACHE.inc(result='miss')
+    with STAGE_SECONDS.time(stage='phone'):
+        phone = await fetch_phone(session, car_id, url)
+    if phone:
+        stats['found'] += 1
+        if seller_id:
+            seller_phones[seller_id] = phone
+            if len(seller_phones) > PHONE_CACHE_SIZE:
+                seller_phones.popitem(last=False)
+    return phone
+
+async def backfill_phones(session, car_id_of):
+    """Заполнение phone_number у сохранённых авто пачками UPDATE.
+
+    car_id_of - функция, возвращающая ID объявления по url.
+    """
+    after_id = 0
+    total_checked = total_updated = 0
+    while True:
+        # Постраничный обход по id; недавно опрошенные и исчерпавшие попытки авто пропускаются
+        rows = await run_db(select_missing_phones, after_id, PHONE_BACKFILL_BATCH,
+                            PHONE_BACKFILL_RETRY_HOURS, PHONE_BACKFILL_MAX_ATTEMPTS)
+        if not rows:
+            break
+        after_id = rows[-1][0]
+
+        async def lookup(row_id, url):
+            car_id = car_id_of(url)
+            if not car_id:
+                return None
+            phone = await resolve_phone(session, car_id, url=url)
+            return (row_id, int(phone)) if phone else None
+
+        results = await asyncio.gather(*(lookup(row_id, url) for row_id, url in rows))
+        found = [result for result in results if result]
+        missed = [row_id for (row_id, _), result in zip(rows, results) if not result]
+        await run_db(update_phones, found, missed)
+        total_checked += len(rows)
+        total_updated += len(found)
+        print(f"Backfill телефонов: проверено {total_checked}, заполнено {total_updated}")
+    return total_checked, total_updated
+
+async def run_backfill():
+    """Backfill телефонов отдельным запуском: нужны только соединения API телефонов,
+    модули разбора страниц (scraper) не загружаются"""
+    print('Старт backfill телефонов...')
+    async with make_transport(PHONE_WORKERS, HEADERS) as session:
+        await backfill_phones(session, listing_id)
+    print(f"Телефоны: {summary()}")
+
+def summary():
+    hit_rate = stats['cache_hits'] / stats['lookups'] * 100 if stats['lookups'] else 0.0
+    return (f"запросов телефона: {stats['lookups']}, найдено: {stats['found']}, "
+            f"попаданий в кэш продавцов: {stats['cache_hits']} ({hit_rate:.0f}%), "
+            f"вызовов API: {stats['api_calls']}")
@@ -0,0 +1,166 @@
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+from email.utils import parsedate_to_datetime
+from dotenv import load_dotenv
+from metrics import RATE
+
+load_dotenv()
+
+# Адаптивное управление нагрузкой на сайт (1 - включено, вместо фиксированных задержек)
+RATE_CONTROL = os.getenv('RATE_CONTROL', '0') == '1'
+# Начальная и максимальная скорость, запросов в секунду
+RATE_START = float(os.getenv('RATE_START', '5'))
+RATE_MAX = float(os.getenv('RATE_MAX', '50'))
+# Максимум одновременных запросов, до которого может вырасти окно
+RATE_MAX_CONCURRENCY = int(os.getenv('RATE_MAX_CONCURRENCY', '50'))
+# Задержка ответа в секундах, выше которой нагрузка считается чрезмерной
+RATE_TARGET_LATENCY = float(os.getenv('RATE_TARGET_LATENCY', '2.0'))
+
+RATE_MIN = 0.2
+# Пауза, если сервер ответил 429/503 без Retry-After
+DEFAULT_BACKOFF = 5.0
+
+def parse_retry_after(value):
+    """Retry-After в секундах: число или HTTP-дата"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+class RateController:
+    """Token bucket для скорости и AIMD для числа одновременных запросов к одному хосту.
+
+    До первого снижения работает медленный старт: скорость удваивается примерно за секунду,
+    окно - за окно ответов. Дальше, пока задержки и ошибки в норме, скорость и окно растут
+    аддитивно; на 429/503/таймаутах - уменьшаются вдвое, Retry-After приостанавливает отправку.
+    """
+
+    def __init__(self, concurrency, rate=RATE_START, max_rate=RATE_MAX,
+                 max_concurrency=RATE_MAX_CONCURRENCY, target_latency=RATE_TARGET_LATENCY):
+        self.rate = rate
+        self.max_rate = max_rate
+        self.limit = float(concurrency)
+        self.max_concurrency = max_concurrency
+        self.target_latency = target_latency
+        self.tokens = 1.0
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.last_decrease = 0.0
+        self.slow_start = True
+        self.latency = None  # EWMA задержки ответа
+        self.in_flight = 0
+        self.peak_rate = rate
+        self.peak_limit = self.limit
+        self.stats = {'ok': 0, 'throttled': 0, 'errors': 0}
+        self._slots = asyncio.Condition()
+
+    async def acquire_token(self):
+        """Ожидание токена (и конца паузы по Retry-After) перед отправкой запроса"""
+        while True:
+            now = time.monotonic()
+            if now < self.paused_until:
+                await asyncio.sleep(self.paused_until - now)
+                continue
+            self.tokens = min(max(1.0, self.rate), self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1.0:
+                self.tokens -= 1.0
+                return
+            await asyncio.sleep((1.0 - self.tokens) / self.rate)
+
+    @asynccontextmanager
+    async def slot(self):
+        """Слот одновременного запроса в пределах текущего окна AIMD"""
+        async with self._slots:
+            await self._slots.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+        try:
+            yield
+        finally:
+            async with self._slots:
+                self.in_flight -= 1
+                self._slots.notify_all()
+
+    def on_success(self, latency):
+        self.stats['ok'] += 1
+        self.latency = latency if self.latency is None else 0.8 * self.latency + 0.2 * latency
+        if self.latency > self.target_latency:
+            self._decrease(0.9, 'рост задержки')
+            return
+        previous = int(self.limit)
+        if self.slow_start:
+            # Медленный старт: +1 на каждый успешный ответ - окно удваивается за окно ответов,
+            # скорость за секунду (ответов в секунду столько же, сколько запросов)
+            self.limit = min(self.max_concurrency, self.limit + 1.0)
+            self.rate = min(self.max_rate, self.rate + 1.0)
+        else:
+            # Аддитивный рост: примерно +1 к окну за окно успешных ответов, +1 запрос/с за секунду
+            self.limit = min(self.max_concurrency, self.limit + 1.0 / self.limit)
+            self.rate = min(self.max_rate, self.rate + 1.0 / self.rate)
+        self.peak_rate = max(self.peak_rate, self.rate)
+        self.peak_limit = max(self.peak_limit, self.limit)
+        if int(self.limit) > previous:
+            self._wake()
+
+    def on_throttle(self, retry_after=None):
+        """429/503: уменьшение вдвое и пауза на Retry-After"""
+        self.stats['throttled'] += 1
+        pause = retry_after if retry_after is not None else DEFAULT_BACKOFF
+        self.paused_until = max(self.paused_until, time.monotonic() + pause)
+        self._decrease(0.5, f'ограничение сервера, пауза {pause:.1f}с')
+
+    def on_error(self):
+        """Таймаут или разрыв соединения"""
+        self.stats['errors'] += 1
+        self._decrease(0.5, 'ошибка соединения')
+
+    def _decrease(self, factor, reason):
+        now = time.monotonic()
+        # Не чаще раза за характерное время ответа: пачка одновременных ошибок - одно событие
+        if now - self.last_decrease < max(1.0, self.latency or 1.0):
+            return
+        self.last_decrease = now
+        self.slow_start = False
+        self.limit = max(1.0, self.limit * factor)
+        self.rate = max(RATE_MIN, self.rate * factor)
+        print(f"Скорость снижена ({reason}): {self.summary()}")
+
+    def _wake(self):
+        # Окно выросло - будим ожидающих слот без блокировки на Condition
+        asyncio.get_running_loop().create_task(self._notify())
+
+    async def _notify(self):
+        async with self._slots:
+            self._slots.notify_all()
+
+    def snapshot(self):
+        return {
+            'rate': self.rate,
+            'concurrency': int(self.limit),
+            'in_flight': self.in_flight,
+            'latency': self.latency,
+            'peak_rate': self.peak_rate,
+            'peak_concurrency': int(self.peak_limit),
+            **self.stats,
+        }
+
+    def summary(self):
+        latency = f'{self.latency:.2f}с' if self.latency is not None else '-'
+        return (f"{self.rate:.1f} запр/с, окно {int(self.limit)}, в полёте {self.in_flight}, "
+                f"задержка {latency}, пик {self.peak_rate:.1f} запр/с / окно {int(self.peak_limit)}")
+
+# Общий контроллер для хоста AutoRia; начальное окно - MAX_CONCURRENT_REQUESTS
+rate_controller = RateController(int(os.getenv('MAX_CONCURRENT_REQUESTS', '10'))) if RATE_CONTROL else None
+
+if rate_controller is not None:
+    RATE.set_function(lambda: rate_controller.rate, param='rate')
+    RATE.set_function(lambda: int(rate_controller.limit), param='concurrency')
+    RATE.set_function(lambda: rate_controller.in_flight, param='in_flight')
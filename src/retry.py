@@ -0,0 +1,229 @@
+import asyncio
+import contextlib
+import heapq
+import itertools
+import logging
+import os
+import random
+import time
+from urllib.parse import urlsplit
+from dotenv import load_dotenv
+from db import run_db, load_dead_letters, save_dead_letters
+from metrics import BREAKER_TRIPS, DEAD_LETTERS, HTTP_RETRIES, log_event
+
+load_dotenv()
+
+# Попыток загрузки одной ссылки за запуск (первая попытка + повторы)
+RETRY_MAX_ATTEMPTS = max(1, int(os.getenv('RETRY_MAX_ATTEMPTS', '3')))
+# Пауза перед повтором: RETRY_BASE_DELAY * 2^(попытка - 1) со случайным разбросом, не больше RETRY_MAX_DELAY
+RETRY_BASE_DELAY = float(os.getenv('RETRY_BASE_DELAY', '1.0'))
+RETRY_MAX_DELAY = float(os.getenv('RETRY_MAX_DELAY', '60'))
+# Сколько запусков подряд повторять ссылку из dead_letters, прежде чем оставить её
+DEAD_LETTER_MAX_RUNS = int(os.getenv('DEAD_LETTER_MAX_RUNS', '3'))
+# Через сколько дней удалять из dead_letters ссылки, которые больше не повторяются
+DEAD_LETTER_KEEP_DAYS = int(os.getenv('DEAD_LETTER_KEEP_DAYS', '30'))
+# Предохранитель хоста: столько неудач подряд закрывают хост на BREAKER_COOLDOWN секунд
+# (каждое повторное срабатывание - вдвое дольше, до BREAKER_MAX_COOLDOWN)
+BREAKER_THRESHOLD = int(os.getenv('BREAKER_THRESHOLD', '10'))
+BREAKER_COOLDOWN = float(os.getenv('BREAKER_COOLDOWN', '30'))
+BREAKER_MAX_COOLDOWN = float(os.getenv('BREAKER_MAX_COOLDOWN', '300'))
+
+# Ответы, которые стоит повторить: ограничение скорости и временные ошибки сервера
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+# В dead_letters сохраняются только страницы авто: JSON объявления заменяет загрузка страницы,
+# выдачу продолжает фронтир, телефон запрашивается заново вместе с авто или backfill
+DEAD_LETTER_KIND = 'detail'
+
+class RetryLater(Exception):
+    """Временная ошибка запроса: ссылку нужно повторить не раньше чем через delay секунд"""
+
+    def __init__(self, reason, retry_after=None):
+        super().__init__(reason)
+        self.retry_after = retry_after
+        self.delay = None
+
+class CircuitBreaker:
+    """Предохранитель хоста: после BREAKER_THRESHOLD неудач подряд запросы ждут паузу.
+
+    По окончании паузы проходит один пробный запрос: успех закрывает предохранитель,
+    неудача открывает его снова на вдвое большее время. Запрос выполняется внутри
+    attempt(): пробный запрос, завершившийся без success()/failure() (отменён, оборван
+    по размеру), уступает пробу следующему ожидающему.
+    """
+
+    def __init__(self, host):
+        self.host = host
+        self.failures = 0
+        self.open_until = 0.0
+        self.cooldown = BREAKER_COOLDOWN
+        self.probing = False
+        self.trips = 0
+
+    async def wait(self):
+        """Ожидание, пока хост закрыт; True - вызывающий выполняет пробный запрос"""
+        while True:
+            now = time.monotonic()
+            if now < self.open_until:
+                await asyncio.sleep(self.open_until - now)
+            elif self.failures < BREAKER_THRESHOLD:
+                return False
+            elif not self.probing:
+                self.probing = True
+                return True
+            else:
+                # Идёт пробный запрос - ждём его результата
+                await asyncio.sleep(0.2)
+
+    @contextlib.asynccontextmanager
+    async def attempt(self):
+        """Ожидание хоста и запрос внутри блока; вызывается до того, как занять слот запроса"""
+        probe = await self.wait()
+        try:
+            yield self
+        finally:
+            # Проба без итога (отмена, исключение, оборванный ответ) не должна держать хост закрытым
+            if probe:
+                self.probing = False
+
+    def success(self):
+        if self.failures >= BREAKER_THRESHOLD:
+            print(f'Предохранитель {self.host}: хост снова доступен')
+        self.failures = 0
+        self.probing = False
+        self.cooldown = BREAKER_COOLDOWN
+
+    def failure(self):
+        self.failures += 1
+        self.probing = False
+        now = time.monotonic()
+        # Ответы запросов, отправленных до срабатывания, паузу не продлевают
+        if self.failures >= BREAKER_THRESHOLD and now >= self.open_until:
+            self.open_until = now + self.cooldown
+            self.trips += 1
+            BREAKER_TRIPS.inc(host=self.host)
+            print(f'Предохранитель {self.host}: {self.failures} неудач подряд, пауза {self.cooldown:g} с')
+            self.cooldown = min(self.cooldown * 2, BREAKER_MAX_COOLDOWN)
+
+class DelayQueue:
+    """Очередь отложенных повторов: элемент выдаётся не раньше своего срока"""
+
+    def __init__(self):
+        self.heap = []
+        self.seq = itertools.count()
+        self.pushed = asyncio.Event()
+        self.empty = asyncio.Event()
+        self.empty.set()
+
+    def __len__(self):
+        return len(self.heap)
+
+    def push(self, item, delay):
+        heapq.heappush(self.heap, (time.monotonic() + delay, next(self.seq), item))
+        self.pushed.set()
+        self.empty.clear()
+
+    async def pop_due(self):
+        """Ближайший по сроку элемент; ждёт его срока или появления элементов"""
+        while True:
+            wait = None
+            if self.heap:
+                wait = self.heap[0][0] - time.monotonic()
+                if wait <= 0:
+                    item = heapq.heappop(self.heap)[2]
+                    if not self.heap:
+                        self.empty.set()
+                    return item
+            # Новый элемент может оказаться раньше ожидаемого - просыпаемся и на push
+            self.pushed.clear()
+            try:
+                await asyncio.wait_for(self.pushed.wait(), wait)
+            except asyncio.TimeoutError:
+                pass
+
+    async def drained(self):
+        """Ожидание, пока все отложенные элементы не будут выданы"""
+        await self.empty.wait()
+
+class RetryScheduler:
+    """Бюджет попыток по ссылкам, паузы с разбросом, предохранители хостов и dead-letter.
+
+    Счётчик попыток хранится только для ссылок, которые сейчас повторяются. Исчерпавшие
+    бюджет страницы авто сохраняются в таблицу dead_letters; следующий запуск загружает
+    их заново (не больше DEAD_LETTER_MAX_RUNS запусков подряд).
+    """
+
+    def __init__(self):
+        self.attempts = {}
+        self.dead = {}  # url -> (тип, попыток, ошибка), ещё не сохранённые
+        self.retrying = set()  # ссылки из dead_letters, повторяемые в этом запуске
+        self.resolved = set()
+        self.breakers = {}
+        self.stats = {'retried': 0, 'dead': 0}
+
+    def breaker(self, url):
+        host = urlsplit(url).netloc
+        breaker = self.breakers.get(host)
+        if breaker is None:
+            breaker = self.breakers[host] = CircuitBreaker(host)
+        return breaker
+
+    def backoff(self, attempt, retry_after=None):
+        """Пауза перед повтором: половина экспоненты фиксирована, половина случайна"""
+        ceiling = min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** (attempt - 1))
+        delay = ceiling / 2 + random.uniform(0, ceiling / 2)
+        return max(delay, retry_after or 0.0)
+
+    def failed(self, url, kind, error, budget=None):
+        """Учёт неудачной попытки: пауза до повтора или None, если бюджет исчерпан"""
+        attempt = self.attempts.get(url, 0) + 1
+        if attempt >= (budget or RETRY_MAX_ATTEMPTS):
+            self.attempts.pop(url, None)
+            self.retrying.discard(url)
+            if kind == DEAD_LETTER_KIND:
+                self.dead[url] = (kind, attempt, str(error))
+            self.stats['dead'] += 1
+            DEAD_LETTERS.inc(kind=kind)
+            log_event(logging.WARNING, 'http_failed', url=url, attempts=attempt, error=str(error))
+            return None
+        self.attempts[url] = attempt
+        delay = self.backoff(attempt, error.retry_after)
+        self.stats['retried'] += 1
+        HTTP_RETRIES.inc(kind=kind)
+        log_event(logging.WARNING, 'http_retry', url=url, attempt=attempt, error=str(error), wait=round(delay, 2))
+        return delay
+
+    def succeeded(self, url):
+        """Ссылка обработана окончательно (ответ получен или ошибка не временная)"""
+        self.attempts.pop(url, None)
+        if url in self.retrying:
+            self.retrying.discard(url)
+            self.resolved.add(url)
+
+    async def load(self):
+        """Ссылки из dead_letters прошлых запусков для повторной загрузки"""
+        urls = await self.watch()
+        if urls:
+            print(f'Dead-letter: повторная загрузка {len(urls)} ссылок прошлых запусков')
+        return urls
+
+    async def watch(self):
+        """Отметка ссылок из dead_letters без их загрузки: успех удалит ссылку из таблицы,
+        неудача засчитает запуск (воркеры обрабатывают ссылки, поставленные планировщиком)"""
+        urls = await run_db(load_dead_letters, DEAD_LETTER_KIND, DEAD_LETTER_MAX_RUNS, DEAD_LETTER_KEEP_DAYS)
+        self.retrying.update(urls)
+        return urls
+
+    async def save(self):
+        """Сохранение новых dead-letter и удаление повторно загруженных ссылок"""
+        rows = [(url, kind, attempts, error) for url, (kind, attempts, error) in self.dead.items()]
+        resolved = self.resolved
+        self.dead, self.resolved = {}, set()
+        if rows or resolved:
+            await run_db(save_dead_letters, rows, resolved)
+
+    def summary(self):
+        trips = sum(breaker.trips for breaker in self.breakers.values())
+        return (f"повторов: {self.stats['retried']}, исчерпали попытки: {self.stats['dead']}, "
+                f"срабатываний предохранителя: {trips}")
+
+retries = RetryScheduler()
@@ -1,12 +1,28 @@
 import asyncio
-import aiohttp
+from collections import deque
 from bs4 import BeautifulSoup, Tag
 from datetime import datetime
-from db import get_conn
+from db import run_db, write_cars, select_known_ids, CarRecord, CarWriter, UnchangedListing
+from incremental import INCREMENTAL, IdSet, load_known, listing_id
+from frontier import FRONTIER, WORKER_ID, WORKER_POLL_INTERVAL, Frontier, WorkQueue
+from freshness import FRESH_START_URL, FRESH_MAX_PAGES, FRESH_STOP_PAGES, freshness
+from fingerprint import FINGERPRINT, load_fingerprint_index
+from http_cache import http_cache
+from extract import extract_car_fields, car_fields_from_json
+import phones
+from phones import AUTORIA_BASE_URL, PHONE_MODE, PHONE_WORKERS, SEARCH_VIEW_URL, resolve_phone
+from ratelimit import rate_controller, parse_retry_after
+from retry import RETRY_STATUSES, DelayQueue, RetryLater, retries
+import transport
+from transport import HEADERS, PAGE_TIMEOUT, BodyTooLarge, TransportError, make_transport
+import json
 import os
 from dotenv import load_dotenv
+import logging
 import re
 import time
+from metrics import (CARS, EXTRACT_SOURCE, HTTP_REQUESTS, IN_FLIGHT, QUEUE_DEPTH, STAGE_SECONDS,
+                     log_event)
 
 load_dotenv()
 START_URL = os.getenv('START_URL')
@@ -18,75 +34,135 @@ REQUEST_DELAY = float(os.getenv('REQUEST_DELAY', '0.2'))
 BATCH_DELAY = float(os.getenv('BATCH_DELAY', '2.0'))
 MAX_PAGES = int(os.getenv('MAX_PAGES', '1000'))
 
-HEADERS = {
-    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
-}
+# Количество страниц выдачи, загружаемых параллельно наперёд (1 - последовательно)
+LISTING_WINDOW = max(1, int(os.getenv('LISTING_WINDOW', '4')))
+# Минимальный интервал между началом загрузок страниц выдачи в секундах
+LISTING_DELAY = float(os.getenv('LISTING_DELAY', '0.25'))
+
+# Количество процессов для разбора HTML (0 - разбор в event loop)
+PARSE_PROCESSES = int(os.getenv('PARSE_PROCESSES', '0'))
+
+# Режим работы: batch (сбор ссылок, затем батчи), pipeline (потоковый конвейер)
+# или distributed (только выдача, страницы авто обрабатывают воркеры --worker)
+SCRAPE_MODE = os.getenv('SCRAPE_MODE', 'batch')
+# Настройки конвейера: размер очередей и количество воркеров на стадию
+QUEUE_SIZE = int(os.getenv('QUEUE_SIZE', '100'))
+DETAIL_WORKERS = int(os.getenv('DETAIL_WORKERS', str(MAX_CONCURRENT_REQUESTS)))
+PARSE_WORKERS = int(os.getenv('PARSE_WORKERS', '2'))
+DB_WORKERS = int(os.getenv('DB_WORKERS', '1'))
+# Одновременных задач в одном воркере распределённого режима
+WORKER_TASKS = int(os.getenv('WORKER_TASKS', str(MAX_CONCURRENT_REQUESTS)))
+
+# Источник полей авто: html - страница объявления, json - ответ searchPage/v2 одним запросом
+# (вместе с телефоном); страница загружается, только если в JSON нет полей JSON_FALLBACK_FIELDS
+EXTRACT_MODE = os.getenv('EXTRACT_MODE', 'html')
+JSON_FALLBACK_FIELDS = tuple(
+    field.strip() for field in os.getenv('JSON_FALLBACK_FIELDS', 'title,price_usd,odometer').split(',')
+    if field.strip()
+)
 
 # Семафор для ограничения количества одновременных запросов
 semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
 
-async def fetch(session, url, max_retries=3):
-    """Безопасный fetch с повторными попытками и семафором"""
-    async with semaphore:  # Ограничиваем количество одновременных запросов
-        for attempt in range(max_retries):
-            try:
-                timeout = aiohttp.ClientTimeout(total=30, connect=10)
-                async with session.get(url, headers=HEADERS, timeout=timeout) as resp:
-                    if resp.status == 200:
-                        return await resp.text()
-                    else:
-                        print(f"Статус {resp.status} для {url}")
-                        if resp.status in [429, 503]:  # Rate limiting или сервер недоступен
-                            await asyncio.sleep(5)  # Дольше ждем при лимитах
-                        return None
-            except (aiohttp.ClientError, asyncio.TimeoutError, aiohttp.ServerDisconnectedError) as e:
-                if attempt < max_retries - 1:
-                    wait_time = 2 ** attempt  # Экспоненциальная задержка
-                    print(f"Попытка {attempt + 1} не удалась для {url}: {e}. Ждем {wait_time}с")
-                    await asyncio.sleep(wait_time)
-                    continue
-                else:
-                    print(f"Ошибка загрузки {url} после {max_retries} попыток: {e}")
-                    return None
-        return None
+_parse_pool = None
 
-async def fetch_phone(session, car_id, url):
-    """Получение телефона несколькими способами с семафором"""
-    async with semaphore:  # Ограничиваем одновременные запросы
-        try:
-            # Способ 1: API для получения телефона
-            api_url = f'https://auto.ria.com/users/phones/{car_id}?all'
-            timeout = aiohttp.ClientTimeout(total=15)
-            async with session.get(api_url, headers=HEADERS, timeout=timeout) as resp:
-                if resp.status == 200:
-                    try:
-                        data = await resp.json()
-                        if isinstance(data, list) and data:
-                            phone = data[0].get('phone')
-                            if phone:
-                                return re.sub(r'\D', '', phone)
-                    except:
-                        pass
-        except Exception as e:
-            print(f"Ошибка получения телефона API1 для {car_id}: {e}")
-        
+async def fetch(session, url, max_retries=None, kind='detail', defer=False):
+    """Загрузка страницы с повторными попытками, семафором и дисковым кэшем.
+
+    Слот одновременных запросов занят только на время самого запроса: пауза перед
+    повтором проходит вне его. С defer=True пауза здесь не выжидается - временная ошибка
+    выбрасывается как RetryLater (с delay), и вызывающий откладывает ссылку в очередь повторов.
+    """
+    with STAGE_SECONDS.time(stage=f'fetch_{kind}'):
+        return await _fetch(session, url, max_retries, kind, defer)
+
+async def _fetch(session, url, max_retries, kind, defer):
+    entry = None
+    if http_cache is not None:
+        entry = await asyncio.to_thread(http_cache.lookup, url)
+        if entry and (http_cache.offline or http_cache.is_fresh(entry)):
+            http_cache.stats['hits'] += 1
+            return await asyncio.to_thread(http_cache.read, entry)
+        http_cache.stats['misses'] += 1
+        if http_cache.offline:
+            return None
+
+    # Общие заголовки заданы в сессии транспорта, здесь - только валидаторы кэша
+    headers = None
+    if entry:
+        # Условный запрос: при неизменной странице сервер ответит 304 без тела
+        headers = http_cache.validators(entry)
+
+    while True:
         try:
-            # Способ 2: Альтернативный API
-            api_url2 = f'https://auto.ria.com/demo/bu/searchPage/v2/view/auto/{car_id}?lang_id=4'
-            timeout = aiohttp.ClientTimeout(total=15)
-            async with session.get(api_url2, headers=HEADERS, timeout=timeout) as resp:
-                if resp.status == 200:
-                    try:
-                        data = await resp.json()
-                        phone = data.get('userInfo', {}).get('phone')
-                        if phone:
-                            return re.sub(r'\D', '', phone)
-                    except:
-                        pass
-        except Exception as e:
-            print(f"Ошибка получения телефона API2 для {car_id}: {e}")
-        
-        return None
+            html = await _request(session, url, kind, entry, headers)
+        except RetryLater as e:
+            e.delay = retries.failed(url, kind, e, max_retries)
+            if e.delay is None:
+                return None
+            if defer:
+                raise
+            await asyncio.sleep(e.delay)
+            continue
+        retries.succeeded(url)
+        return html
+
+async def _request(session, url, kind, entry, headers):
+    """Одна попытка запроса; временные ошибки выбрасываются как RetryLater"""
+    # Закрытый предохранителем хост ждём до того, как занять слот
+    async with retries.breaker(url).attempt() as breaker:
+        # При адаптивном управлении окно одновременных запросов задаёт контроллер
+        limiter = rate_controller.slot() if rate_controller is not None else semaphore
+        async with limiter:  # Ограничиваем количество одновременных запросов
+            if rate_controller is not None:
+                await rate_controller.acquire_token()
+            started = time.monotonic()
+            IN_FLIGHT.inc(kind=kind)
+            try:
+                resp = await session.get(url, headers=headers, timeout=PAGE_TIMEOUT)
+            except TransportError as e:
+                HTTP_REQUESTS.inc(kind=kind, status='error')
+                if rate_controller is not None:
+                    rate_controller.on_error()
+                breaker.failure()
+                raise RetryLater(str(e)) from e
+            except BodyTooLarge as e:
+                # Ответ оборван на лимите размера: хост доступен, повтор не поможет
+                HTTP_REQUESTS.inc(kind=kind, status='too_large')
+                log_event(logging.WARNING, 'body_too_large', url=url, error=str(e))
+                breaker.success()
+                return None
+            finally:
+                IN_FLIGHT.dec(kind=kind)
+
+            HTTP_REQUESTS.inc(kind=kind, status=resp.status)
+            if resp.status == 200:
+                html = resp.text()
+                breaker.success()
+                if rate_controller is not None:
+                    rate_controller.on_success(time.monotonic() - started)
+                if http_cache is not None:
+                    await asyncio.to_thread(http_cache.store, url, html, resp.headers)
+                return html
+            elif resp.status == 304 and entry:
+                breaker.success()
+                http_cache.stats['revalidated'] += 1
+                await asyncio.to_thread(http_cache.touch, url, entry)
+                return await asyncio.to_thread(http_cache.read, entry)
+            log_event(logging.WARNING, 'http_status', url=url, status=resp.status)
+            if resp.status in RETRY_STATUSES:
+                retry_after = parse_retry_after(resp.headers.get('Retry-After'))
+                if resp.status in (429, 503):  # Rate limiting или сервер недоступен
+                    if rate_controller is not None:
+                        # Контроллер снижает скорость и приостанавливает отправку на Retry-After
+                        rate_controller.on_throttle(retry_after)
+                    elif retry_after is None:
+                        retry_after = 5.0  # Дольше ждем при лимитах
+                breaker.failure()
+                raise RetryLater(f'HTTP {resp.status}', retry_after)
+            # 404 и прочие ответы не повторяются: хост при этом доступен
+            breaker.success()
+            return None
 
 def parse_odometer(odometer_str):
     """Преобразует "95 тыс." в 95000"""
@@ -241,252 +317,824 @@ def safe_parse_car_details(soup):
         pass
     return None, None
 
-async def parse_car_page(session, url):
-    """Парсинг страницы автомобиля с отдельной обработкой каждого поля"""
+def parse_car_html(html, url):
+    """Разбор HTML страницы автомобиля в словарь полей (без телефона и даты)"""
+    soup = BeautifulSoup(html, 'lxml')
+
+    # Все поля за один проход по дереву (результат как у safe_parse_*)
+    fields = extract_car_fields(soup, parse_odometer)
+    data_id = fields.pop('data_id')
+
+    # Получение ID объявления
+    car_id = None
     try:
-        html = await fetch(session, url)
-        if not html:
-            print(f"Не удалось загрузить {url}")
-            return None
-        
-        soup = BeautifulSoup(html, 'lxml')
-        
-        # Безопасный парсинг каждого поля отдельно
-        title = safe_parse_title(soup)
-        price_usd = safe_parse_price(soup)
-        odometer = safe_parse_odometer(soup)
-        username = safe_parse_username(soup)
-        image_url, images_count = safe_parse_images(soup)
-        car_number, car_vin = safe_parse_car_details(soup)
-        
-        # Получение ID объявления
-        car_id = None
+        match = re.search(r'/([0-9]{6,})', url)
+        if match:
+            car_id = match.group(1)
+        if not car_id:
+            car_id = data_id
+    except Exception as e:
+        log_event(logging.WARNING, 'car_id_error', url=url, error=repr(e))
+
+    return {'url': url, 'car_id': car_id, **fields}
+
+def get_parse_pool():
+    """Пул процессов для разбора HTML, создаётся при первом обращении"""
+    global _parse_pool
+    if _parse_pool is None and PARSE_PROCESSES > 0:
+        # multiprocessing не загружается стадиями без разбора в процессах (discover)
+        from concurrent.futures import ProcessPoolExecutor
+
+        _parse_pool = ProcessPoolExecutor(max_workers=PARSE_PROCESSES)
+    return _parse_pool
+
+def shutdown_parse_pool():
+    """Остановка пула разбора; пул общий для всех запусков процесса, поэтому
+    останавливается при завершении процесса (стадии main.py), а не после запуска"""
+    global _parse_pool
+    if _parse_pool is not None:
+        _parse_pool.shutdown(wait=True)
+        _parse_pool = None
+
+async def close_parse_pool():
+    """shutdown_parse_pool вне event loop: ожидание процессов разбора не блокирует запросы"""
+    await asyncio.to_thread(shutdown_parse_pool)
+
+async def parse_html(html, url):
+    """Разбор страницы авто: в пуле процессов (PARSE_PROCESSES > 0) или в текущем потоке"""
+    pool = get_parse_pool()
+    with STAGE_SECONDS.time(stage='parse'):
+        if pool is None:
+            return parse_car_html(html, url)
+        # В процесс уходит только строка HTML, обратно - словарь простых значений
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(pool, parse_car_html, html, url)
+
+async def complete_car(session, parsed):
+    """Дополнение разобранной страницы телефоном и датой сохранения, возвращает CarRecord"""
+    url = parsed['url']
+    car_id = parsed['car_id']
+    seller_id = parsed.get('seller_id')
+
+    # Получение телефона: в режиме json он уже есть в ответе; в режиме deferred
+    # его заполнит backfill, в офлайн-режиме кэша сайт не запрашиваем
+    phone_number = parsed.get('phone')
+    offline = http_cache is not None and http_cache.offline
+    if phone_number is None and car_id and PHONE_MODE == 'inline' and not offline:
         try:
-            match = re.search(r'/([0-9]{6,})', url)
-            if match:
-                car_id = match.group(1)
-            if not car_id:
-                id_tag = soup.find('div', {'data-id': True})
-                if id_tag and isinstance(id_tag, Tag):
-                    car_id = id_tag.get('data-id')
+            phone_number = await resolve_phone(session, car_id, seller_id, url)
         except Exception as e:
-            print(f"Ошибка получения car_id из {url}: {e}")
-        
-        # Получение телефона
-        phone_number = None
-        if car_id:
-            try:
-                phone_number = await fetch_phone(session, car_id, url)
-            except Exception as e:
-                print(f"Ошибка получения телефона для {url}: {e}")
-        
+            log_event(logging.WARNING, 'phone_error', url=url, error=repr(e))
+
+    # Ключ объявления в БД: ID из ссылки (как в инкрементальном индексе), иначе из разметки
+    key = listing_id(url)
+    if key is None and car_id and str(car_id).isdigit():
+        key = int(car_id)
+    return CarRecord(
+        listing_id=key,
+        url=url,
+        title=parsed['title'],
+        price_usd=parsed['price_usd'],
+        odometer=parsed['odometer'],
+        username=parsed['username'],
+        phone_number=phone_number,
+        image_url=parsed['image_url'],
+        images_count=parsed['images_count'],
+        car_number=parsed['car_number'],
+        car_vin=parsed['car_vin'],
         # Дата сохранения
-        datetime_found = datetime.now()
-        
-        return {
-            'url': url,
-            'title': title,
-            'price_usd': price_usd,
-            'odometer': odometer,
-            'username': username,
-            'phone_number': phone_number,
-            'image_url': image_url,
-            'images_count': images_count,
-            'car_number': car_number,
-            'car_vin': car_vin,
-            'datetime_found': datetime_found
-        }
+        datetime_found=datetime.now(),
+        content_hash=parsed.get('content_hash'),
+        fields_hash=parsed.get('fields_hash'),
+    )
+
+async def fetch_car_source(session, url, defer=False):
+    """Загрузка данных объявления: (поля из JSON или None, HTML страницы или None).
+
+    В режиме json сначала запрашивается searchPage/v2; страница загружается, только если
+    ответа нет или в нём не хватает полей JSON_FALLBACK_FIELDS.
+    """
+    if EXTRACT_MODE != 'json':
+        return None, await fetch(session, url, defer=defer)
+    fields = None
+    car_id = listing_id(url)
+    if car_id is not None:
+        body = await fetch(session, SEARCH_VIEW_URL.format(car_id), kind='api', defer=defer)
+        if body:
+            try:
+                fields = {'url': url, **car_fields_from_json(json.loads(body))}
+            except (ValueError, TypeError, AttributeError) as e:
+                log_event(logging.WARNING, 'json_parse_failed', url=url, error=repr(e))
+    if fields is not None and all(fields.get(field) is not None for field in JSON_FALLBACK_FIELDS):
+        EXTRACT_SOURCE.inc(source='json')
+        return fields, None
+    html = await fetch(session, url, defer=defer)
+    EXTRACT_SOURCE.inc(source='html' if fields is None else 'json+html')
+    return fields, html
+
+def merge_car_fields(fields, page):
+    """Поля из JSON, недостающие дополнены разбором HTML"""
+    if fields is None:
+        return page
+    for key, value in page.items():
+        if fields.get(key) is None:
+            fields[key] = value
+    return fields
+
+def unchanged_fields(fingerprints, parsed, content=None):
+    """Проверка отпечатка полей (FINGERPRINT=1): UnchangedListing, если авто не изменилось"""
+    if fingerprints is None:
+        return None
+    parsed['content_hash'] = content
+    return fingerprints.check_fields(parsed['url'], parsed)
+
+async def parse_car_page(session, url, defer=False, fingerprints=None):
+    """Парсинг страницы автомобиля с отдельной обработкой каждого поля.
+
+    С defer=True временная ошибка загрузки выбрасывается как RetryLater (см. fetch).
+    С отпечатками вместо авто возвращается UnchangedListing, если объявление не изменилось.
+    """
+    try:
+        fields, html = await fetch_car_source(session, url, defer)
+        content = None
+        if html and fingerprints is not None:
+            unchanged, content = fingerprints.check_page(url, html)
+            if unchanged is not None:
+                return unchanged
+        if html:
+            fields = merge_car_fields(fields, await parse_html(html, url))
+        if fields is None:
+            log_event(logging.WARNING, 'detail_fetch_failed', url=url)
+            return None
+
+        return unchanged_fields(fingerprints, fields, content) or await complete_car(session, fields)
+    except RetryLater:
+        raise
     except Exception as e:
-        print(f'Критическая ошибка парсинга {url}: {e}')
+        log_event(logging.ERROR, 'parse_failed', url=url, error=repr(e))
         return None
 
-async def get_all_car_links(session, start_url):
-    """Сбор всех ссылок на автомобили с улучшенной устойчивостью"""
-    links = set()
-    page = 1
-    
-    while page <= MAX_PAGES:
-        try:
-            url = f"{start_url}?page={page}"
-            print(f"Парсинг страницы {page}...")
-            html = await fetch(session, url)
-            
-            if not html:
-                print(f"Не удалось загрузить страницу {page}")
-                break
-                
-            soup = BeautifulSoup(html, 'lxml')
-            
-            # Ищем ссылки на авто по разным селекторам
-            car_links = []
-            
-            # Пробуем разные селекторы для ссылок
-            selectors = [
-                'a.address',
-                'a[href*="auto_"]',
-                '.item.ticket-title a',
-                '.content-bar a[href*="auto"]'
-            ]
-            
-            for selector in selectors:
-                found_links = soup.select(selector)
-                if found_links:
-                    car_links = found_links
+def extract_car_links(html):
+    """Извлечение абсолютных ссылок на авто со страницы выдачи (в порядке страницы)"""
+    soup = BeautifulSoup(html, 'lxml')
+
+    # Ищем ссылки на авто по разным селекторам
+    car_links = []
+
+    # Пробуем разные селекторы для ссылок
+    selectors = [
+        'a.address',
+        'a[href*="auto_"]',
+        '.item.ticket-title a',
+        '.content-bar a[href*="auto"]'
+    ]
+
+    for selector in selectors:
+        found_links = soup.select(selector)
+        if found_links:
+            car_links = found_links
+            break
+
+    hrefs = []
+    for link in car_links:
+        if isinstance(link, Tag):
+            href = link.get('href')
+            if href and isinstance(href, str) and 'auto_' in href:
+                # Делаем абсолютную ссылку
+                if href.startswith('/'):
+                    href = AUTORIA_BASE_URL + href
+                hrefs.append(href)
+    return hrefs, bool(car_links)
+
+async def _fetch_listing(session, url, wait):
+    # Загрузка страницы выдачи в назначенное время (интервал LISTING_DELAY между началами загрузок)
+    if wait > 0:
+        await asyncio.sleep(wait)
+    return await fetch(session, url, kind='listing')
+
+async def iter_listing_pages(session, start_url, first_page=1, outcome=None, max_pages=None):
+    """Обход страниц выдачи до max_pages (по умолчанию MAX_PAGES): отдаёт (номер страницы, список новых ссылок).
+
+    Держит в полёте до LISTING_WINDOW страниц наперёд, но обрабатывает их строго
+    по порядку, поэтому набор ссылок и точка остановки совпадают с последовательным обходом.
+    Начала загрузок разнесены на LISTING_DELAY: задержка ограничивает частоту запросов
+    выдачи, а не добавляет простой после обработки каждой страницы.
+    В outcome['complete'] отмечается, что выдача пройдена до конца, а не прервана ошибкой.
+    """
+    # Дедупликация по числовому ID: битовая карта вместо множества строк-ссылок
+    seen_ids = IdSet()
+    seen_urls = set()  # только ссылки без ID
+    pending = {}  # номер страницы -> задача загрузки
+    last_start = None  # время начала последней назначенной загрузки
+    next_page = first_page
+    page = first_page
+    if max_pages is None:
+        max_pages = MAX_PAGES
+    # Выдача может быть задана уже с параметрами (например, сортировкой)
+    page_url = start_url + ('&' if '?' in start_url else '?') + 'page='
+    if outcome is None:
+        outcome = {}
+    outcome['complete'] = False
+
+    try:
+        while page <= max_pages:
+            try:
+                # Дополняем окно спекулятивных загрузок
+                while len(pending) < LISTING_WINDOW and next_page <= max_pages:
+                    now = time.monotonic()
+                    last_start = now if last_start is None else max(now, last_start + LISTING_DELAY)
+                    pending[next_page] = asyncio.create_task(
+                        _fetch_listing(session, f"{page_url}{next_page}", last_start - now))
+                    next_page += 1
+
+                log_event(logging.DEBUG, 'listing_fetch', page=page)
+                html = await pending.pop(page)
+
+                if not html:
+                    print(f"Не удалось загрузить страницу {page}")
                     break
-            
-            if not car_links:
-                print(f"Не найдено ссылок на странице {page}")
-                break
-            
-            new_links_count = 0
-            for link in car_links:
-                if isinstance(link, Tag):
-                    href = link.get('href')
-                    if href and isinstance(href, str) and 'auto_' in href:
-                        # Делаем абсолютную ссылку
-                        if href.startswith('/'):
-                            href = 'https://auto.ria.com' + href
-                        if href not in links:
-                            links.add(href)
-                            new_links_count += 1
-            
-            print(f"Страница {page}: найдено {new_links_count} новых ссылок")
-            
-            if new_links_count == 0:
-                print("Новых ссылок нет, завершаем парсинг страниц")
+
+                hrefs, found = extract_car_links(html)
+                if not found:
+                    print(f"Не найдено ссылок на странице {page}")
+                    outcome['complete'] = True
+                    break
+
+                new_links = []
+                for href in hrefs:
+                    car_id = listing_id(href)
+                    if car_id is not None:
+                        is_new = seen_ids.add(car_id)
+                    else:
+                        is_new = href not in seen_urls
+                        seen_urls.add(href)
+                    if is_new:
+                        new_links.append(href)
+
+                log_event(logging.INFO, 'listing_page', page=page, new_links=len(new_links))
+
+                if not new_links:
+                    print("Новых ссылок нет, завершаем парсинг страниц")
+                    outcome['complete'] = True
+                    break
+
+                yield page, new_links
+
+                page += 1
+
+            except Exception as e:
+                print(f"Ошибка на странице {page}: {e}")
                 break
-                
-            page += 1
-            
-            # Небольшая задержка между запросами страниц
-            await asyncio.sleep(1.0)
-            
-        except Exception as e:
-            print(f"Ошибка на странице {page}: {e}")
-            break
-    
-    return list(links)
+        else:
+            outcome['complete'] = True
+    finally:
+        # Конец выдачи найден - отменяем загрузки страниц за её пределами
+        for task in pending.values():
+            task.cancel()
+
+async def iter_links_to_fetch(session, known=None, frontier=None):
+    """Ссылки для загрузки пачками: отдаёт (найдено на странице, ссылки после фильтров).
+
+    С фронтиром сначала отдаются ссылки, не завершённые прошлым запуском, затем выдача
+    продолжается со страницы после контрольной точки; каждая страница сохраняется в БД
+    до того, как её ссылки уходят в работу. Ссылки из dead_letters прошлых запусков
+    отдаются первыми.
+    """
+    retry_urls = set(await retries.load())
+    if retry_urls:
+        yield 0, list(retry_urls)
+    first_page = 1
+    if frontier is not None:
+        async for urls in frontier.iter_pending():
+            yield 0, urls
+        if frontier.discovery_done:
+            return
+        first_page = frontier.start_page
+
+    outcome = {}
+    async for page, new_links in iter_listing_pages(session, START_URL, first_page, outcome):
+        urls = new_links
+        if retry_urls:
+            # Уже отданы в начале запуска
+            urls = [url for url in urls if url not in retry_urls]
+        if known is not None:
+            urls = [url for url in urls if known.should_fetch(url)]
+        if frontier is not None:
+            urls = await frontier.add_page(page, urls)
+        yield len(new_links), urls
+
+    # Прерванный ошибкой обход выдачи продолжится с контрольной точки при следующем запуске
+    if frontier is not None and outcome['complete']:
+        await frontier.finish_discovery()
 
 async def save_to_db(car):
-    """Сохранение в БД с обработкой ошибок"""
+    """Построчное сохранение в БД (через пул потоков) с обработкой ошибок"""
     try:
-        with get_conn() as conn:
-            with conn.cursor() as cur:
-                cur.execute('''
-                    INSERT INTO cars (url, title, price_usd, odometer, username, phone_number, image_url, images_count, car_number, car_vin, datetime_found)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                    ON CONFLICT (url) DO NOTHING;
-                ''', (
-                    car['url'], car['title'], car['price_usd'], car['odometer'], car['username'],
-                    car['phone_number'], car['image_url'], car['images_count'], car['car_number'],
-                    car['car_vin'], car['datetime_found']
-                ))
-                conn.commit()
+        await run_db(write_cars, [car])
         return True
     except Exception as e:
-        print(f"Ошибка сохранения в БД: {e}")
+        log_event(logging.ERROR, 'db_error', url=car.url, error=repr(e))
         return False
 
-async def process_batch(session, urls):
-    """Обработка батча ссылок"""
-    results = []
-    for url in urls:
+async def process_batch(session, urls, writer, frontier=None, fingerprints=None):
+    """Обработка батча ссылок, разобранные авто уходят в буфер записи.
+
+    Ссылка с временной ошибкой не задерживает остальные: она откладывается в очередь
+    повторов и загружается после паузы, когда очередь ссылок батча опустеет.
+    Возвращает количество разобранных авто (сами записи не удерживаются).
+    """
+    parsed = 0
+    pending = deque(urls)
+    delayed = DelayQueue()
+    while pending or delayed:
+        url = pending.popleft() if pending else await delayed.pop_due()
         try:
-            car = await parse_car_page(session, url)
-            if car:
-                if await save_to_db(car):
-                    results.append(car)
-                    print(f"✓ Сохранено: {car['title'] or 'Без названия'} - {url}")
-                else:
-                    print(f"✗ Ошибка сохранения: {url}")
+            car = await parse_car_page(session, url, defer=True, fingerprints=fingerprints)
+            if isinstance(car, UnchangedListing):
+                await writer.add(car)
+                CARS.inc(result='unchanged')
+            elif car:
+                await writer.add(car)
+                parsed += 1
+                CARS.inc(result='parsed')
+                log_event(logging.DEBUG, 'car_parsed', url=url, title=car.title)
             else:
-                print(f"✗ Ошибка парсинга: {url}")
+                CARS.inc(result='failed')
+                log_event(logging.WARNING, 'car_failed', url=url)
+                if frontier is not None:
+                    await frontier.mark_failed(url)
+        except RetryLater as e:
+            delayed.push(url, e.delay)
+            continue
         except Exception as e:
-            print(f"✗ Ошибка обработки {url}: {e}")
+            CARS.inc(result='failed')
+            log_event(logging.ERROR, 'car_error', url=url, error=repr(e))
         
         # Небольшая задержка между обработкой каждой ссылки в батче
-        await asyncio.sleep(REQUEST_DELAY)
+        # (при адаптивном управлении темп задаёт контроллер)
+        if rate_controller is None:
+            await asyncio.sleep(REQUEST_DELAY)
     
-    return results
+    return parsed
+
+async def scrape_batches(session, known=None, frontier=None, fingerprints=None, links=None):
+    """Режим батчей: ссылки с выдачи набираются в батчи по BATCH_SIZE и обрабатываются.
+
+    В памяти держится только текущий батч, поэтому память не растёт с MAX_PAGES.
+    links - другой источник пар (найдено, ссылки) вместо выдачи, например файл стадии discover.
+    """
+    print("Сбор ссылок и обработка батчами...")
+    found = 0
+    total_processed = 0
+    total_parsed = 0
+    batch_num = 0
+    writer = CarWriter(mark_done=frontier is not None)
+
+    async def run_batch(batch):
+        nonlocal total_processed, total_parsed, batch_num
+        batch_num += 1
+        # Задержка между батчами (при адаптивном управлении темп задаёт контроллер)
+        if batch_num > 1 and rate_controller is None:
+            print("Пауза между батчами...")
+            await asyncio.sleep(BATCH_DELAY)
+
+        print(f"\n--- Обработка батча {batch_num} ({len(batch)} ссылок) ---")
+
+        try:
+            # Создаем задачи для батча
+            tasks = []
+            for j in range(0, len(batch), MAX_CONCURRENT_REQUESTS):
+                mini_batch = batch[j:j + MAX_CONCURRENT_REQUESTS]
+                tasks.append(process_batch(session, mini_batch, writer, frontier, fingerprints))
+
+            # Выполняем задачи батча
+            batch_results = await asyncio.gather(*tasks, return_exceptions=True)
+
+            # Подсчитываем результаты
+            for result in batch_results:
+                if isinstance(result, Exception):
+                    print(f"Ошибка в батче: {result}")
+                else:
+                    total_parsed += result
+
+            total_processed += len(batch)
+
+            await writer.flush_if_due()
+            print(f"Батч {batch_num} завершен. Обработано: {total_processed}, "
+                  f"Разобрано: {total_parsed}, Сохранено: {writer.inserted}")
+            if rate_controller is not None:
+                print(f"Скорость: {rate_controller.summary()}")
+
+        except Exception as e:
+            print(f"Ошибка обработки батча {batch_num}: {e}")
+
+    # Обрабатываем ссылки батчами для стабильности
+    batch = []
+    if links is None:
+        links = iter_links_to_fetch(session, known, frontier)
+    async for page_found, urls in links:
+        found += page_found
+        batch.extend(urls)
+        while len(batch) >= BATCH_SIZE:
+            await run_batch(batch[:BATCH_SIZE])
+            del batch[:BATCH_SIZE]
+    if batch:
+        await run_batch(batch)
+
+    if not found and not total_processed:
+        print("Ссылки не найдены. Проверьте селекторы или сайт.")
+        return
+
+    await writer.flush()
+    print(f'\n=== Парсинг завершён ===')
+    print(f'Найдено ссылок: {found}, всего обработано: {total_processed}')
+    print(f'Успешно сохранено: {writer.inserted} автомобилей, обновлено: {writer.updated}, '
+          f'без изменений: {writer.touched}, пропущено дублей: {writer.skipped}, '
+          f'перевыставлено: {writer.relisted}, ошибок записи: {writer.failed}')
+    if known is not None:
+        print(f'Инкрементальный режим: {known.summary()}')
+    if fingerprints is not None:
+        print(f'Отпечатки: {fingerprints.summary()}')
+
+async def _stage_worker(inbox, handler):
+    """Воркер стадии конвейера: берёт элементы из очереди и передаёт в обработчик"""
+    while True:
+        item = await inbox.get()
+        try:
+            await handler(item)
+        except Exception as e:
+            log_event(logging.ERROR, 'stage_error', error=repr(e))
+        finally:
+            inbox.task_done()
+
+async def scrape_pipeline(session, known=None, frontier=None, fingerprints=None):
+    """Режим конвейера: выдача -> загрузка -> разбор -> запись в БД через ограниченные очереди"""
+    url_queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+    html_queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+    phone_queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+    car_queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+    # Ссылки с временной ошибкой ждут повтора здесь, не занимая воркеров загрузки
+    retry_queue = DelayQueue()
+    stats = {'found': 0, 'fetched': 0, 'parsed': 0, 'failed': 0}
+    writer = CarWriter(mark_done=frontier is not None)
+
+    async def produce_links():
+        async for page_found, urls in iter_links_to_fetch(session, known, frontier):
+            stats['found'] += page_found
+            for url in urls:
+                # put() блокируется при заполненной очереди - так работает backpressure
+                await url_queue.put(url)
+
+    async def fetch_detail(url):
+        try:
+            fields, html = await fetch_car_source(session, url, defer=True)
+        except RetryLater as e:
+            retry_queue.push(url, e.delay)
+            return
+        if html:
+            stats['fetched'] += 1
+            content = None
+            if fingerprints is not None:
+                unchanged, content = fingerprints.check_page(url, html)
+                if unchanged is not None:
+                    # Страница не изменилась - разбор, телефон и upsert не нужны
+                    CARS.inc(result='unchanged')
+                    await car_queue.put(unchanged)
+                    return
+            await html_queue.put((url, html, fields, content))
+        elif fields is not None:
+            # Всё нашлось в JSON - стадия разбора HTML не нужна
+            stats['fetched'] += 1
+            await forward_parsed(fields)
+        else:
+            stats['failed'] += 1
+            CARS.inc(result='failed')
+            log_event(logging.WARNING, 'detail_fetch_failed', url=url)
+            if frontier is not None:
+                await frontier.mark_failed(url)
+        # Небольшая задержка между запросами одного воркера
+        if rate_controller is None:
+            await asyncio.sleep(REQUEST_DELAY)
+
+    async def parse_detail(item):
+        url, html, fields, content = item
+        parsed = merge_car_fields(fields, await parse_html(html, url))
+        await forward_parsed(parsed, content)
+
+    async def forward_parsed(parsed, content=None):
+        # Те же результаты, что и в режиме батчей: неизменившиеся поля - unchanged, а не parsed
+        unchanged = unchanged_fields(fingerprints, parsed, content)
+        if unchanged is not None:
+            CARS.inc(result='unchanged')
+            await car_queue.put(unchanged)
+        else:
+            stats['parsed'] += 1
+            CARS.inc(result='parsed')
+            await phone_queue.put(parsed)
+
+    async def lookup_phone(parsed):
+        await car_queue.put(await complete_car(session, parsed))
+
+    async def write_car(car):
+        await writer.add(car)
+
+    async def requeue_retries():
+        # Подошедшие по сроку повторы возвращаются в очередь загрузки
+        while True:
+            url = await retry_queue.pop_due()
+            await url_queue.put(url)
+
+    async def flush_periodically():
+        # Сброс по времени, даже если новые авто перестали поступать
+        while True:
+            await asyncio.sleep(writer.flush_interval)
+            await writer.flush_if_due()
+
+    stages = [
+        (url_queue, fetch_detail, DETAIL_WORKERS),
+        (html_queue, parse_detail, PARSE_WORKERS),
+        (phone_queue, lookup_phone, PHONE_WORKERS),
+        (car_queue, write_car, DB_WORKERS),
+    ]
+    workers = [
+        [asyncio.create_task(_stage_worker(queue, handler)) for _ in range(count)]
+        for queue, handler, count in stages
+    ]
+
+    workers.append([asyncio.create_task(flush_periodically())])
+    workers.append([asyncio.create_task(requeue_retries())])
+
+    queues = {'urls': url_queue, 'html': html_queue, 'phones': phone_queue, 'cars': car_queue}
+    for name, queue in queues.items():
+        QUEUE_DEPTH.set_function(queue.qsize, queue=name)
+
+    print("Запуск конвейера: выдача -> загрузка -> разбор -> телефоны -> БД")
+    try:
+        await produce_links()
+        await url_queue.join()
+        # Загрузка завершена, когда выданы все отложенные повторы и обработаны их результаты
+        while retry_queue:
+            await retry_queue.drained()
+            await url_queue.join()
+        # Дожидаемся опустошения стадий по порядку и останавливаем их воркеры
+        for (queue, _, _), stage_workers in zip(stages, workers):
+            await queue.join()
+            for task in stage_workers:
+                task.cancel()
+            await asyncio.gather(*stage_workers, return_exceptions=True)
+    finally:
+        for stage_workers in workers:
+            for task in stage_workers:
+                task.cancel()
+        await writer.flush()
+        for name in queues:
+            QUEUE_DEPTH.set_function(None, queue=name)
+
+    print(f'\n=== Парсинг завершён ===')
+    print(f"Найдено ссылок: {stats['found']}, загружено: {stats['fetched']}, "
+          f"разобрано: {stats['parsed']}, сохранено: {writer.inserted}, обновлено: {writer.updated}, "
+          f"без изменений: {writer.touched}, пропущено дублей: {writer.skipped}, "
+          f"перевыставлено: {writer.relisted}, ошибок: {stats['failed'] + writer.failed}")
+    if known is not None:
+        print(f'Инкрементальный режим: {known.summary()}')
+    if fingerprints is not None:
+        print(f'Отпечатки: {fingerprints.summary()}')
+
+async def scrape_distributed(session, known, frontier):
+    """Распределённый режим: выдача складывается в crawl_frontier, страницы авто
+    арендуют и обрабатывают воркеры (main.py --worker) в любом количестве"""
+    if frontier.discovery_done:
+        print("Выдача текущего запуска уже собрана, ссылки обрабатывают воркеры")
+        return
+    found = 0
+    queued = 0
+    if frontier.start_page == 1:
+        # Ссылки из dead_letters ставятся в очередь до выдачи; контрольная точка выдачи не сдвигается
+        queued += len(await frontier.add_page(0, await retries.load(), claim=False))
+    outcome = {}
+    async for page, new_links in iter_listing_pages(session, START_URL, frontier.start_page, outcome):
+        found += len(new_links)
+        urls = new_links
+        if known is not None:
+            urls = [url for url in urls if known.should_fetch(url)]
+        queued += len(await frontier.add_page(page, urls, claim=False))
+    if outcome['complete']:
+        await frontier.finish_discovery()
+    print(f"Найдено ссылок: {found}, поставлено в очередь воркеров: {queued}")
+    if known is not None:
+        print(f'Инкрементальный режим: {known.summary()}')
+
+def make_session():
+    """HTTP-транспорт (HTTP_TRANSPORT) с пулом соединений по лимитам одновременных запросов.
+
+    Пул вмещает все слоты семафора страниц (или максимальное окно контроллера скорости)
+    и API телефонов - иначе запросы сверх пула ждали бы соединения уже после семафора.
+    """
+    pages = rate_controller.max_concurrency if rate_controller is not None else MAX_CONCURRENT_REQUESTS
+    return make_transport(pages + PHONE_WORKERS, HEADERS)
+
+async def save_dead_letters():
+    """Сохранение ссылок, исчерпавших попытки; ошибка БД не должна прерывать завершение"""
+    try:
+        await retries.save()
+    except Exception as e:
+        print(f"Ошибка сохранения dead-letter: {e}")
 
 async def scrape_autoria():
-    """Основная функция парсинга с батчами для стабильности"""
+    """Основная функция парсинга: режим батчей, конвейера или распределённый (SCRAPE_MODE)"""
     print('Старт парсинга AutoRia...')
-    
-    # Настройки для aiohttp connector
-    connector = aiohttp.TCPConnector(
-        limit=MAX_CONCURRENT_REQUESTS,
-        limit_per_host=5,  # Максимум 5 соединений к одному хосту
-        ttl_dns_cache=300,
-        use_dns_cache=True,
-        keepalive_timeout=30,
-        enable_cleanup_closed=True
-    )
-    
-    timeout = aiohttp.ClientTimeout(total=60, connect=10)
-    
+    if http_cache is not None:
+        await asyncio.to_thread(http_cache.evict)
+
     try:
-        async with aiohttp.ClientSession(
-            connector=connector,
-            timeout=timeout,
-            headers=HEADERS
-        ) as session:
-            # Получаем все ссылки
-            print("Сбор ссылок на автомобили...")
-            links = await get_all_car_links(session, START_URL)
-            print(f'Найдено {len(links)} ссылок на авто')
-            
-            if not links:
-                print("Ссылки не найдены. Проверьте селекторы или сайт.")
-                return
-            
-            # Обрабатываем ссылки батчами для стабильности
-            batch_size = BATCH_SIZE  # Размер батча из .env
-            total_processed = 0
-            total_saved = 0
-            
-            for i in range(0, len(links), batch_size):
-                batch = links[i:i + batch_size]
-                batch_num = (i // batch_size) + 1
-                total_batches = (len(links) + batch_size - 1) // batch_size
-                
-                print(f"\n--- Обработка батча {batch_num}/{total_batches} ({len(batch)} ссылок) ---")
-                
-                try:
-                    # Создаем задачи для батча
-                    tasks = []
-                    for j in range(0, len(batch), MAX_CONCURRENT_REQUESTS):
-                        mini_batch = batch[j:j + MAX_CONCURRENT_REQUESTS]
-                        tasks.append(process_batch(session, mini_batch))
-                    
-                    # Выполняем задачи батча
-                    batch_results = await asyncio.gather(*tasks, return_exceptions=True)
-                    
-                    # Подсчитываем результаты
-                    for result in batch_results:
-                        if isinstance(result, list):
-                            total_saved += len(result)
-                        elif isinstance(result, Exception):
-                            print(f"Ошибка в батче: {result}")
-                    
-                    total_processed += len(batch)
-                    
-                    print(f"Батч {batch_num} завершен. Обработано: {total_processed}/{len(links)}, Сохранено: {total_saved}")
-                    
-                    # Задержка между батчами
-                    if i + batch_size < len(links):
-                        print("Пауза между батчами...")
-                        await asyncio.sleep(BATCH_DELAY)
-                        
-                except Exception as e:
-                    print(f"Ошибка обработки батча {batch_num}: {e}")
+        async with make_session() as session:
+            known = await load_known() if INCREMENTAL else None
+            # Распределённому режиму фронтир нужен всегда - это очередь задач воркеров
+            frontier = await Frontier.open() if FRONTIER or SCRAPE_MODE == 'distributed' else None
+            if SCRAPE_MODE == 'distributed':
+                await scrape_distributed(session, known, frontier)
+            else:
+                # Страницы загружают воркеры - им и нужны отпечатки
+                fingerprints = await load_fingerprint_index() if FINGERPRINT else None
+                if SCRAPE_MODE == 'pipeline':
+                    await scrape_pipeline(session, known, frontier, fingerprints)
+                else:
+                    await scrape_batches(session, known, frontier, fingerprints)
+            if frontier is not None and SCRAPE_MODE != 'distributed':
+                await frontier.close()
+
+    except Exception as e:
+        print(f"Критическая ошибка парсера: {e}")
+    finally:
+        await finish_run()
+
+async def finish_run():
+    """Завершение запуска: dead-letter и итоги по запросам"""
+    await save_dead_letters()
+    print(f"Телефоны: {phones.summary()}")
+    print(f"Повторы: {retries.summary()}")
+    print(f"HTTP: {transport.summary()}")
+    if rate_controller is not None:
+        print(f"Скорость: {rate_controller.summary()}")
+    if http_cache is not None:
+        print(f"Кэш HTTP: {http_cache.summary()}")
+
+async def scrape_fresh():
+    """Короткий проход по новым объявлениям (SCHEDULE_MODE=continuous).
+
+    Выдача FRESH_START_URL (от новых к старым) обходится, пока FRESH_STOP_PAGES страниц
+    подряд не окажутся целиком из объявлений, уже сохранённых в БД, но не дальше
+    FRESH_MAX_PAGES. Старые страницы перепроверяет полный обход (scrape_autoria).
+    """
+    started_at = freshness.start_pass()
+    writer = CarWriter()
+    lag_writer = freshness.wrap(writer)
+    stats = {'pages': 0, 'new': 0, 'parsed': 0}
+    complete = False
+    known_pages = 0
+    outcome = {}
+
+    try:
+        async with make_session() as session:
+            async for page, links in iter_listing_pages(session, FRESH_START_URL, 1, outcome, FRESH_MAX_PAGES):
+                stats['pages'] += 1
+                ids = [car_id for car_id in map(listing_id, links) if car_id is not None]
+                known = await run_db(select_known_ids, ids) if ids else set()
+                urls = [url for url in links if listing_id(url) not in known]
+                if not urls:
+                    known_pages += 1
+                    if known_pages >= FRESH_STOP_PAGES:
+                        complete = True
+                        break
                     continue
-            
-            print(f'\n=== Парсинг завершён ===')
-            print(f'Всего обработано: {total_processed} ссылок')
-            print(f'Успешно сохранено: {total_saved} автомобилей')
-            
+                known_pages = 0
+                stats['new'] += len(urls)
+                # Одновременность ограничивает общий семафор запросов
+                parsed = await asyncio.gather(*(process_batch(session, [url], lag_writer) for url in urls))
+                stats['parsed'] += sum(parsed)
+                await writer.flush_if_due()
+            else:
+                # Выдача закончилась раньше известных объявлений - проход тоже полный,
+                # а упор в FRESH_MAX_PAGES означает, что часть новых осталась за пределами
+                complete = outcome['complete'] and stats['pages'] < FRESH_MAX_PAGES
+    except Exception as e:
+        print(f"Ошибка короткого прохода: {e}")
+    finally:
+        await writer.flush()
+        await save_dead_letters()
+
+    elapsed = (datetime.now() - started_at).total_seconds()
+    print(f"Короткий проход: страниц {stats['pages']}, новых ссылок {stats['new']}, "
+          f"разобрано {stats['parsed']}, сохранено {writer.inserted} за {elapsed:.1f} с"
+          f"{'' if complete else ' (не дошёл до известных объявлений)'}; "
+          f"{freshness.finish_pass(started_at, complete)}")
+
+async def run_worker(until_done=False):
+    """Воркер распределённого режима: арендует ссылки из crawl_frontier и обрабатывает их.
+
+    WORKER_TASKS задач работают параллельно, каждая со своей пачкой ссылок. Без until_done
+    воркер ждёт новые запуски бесконечно (контейнер), с until_done - выходит, когда
+    текущий запуск полностью обработан.
+    """
+    print(f'Старт воркера {WORKER_ID}: задач {WORKER_TASKS}')
+    queue = WorkQueue()
+    writer = CarWriter(mark_done=True)
+    stats = {'leased': 0, 'parsed': 0}
+    # Отпечатки загружаются при старте: записанные позже объявления до перезапуска воркера считаются новыми
+    fingerprints = await load_fingerprint_index() if FINGERPRINT else None
+    await retries.watch()
+
+    async def work(session):
+        while True:
+            urls = await queue.lease()
+            if not urls:
+                # Буфер записи держит аренду незавершённой - сбрасываем перед проверкой
+                await writer.flush()
+                await save_dead_letters()
+                # Следующий запуск может начаться со ссылок из dead_letters
+                await retries.watch()
+                if until_done and await queue.finished():
+                    return
+                await asyncio.sleep(WORKER_POLL_INTERVAL)
+                continue
+            stats['leased'] += len(urls)
+            parsed = await process_batch(session, urls, writer, queue, fingerprints)
+            stats['parsed'] += parsed
+            await writer.flush_if_due()
+
+    start = time.monotonic()
+    try:
+        async with make_session() as session:
+            await asyncio.gather(*(work(session) for _ in range(WORKER_TASKS)))
+    finally:
+        await writer.flush()
+        await save_dead_letters()
+        elapsed = time.monotonic() - start
+        print(f"Воркер {WORKER_ID}: обработано ссылок {stats['leased']}, разобрано {stats['parsed']}, "
+              f"сохранено {writer.inserted}, обновлено {writer.updated}, без изменений {writer.touched}, "
+              f"ошибок записи {writer.failed} за {elapsed:.1f} с")
+        if fingerprints is not None:
+            print(f"Отпечатки: {fingerprints.summary()}")
+        print(f"Телефоны: {phones.summary()}")
+        print(f"Повторы: {retries.summary()}")
+        print(f"HTTP: {transport.summary()}")
+        if rate_controller is not None:
+            print(f"Скорость: {rate_controller.summary()}")
+
+async def discover(output=None):
+    """Стадия discover: только обход выдачи.
+
+    Ссылки записываются в файл output по одной на строку (вход стадии fetch-details)
+    или, без output, в очередь crawl_frontier для воркеров - как SCRAPE_MODE=distributed.
+    """
+    print('Сбор ссылок из выдачи...')
+    async with make_session() as session:
+        known = await load_known() if INCREMENTAL else None
+        if output is None:
+            await scrape_distributed(session, known, await Frontier.open())
+            return
+        found = written = 0
+        with open(output, 'w', encoding='utf-8') as f:
+            async for page, new_links in iter_listing_pages(session, START_URL):
+                found += len(new_links)
+                urls = new_links if known is None else [url for url in new_links if known.should_fetch(url)]
+                f.writelines(f'{url}\n' for url in urls)
+                # Прерванный обход оставляет в файле все ссылки пройденных страниц
+                f.flush()
+                written += len(urls)
+    print(f"Найдено ссылок: {found}, записано в {output}: {written}")
+    if known is not None:
+        print(f'Инкрементальный режим: {known.summary()}')
+
+async def iter_links_from(lines, known=None):
+    """Ссылки из файла стадии discover пачками по BATCH_SIZE: (прочитано, ссылки после фильтров).
+
+    Строки читаются в потоке: ожидание данных из канала (stdin) не блокирует загрузки.
+    """
+    batch = []
+    while True:
+        line = await asyncio.to_thread(lines.readline)
+        if not line:
+            break
+        url = line.strip()
+        # Остальные строки (сообщения discover при выводе в stdout) пропускаются
+        if url.startswith(('http://', 'https://')):
+            batch.append(url)
+        if len(batch) >= BATCH_SIZE:
+            yield len(batch), [url for url in batch if known is None or known.should_fetch(url)]
+            batch = []
+    if batch:
+        yield len(batch), [url for url in batch if known is None or known.should_fetch(url)]
+
+async def fetch_details(lines):
+    """Стадия fetch-details по списку ссылок (открытый файл или stdin): загрузка, разбор и запись в БД батчами"""
+    print('Загрузка страниц авто по списку ссылок...')
+    try:
+        async with make_session() as session:
+            known = await load_known() if INCREMENTAL else None
+            fingerprints = await load_fingerprint_index() if FINGERPRINT else None
+            await scrape_batches(session, known, None, fingerprints, links=iter_links_from(lines, known))
     except Exception as e:
         print(f"Критическая ошибка парсера: {e}")
     finally:
-        await connector.close()
+        await finish_run()
@@ -0,0 +1,197 @@
+import asyncio
+import importlib.util
+import os
+from collections import namedtuple
+import aiohttp
+from dotenv import load_dotenv
+from metrics import HTTP_BYTES
+
+load_dotenv()
+
+# Транспорт HTTP: aiohttp (HTTP/1.1, пул соединений) или http2 (httpx: запросы к хосту
+# мультиплексируются в одном соединении, нужен пакет httpx[http2])
+HTTP_TRANSPORT = os.getenv('HTTP_TRANSPORT', 'aiohttp')
+# HTTP/2 без TLS с первого запроса (h2c) - для локального тестового сервера
+HTTP2_PRIOR_KNOWLEDGE = os.getenv('HTTP2_PRIOR_KNOWLEDGE', '0') == '1'
+# Максимальный размер тела ответа после распаковки (МБ): больший ответ обрывается
+HTTP_MAX_BODY_MB = float(os.getenv('HTTP_MAX_BODY_MB', '10'))
+# Принимаемые сжатия; по умолчанию gzip и deflate, br - если установлен пакет brotli
+HTTP_ACCEPT_ENCODING = os.getenv('HTTP_ACCEPT_ENCODING', '') or ', '.join(
+    ['gzip', 'deflate']
+    + (['br'] if importlib.util.find_spec('brotli') or importlib.util.find_spec('brotlicffi') else [])
+)
+
+MAX_BODY_BYTES = int(HTTP_MAX_BODY_MB * 1024 * 1024)
+
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
+}
+
+# Таймауты запросов в секундах (connect=None - только общий)
+Timeout = namedtuple('Timeout', 'total connect')
+PAGE_TIMEOUT = Timeout(30, 10)
+API_TIMEOUT = Timeout(15, None)
+
+stats = {'requests': 0, 'bytes': 0, 'too_large': 0, 'encodings': {}}
+
+class TransportError(Exception):
+    """Сетевая ошибка или таймаут запроса (временная - запрос можно повторить)"""
+
+class BodyTooLarge(Exception):
+    """Тело ответа больше HTTP_MAX_BODY_MB - повтор не поможет"""
+
+class Response:
+    """Ответ с прочитанным телом; headers поддерживают get() без учёта регистра"""
+
+    __slots__ = ('status', 'headers', 'body', 'charset')
+
+    def __init__(self, status, headers, body, charset=None):
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.charset = charset
+
+    def text(self):
+        return self.body.decode(self.charset or 'utf-8', errors='replace')
+
+async def _read_body(headers, chunks, max_body):
+    """Потоковое чтение тела с ограничением размера (защищает и от «бомб» сжатия)"""
+    length = headers.get('Content-Length')
+    if length and length.isdigit() and int(length) > max_body:
+        raise BodyTooLarge(f'Content-Length {length}')
+    parts, size = [], 0
+    async for chunk in chunks:
+        size += len(chunk)
+        if size > max_body:
+            raise BodyTooLarge(f'больше {max_body} байт')
+        parts.append(chunk)
+    body = b''.join(parts)
+    encoding = headers.get('Content-Encoding') or 'identity'
+    stats['requests'] += 1
+    stats['bytes'] += len(body)
+    stats['encodings'][encoding] = stats['encodings'].get(encoding, 0) + 1
+    HTTP_BYTES.inc(len(body), encoding=encoding)
+    return body
+
+class Transport:
+    """Общее для транспортов: get(url, headers, timeout) -> Response.
+
+    Заголовки сессии и таймауты создаются один раз, а не на каждый запрос.
+    """
+
+    name = None
+
+    def __init__(self, max_body):
+        self.max_body = max_body
+        self._timeouts = {}
+
+    def _timeout(self, timeout):
+        converted = self._timeouts.get(timeout)
+        if converted is None:
+            converted = self._timeouts[timeout] = self._convert_timeout(timeout)
+        return converted
+
+    async def get(self, url, headers=None, timeout=PAGE_TIMEOUT):
+        try:
+            return await self._get(url, headers, timeout)
+        except BodyTooLarge:
+            stats['too_large'] += 1
+            raise
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+class AiohttpTransport(Transport):
+    """HTTP/1.1 через aiohttp: пул соединений под лимиты одновременных запросов"""
+
+    name = 'aiohttp'
+
+    def __init__(self, limit, headers, max_body=MAX_BODY_BYTES):
+        super().__init__(max_body)
+        connector = aiohttp.TCPConnector(
+            limit=limit,
+            # Все запросы идут к одному хосту: лимит на хост не должен быть меньше общего
+            limit_per_host=limit,
+            ttl_dns_cache=300,
+            use_dns_cache=True,
+            keepalive_timeout=30,
+            enable_cleanup_closed=True
+        )
+        self.session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=60, connect=10),
+            headers={**headers, 'Accept-Encoding': HTTP_ACCEPT_ENCODING},
+        )
+
+    def _convert_timeout(self, timeout):
+        return aiohttp.ClientTimeout(total=timeout.total, connect=timeout.connect)
+
+    async def _get(self, url, headers, timeout):
+        try:
+            async with self.session.get(url, headers=headers, timeout=self._timeout(timeout)) as resp:
+                body = await _read_body(resp.headers, resp.content.iter_any(), self.max_body)
+                return Response(resp.status, resp.headers, body, resp.charset)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise TransportError(repr(e)) from e
+
+    async def close(self):
+        await self.session.close()
+
+class Http2Transport(Transport):
+    """HTTP/2 через httpx: запросы к хосту мультиплексируются в одном соединении.
+
+    Общий таймаут (total) httpx не поддерживает - он ограничивается asyncio.timeout
+    вокруг запроса вместе с чтением тела.
+    """
+
+    name = 'http2'
+
+    def __init__(self, limit, headers, max_body=MAX_BODY_BYTES):
+        try:
+            import httpx
+        except ImportError as e:
+            raise RuntimeError('HTTP_TRANSPORT=http2 требует пакет httpx[http2]') from e
+
+        super().__init__(max_body)
+        self._httpx = httpx
+        self.session = httpx.AsyncClient(
+            http1=not HTTP2_PRIOR_KNOWLEDGE,
+            http2=True,
+            limits=httpx.Limits(max_connections=limit, max_keepalive_connections=limit, keepalive_expiry=30),
+            timeout=httpx.Timeout(60, connect=10),
+            headers={**headers, 'Accept-Encoding': HTTP_ACCEPT_ENCODING},
+            follow_redirects=True,
+        )
+
+    def _convert_timeout(self, timeout):
+        return self._httpx.Timeout(timeout.total, connect=timeout.connect)
+
+    async def _get(self, url, headers, timeout):
+        try:
+            async with asyncio.timeout(timeout.total):
+                async with self.session.stream('GET', url, headers=headers,
+                                               timeout=self._timeout(timeout)) as resp:
+                    body = await _read_body(resp.headers, resp.aiter_bytes(), self.max_body)
+                    return Response(resp.status_code, resp.headers, body, resp.charset_encoding)
+        except (self._httpx.HTTPError, asyncio.TimeoutError) as e:
+            raise TransportError(repr(e)) from e
+
+    async def close(self):
+        await self.session.aclose()
+
+TRANSPORTS = {'aiohttp': AiohttpTransport, 'http2': Http2Transport}
+
+def make_transport(limit, headers, name=None):
+    """Транспорт HTTP_TRANSPORT (или name) с пулом на limit одновременных запросов"""
+    name = name or HTTP_TRANSPORT
+    if name not in TRANSPORTS:
+        raise ValueError(f'Неизвестный HTTP_TRANSPORT: {name} (aiohttp или http2)')
+    return TRANSPORTS[name](limit, headers)
+
+def summary():
+    encodings = ', '.join(f'{name}: {count}' for name, count in sorted(stats['encodings'].items()))
+    return (f"{HTTP_TRANSPORT}, ответов: {stats['requests']} ({encodings or '-'}), "
+            f"получено {stats['bytes'] / 1024 / 1024:.1f} МБ, отброшено по размеру: {stats['too_large']}")